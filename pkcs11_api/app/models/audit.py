@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+from typing import List, Optional
+
+class AuditEventInfo(BaseModel):
+    id: int
+    timestamp: str
+    username: str
+    action: str   # create, delete, modify, wrap, unwrap
+    outcome: str  # success, failure
+    key_class: Optional[str] = None
+    key_type: Optional[str] = None
+    label: Optional[str] = None
+    key_id: Optional[str] = None
+    detail: Optional[str] = None
+
+class AuditLogResponse(BaseModel):
+    events: List[AuditEventInfo]
+    count: int
+    next_cursor: Optional[int] = None  # Pass as cursor to get the next (older) page
@@ -0,0 +1,50 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from enum import Enum
+
+class SignatureAlgorithm(str, Enum):
+    RSA_PKCS = "RSA_PKCS"  # PKCS#1 v1.5, the digest is wrapped in a DigestInfo
+    RSA_PSS = "RSA_PSS"
+    ECDSA = "ECDSA"
+
+class HashAlgorithm(str, Enum):
+    SHA256 = "SHA256"
+    SHA384 = "SHA384"
+    SHA512 = "SHA512"
+
+class SignBatchRequest(BaseModel):
+    label: str = Field(..., description="Label of the signing key")
+    algorithm: SignatureAlgorithm = Field(SignatureAlgorithm.RSA_PKCS, description="Signature algorithm")
+    hash_algorithm: HashAlgorithm = Field(HashAlgorithm.SHA256, description="Hash the digests were computed with")
+    digests: List[str] = Field(..., description="Base64 encoded digests to sign")
+
+class VerifyItem(BaseModel):
+    digest: str = Field(..., description="Base64 encoded digest")
+    signature: str = Field(..., description="Base64 encoded signature")
+
+class VerifyBatchRequest(BaseModel):
+    label: str = Field(..., description="Label of the verification key")
+    algorithm: SignatureAlgorithm = Field(SignatureAlgorithm.RSA_PKCS, description="Signature algorithm")
+    hash_algorithm: HashAlgorithm = Field(HashAlgorithm.SHA256, description="Hash the digests were computed with")
+    items: List[VerifyItem] = Field(..., description="Digest and signature pairs to verify")
+
+class SignResult(BaseModel):
+    index: int
+    signature: Optional[str] = None
+    error: Optional[str] = None
+
+class VerifyResult(BaseModel):
+    index: int
+    valid: bool = False
+    error: Optional[str] = None
+
+class SignBatchResponse(BaseModel):
+    results: List[SignResult]
+    signed: int
+    failed: int
+
+class VerifyBatchResponse(BaseModel):
+    results: List[VerifyResult]
+    valid: int
+    invalid: int
+    failed: int
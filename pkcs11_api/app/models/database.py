@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, create_engine
+from sqlalchemy import Column, String, DateTime, Integer, Index, create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime, timedelta
@@ -28,6 +28,47 @@ class UserSession(Base):
         """Check if session is expired"""
         return datetime.utcnow() > self.expiry
 
+class AuditEvent(Base):
+    __tablename__ = "audit_events"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    timestamp = Column(DateTime, nullable=False, index=True)
+    username = Column(String, nullable=False)
+    action = Column(String, nullable=False)   # create, delete, modify, wrap, unwrap
+    outcome = Column(String, nullable=False)  # success, failure
+    key_class = Column(String)
+    key_type = Column(String)
+    label = Column(String)
+    key_id = Column(String)
+    detail = Column(String)
+    
+    __table_args__ = (
+        Index("ix_audit_events_username_timestamp", "username", "timestamp"),
+    )
+
+class InventoryRecord(Base):
+    # Only what a listing shows; flag filters and key details always go to the HSM
+    __tablename__ = "inventory_snapshot"
+    
+    username = Column(String, primary_key=True)
+    fingerprint = Column(String, primary_key=True)  # Hex inventory feed fingerprint
+    key_class = Column(String, nullable=False)
+    key_type = Column(String, nullable=False)
+    label = Column(String)
+    key_id = Column(String)
+    curve = Column(String)
+
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_keys"
+    
+    username = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    operation = Column(String, nullable=False)    # create, delete, modify, unwrap
+    fingerprint = Column(String, nullable=False)  # SHA-256 of the request, to detect a reused key
+    status_code = Column(Integer, nullable=False)  # 0 while the first request is in flight, -1 once it raised
+    response = Column(String, nullable=False)     # JSON body returned to the first request, or its in-flight marker
+    created_at = Column(DateTime, nullable=False, index=True)
+
 # Database setup
 DATABASE_URL = "sqlite:///./cloudhsm_sessions.db"
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
@@ -12,11 +12,18 @@ class KeyType(str, Enum):
     RSA = "RSA"
     EC = "EC"
 
+class ECCurve(str, Enum):
+    P_256 = "P-256"
+    P_384 = "P-384"
+    P_521 = "P-521"
+    SECP256K1 = "secp256k1"
+
 class CreateKeyRequest(BaseModel):
     label: str = Field(..., description="Key label")
     key_class: KeyClass = Field(..., description="Key class")
     key_type: KeyType = Field(..., description="Key type")
     key_size: Optional[int] = Field(None, description="Key size in bits (RSA) or bytes (AES)")
+    curve: Optional[ECCurve] = Field(None, description="Named curve (EC), defaults to P-256")
     token: bool = Field(True, description="Store key on token")
     private: bool = Field(True, description="Key is private")
     sensitive: bool = Field(True, description="Key is sensitive")
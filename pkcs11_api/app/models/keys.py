@@ -1,31 +1,92 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class KeyInfo(BaseModel):
     key_class: str  # PUBLIC_KEY, PRIVATE_KEY, SECRET_KEY
     key_type: str   # RSA, AES, EC
     label: Optional[str] = None
     key_id: Optional[str] = None
+    curve: Optional[str] = None  # Named curve of EC keys
 
 class KeyListResponse(BaseModel):
     keys: List[KeyInfo]
     count: int
+    sync_token: Optional[str] = None  # Pass to /keys/changes to get only later changes
+    verified: bool = True  # False while served from the inventory persisted before a restart, until the HSM confirmed it
+
+class KeyChangesResponse(BaseModel):
+    added: List[KeyInfo]
+    removed: List[KeyInfo]
+    sync_token: str
+    reset: bool = False  # Token was unknown or expired; added holds the full inventory
 
 class KeySearchRequest(BaseModel):
     key_class: Optional[str] = None
     key_type: Optional[str] = None
     label: Optional[str] = None
     key_id: Optional[str] = None
+    key_size: Optional[int] = None  # Bytes for AES, bits for RSA, as in CreateKeyRequest
+    token: Optional[bool] = None
+    private: Optional[bool] = None
+    sensitive: Optional[bool] = None
+    extractable: Optional[bool] = None
+    local: Optional[bool] = None
+    modifiable: Optional[bool] = None
+    destroyable: Optional[bool] = None
+
+    def attribute_filters(self) -> Dict[str, bool]:
+        """Boolean attribute filters that were set, by KeyDetailResponse field name"""
+        names = ("token", "private", "sensitive", "extractable", "local", "modifiable", "destroyable")
+        return {name: getattr(self, name) for name in names if getattr(self, name) is not None}
+
+class WrapKeysRequest(KeySearchRequest):
+    wrapping_label: str  # AES key with CKA_WRAP the selected keys are wrapped under
+
+class ModifyKeysRequest(BaseModel):
+    selectors: List[KeySearchRequest]  # Keys matching any selector are modified
+    label: Optional[str] = None
+    key_id: Optional[str] = None  # Hex
+    encrypt: Optional[bool] = None
+    decrypt: Optional[bool] = None
+    sign: Optional[bool] = None
+    verify: Optional[bool] = None
+    wrap: Optional[bool] = None
+    unwrap: Optional[bool] = None
+
+    def attribute_changes(self) -> Dict[str, object]:
+        """Attributes to set, by field name"""
+        names = ("label", "key_id", "encrypt", "decrypt", "sign", "verify", "wrap", "unwrap")
+        return {name: getattr(self, name) for name in names if getattr(self, name) is not None}
+
+class ModifyKeyResult(BaseModel):
+    key: KeyInfo  # As it was before the change
+    modified: bool
+    error: Optional[str] = None
+
+class ModifyKeysResponse(BaseModel):
+    results: List[ModifyKeyResult]
+    matched: int
+    modified: int
+    failed: int
 
 class KeyDetailResponse(BaseModel):
     key_class: str
     key_type: str
     label: Optional[str] = None
     key_id: Optional[str] = None
+    curve: Optional[str] = None
     token: bool
     private: bool
     sensitive: bool
     extractable: bool
     local: bool
     modifiable: bool
-    destroyable: bool
\ No newline at end of file
+    destroyable: bool
+
+class KeyStatsResponse(BaseModel):
+    total: int
+    by_class: Dict[str, int]
+    by_type: Dict[str, int]
+    flags: Dict[str, int]  # Number of keys with each boolean attribute set
+    partition: Dict[str, Optional[int]]
+    computed_at: str
@@ -0,0 +1,77 @@
+import os
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.models.audit import AuditEventInfo, AuditLogResponse
+from app.models.database import AuditEvent, get_db
+from app.services.audit_log import audit_log
+from app.utils.auth_dependency import get_current_user
+
+router = APIRouter(prefix="/audit", tags=["audit"])
+
+# Users who may read every user's events; everyone else only sees their own
+AUDIT_ADMIN_USERS = {name.strip() for name in os.getenv("AUDIT_ADMIN_USERS", "").split(",") if name.strip()}
+
+@router.get("/", response_model=AuditLogResponse)
+@router.get("", response_model=AuditLogResponse)
+def list_audit_events(
+    start: Optional[datetime] = Query(None, description="Only events at or after this time (UTC)"),
+    end: Optional[datetime] = Query(None, description="Only events before this time (UTC)"),
+    username: Optional[str] = None,
+    action: Optional[str] = None,
+    label: Optional[str] = None,
+    cursor: Optional[int] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Key lifecycle events, newest first, paginated by cursor; only the caller's own unless they are an audit admin"""
+    if current_user.username not in AUDIT_ADMIN_USERS:
+        if username and username != current_user.username:
+            raise HTTPException(status_code=403, detail="Only audit admins can read other users' events")
+        username = current_user.username
+    
+    query = db.query(AuditEvent)
+    
+    # Time range filters use the timestamp indexes; ids grow with time so they page without OFFSET
+    if start:
+        query = query.filter(AuditEvent.timestamp >= start)
+    if end:
+        query = query.filter(AuditEvent.timestamp < end)
+    if username:
+        query = query.filter(AuditEvent.username == username)
+    if action:
+        query = query.filter(AuditEvent.action == action)
+    if label:
+        query = query.filter(AuditEvent.label == label)
+    if cursor is not None:
+        query = query.filter(AuditEvent.id < cursor)
+    
+    rows = query.order_by(AuditEvent.id.desc()).limit(limit + 1).all()
+    events = [
+        AuditEventInfo(
+            id=row.id,
+            timestamp=row.timestamp.isoformat(),
+            username=row.username,
+            action=row.action,
+            outcome=row.outcome,
+            key_class=row.key_class,
+            key_type=row.key_type,
+            label=row.label,
+            key_id=row.key_id,
+            detail=row.detail
+        )
+        for row in rows[:limit]
+    ]
+    
+    return AuditLogResponse(
+        events=events,
+        count=len(events),
+        next_cursor=events[-1].id if len(rows) > limit else None
+    )
+
+@router.get("/stats")
+async def audit_writer_stats(current_user = Depends(get_current_user)):
+    """Audit queue depth and writer counters"""
+    return audit_log.stats()
@@ -11,7 +11,7 @@ from app.utils.auth_dependency import get_current_user
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
 @router.post("/login", response_model=LoginResponse)
-async def login(login_request: LoginRequest, response: Response, db: Session = Depends(get_db)):
+def login(login_request: LoginRequest, response: Response, db: Session = Depends(get_db)):
     """Authenticate user with CloudHSM and create database session"""
     
     # Initialize CloudHSM service
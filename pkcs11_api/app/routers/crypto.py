@@ -0,0 +1,181 @@
+import os
+from typing import AsyncIterator
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from app.models.crypto_schemas import SignBatchRequest, SignBatchResponse, VerifyBatchRequest, VerifyBatchResponse
+from app.services.cloudhsm_service import CloudHSMService
+from app.services.random_pool import random_pool
+from app.services.stream_cipher import AES_BLOCK_SIZE, StreamCipher
+from app.utils.auth_dependency import get_current_user
+
+router = APIRouter(prefix="/crypto", tags=["crypto"])
+
+# Upper bound on digests per batch request
+MAX_BATCH_SIZE = int(os.getenv("CRYPTO_MAX_BATCH_SIZE", "10000"))
+
+# Bytes fed to the HSM per C_EncryptUpdate/C_DecryptUpdate call when streaming
+STREAM_CHUNK_SIZE = int(os.getenv("CRYPTO_STREAM_CHUNK_SIZE", str(1024 * 1024)))
+MAX_STREAM_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Upper bound on random bytes per request
+MAX_RANDOM_BYTES = int(os.getenv("CRYPTO_MAX_RANDOM_BYTES", "65536"))
+
+
+class _DuplexStreamingResponse(StreamingResponse):
+    """Streams output while the request body is still being read.
+
+    StreamingResponse listens for disconnects by calling receive(), which would
+    swallow the body messages the cipher stream is still reading.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        finally:
+            await self.body_iterator.aclose()
+        if self.background is not None:
+            await self.background()
+
+
+async def _rechunk(stream: AsyncIterator[bytes], size: int, first: int = None) -> AsyncIterator[bytes]:
+    """Regroup the request body into chunks of exactly size bytes (the first one first bytes), the last one shorter"""
+    buffer = bytearray()
+    want = first or size
+    async for data in stream:
+        buffer += data
+        while len(buffer) >= want:
+            yield bytes(buffer[:want])
+            del buffer[:want]
+            want = size
+    if buffer:
+        yield bytes(buffer)
+
+
+async def _cipher_stream(cipher: StreamCipher, chunks: AsyncIterator[bytes], header: bytes = b"") -> AsyncIterator[bytes]:
+    """Feed body chunks through the HSM one at a time, so only one chunk is in memory per direction"""
+    try:
+        if header:
+            yield header
+        async for chunk in chunks:
+            output = await run_in_threadpool(cipher.update, chunk)
+            if output:
+                yield output
+        output = await run_in_threadpool(cipher.final)
+        if output:
+            yield output
+    finally:
+        await run_in_threadpool(cipher.close)
+
+@router.post("/sign", response_model=SignBatchResponse)
+def sign(sign_request: SignBatchRequest, current_user = Depends(get_current_user)):
+    """Sign a batch of digests with one private key"""
+    if len(sign_request.digests) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} digests per request")
+    
+    # Initialize CloudHSM service
+    hsm_service = CloudHSMService()
+    
+    try:
+        result = hsm_service.sign_digests(current_user.username, current_user.password, sign_request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not result:
+        raise HTTPException(status_code=404, detail="Signing key not found")
+    
+    return result
+
+@router.post("/verify", response_model=VerifyBatchResponse)
+def verify(verify_request: VerifyBatchRequest, current_user = Depends(get_current_user)):
+    """Verify a batch of digest signatures with one public key"""
+    if len(verify_request.items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} signatures per request")
+    
+    # Initialize CloudHSM service
+    hsm_service = CloudHSMService()
+    
+    try:
+        result = hsm_service.verify_signatures(current_user.username, current_user.password, verify_request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not result:
+        raise HTTPException(status_code=404, detail="Verification key not found")
+    
+    return result
+
+@router.get("/random")
+def random_bytes(
+    length: int = Query(32, ge=1, le=MAX_RANDOM_BYTES),
+    current_user = Depends(get_current_user)
+):
+    """Random bytes from the HSM, served from the buffered pool when it holds enough"""
+    data = random_pool.take(current_user.username, current_user.password, length)
+    if data is None:
+        # Pool empty or disabled; this request goes to the HSM while the pool refills in the background
+        data = CloudHSMService().generate_random(current_user.username, current_user.password, length)
+    
+    return Response(content=data, media_type="application/octet-stream", headers={"Cache-Control": "no-store"})
+
+@router.get("/random/pool")
+async def random_pool_stats(current_user = Depends(get_current_user)):
+    """Random byte buffer level, hit rate and refill latency"""
+    return random_pool.stats()
+
+@router.post("/encrypt")
+async def encrypt(
+    request: Request,
+    label: str = Query(..., description="Label of an AES key with CKA_ENCRYPT"),
+    chunk_size: int = Query(STREAM_CHUNK_SIZE, ge=AES_BLOCK_SIZE, le=MAX_STREAM_CHUNK_SIZE),
+    current_user = Depends(get_current_user)
+):
+    """Stream-encrypt the request body with AES-CBC-PAD; the response is the 16 byte IV followed by the ciphertext"""
+    iv = os.urandom(AES_BLOCK_SIZE)
+    
+    # Initialize CloudHSM service
+    hsm_service = CloudHSMService()
+    
+    # Key lookup and session admission happen before any output, so errors still get a status code
+    try:
+        cipher = await run_in_threadpool(hsm_service.open_cipher, current_user.username, current_user.password, label, iv)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not cipher:
+        raise HTTPException(status_code=404, detail="Encryption key not found")
+    
+    return _DuplexStreamingResponse(
+        _cipher_stream(cipher, _rechunk(request.stream(), chunk_size), header=iv),
+        media_type="application/octet-stream"
+    )
+
+@router.post("/decrypt")
+async def decrypt(
+    request: Request,
+    label: str = Query(..., description="Label of an AES key with CKA_DECRYPT"),
+    chunk_size: int = Query(STREAM_CHUNK_SIZE, ge=AES_BLOCK_SIZE, le=MAX_STREAM_CHUNK_SIZE),
+    current_user = Depends(get_current_user)
+):
+    """Stream-decrypt a body produced by /crypto/encrypt (IV followed by ciphertext)"""
+    chunks = _rechunk(request.stream(), chunk_size, first=AES_BLOCK_SIZE)
+    try:
+        iv = await chunks.__anext__()
+    except StopAsyncIteration:
+        iv = b""
+    if len(iv) != AES_BLOCK_SIZE:
+        raise HTTPException(status_code=400, detail="Body must start with a 16 byte IV")
+    
+    # Initialize CloudHSM service
+    hsm_service = CloudHSMService()
+    
+    try:
+        cipher = await run_in_threadpool(hsm_service.open_cipher, current_user.username, current_user.password, label, iv, True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not cipher:
+        raise HTTPException(status_code=404, detail="Decryption key not found")
+    
+    # A padding or key error at the end can only abort the stream, as the status was already sent
+    return _DuplexStreamingResponse(_cipher_stream(cipher, chunks), media_type="application/octet-stream")
@@ -1,48 +1,67 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
 from pathlib import Path
-import subprocess
+from typing import Tuple
+import asyncio
 import os
 import json
+import tempfile
 from app.services.cloudhsm_service import CloudHSMService
+from app.services.admission_controller import admission_controller
+from app.services.circuit_breaker import circuit_breaker, CLOSED
+from app.services.key_handle_cache import key_handle_cache
+from app.services.public_key_cache import public_key_cache
+from app.services.slot_scheduler import slot_scheduler
 
 router = APIRouter(prefix="/hsm", tags=["hsm-config"])
 
+CUSTOMER_CA_PATH = "/opt/cloudhsm/etc/customerCA.crt"
+CONFIGURE_COMMAND_TIMEOUT = float(os.getenv("HSM_CONFIGURE_TIMEOUT", "60"))
+_configure_lock = asyncio.Lock()
+
 @router.get("/health")
-async def check_hsm_connection():
+def check_hsm_connection():
     """Check HSM connection status (unauthenticated)"""
     try:
         # Check if certificate exists
-        cert_exists = Path("/opt/cloudhsm/etc/customerCA.crt").exists()
+        cert_exists = Path(CUSTOMER_CA_PATH).exists()
         
-        # Check if IP address is configured in PCKS11 config
-        pkcs11_configured = False
+        # Check which IP addresses are configured in PCKS11 config
+        configured_servers = []
         pkcs11_config_file = Path("/opt/cloudhsm/etc/cloudhsm-pkcs11.cfg")
         if pkcs11_config_file.exists():
             with open(pkcs11_config_file, "r") as f:
                 config_json = json.loads(f.read())
-                cluster = config_json.get("clusters", [{}])[0]
-                for server in cluster.get('cluster', {}).get('servers', []):
-                    ip_address = server.get('hostname')
-                    host_enabled = server.get('enable', False)
-                    if ip_address and host_enabled:
-                        pkcs11_configured = True
-                        break
+                for cluster in config_json.get("clusters", []):
+                    for server in cluster.get('cluster', {}).get('servers', []):
+                        ip_address = server.get('hostname')
+                        host_enabled = server.get('enable', False)
+                        if ip_address and host_enabled:
+                            configured_servers.append(ip_address)
+        pkcs11_configured = bool(configured_servers)
         
         # check connection with PyKCS11
         hsm_service = CloudHSMService()
         session_connected = hsm_service.check_connection()
         
         
+        breaker = circuit_breaker.stats()
+        
         return {
             "connected": session_connected,
             "configured": pkcs11_configured,
-            "certificate_exists": cert_exists
+            "certificate_exists": cert_exists,
+            "servers": configured_servers,
+            "degraded": breaker["state"] != CLOSED,
+            "breaker": breaker
         }
     except Exception as e:
         return {
             "connected": False,
             "configured": False,
             "certificate_exists": False,
+            "degraded": circuit_breaker.state != CLOSED,
+            "breaker": circuit_breaker.stats(),
             "error": str(e)
         }
 
@@ -53,8 +72,11 @@ async def configure_hsm(
 ):
     """Configure HSM connection (unauthenticated)"""
     try:
+        # Accept one or more HSM IP addresses separated by commas or whitespace
+        ip_addresses = [ip for ip in ip_address.replace(",", " ").split() if ip]
+        
         # Validate IP address format
-        if not ip_address or len(ip_address.split('.')) != 4:
+        if not ip_addresses or any(len(ip.split('.')) != 4 for ip in ip_addresses):
             raise HTTPException(status_code=400, detail="Invalid IP address format")
         
         # Read certificate content
@@ -62,50 +84,54 @@ async def configure_hsm(
         if not cert_content:
             raise HTTPException(status_code=400, detail="Certificate file is empty")
         
-        # Write certificate to temp location first
-        temp_cert_path = "/tmp/customerCA.crt"
-        with open(temp_cert_path, "wb") as f:
-            f.write(cert_content)
-        
-        # Copy certificate to required location using sudo
-        copy_result = subprocess.run([
-            "sudo", "cp", temp_cert_path, "/opt/cloudhsm/etc/customerCA.crt"
-        ], capture_output=True, text=True)
-        
-        if copy_result.returncode != 0:
-            return {
-                "success": False,
-                "message": f"Failed to copy certificate: {copy_result.stderr}"
-            }
-        
-        # Set proper permissions using sudo
-        chmod_result = subprocess.run([
-            "sudo", "chmod", "644", "/opt/cloudhsm/etc/customerCA.crt"
-        ], capture_output=True, text=True)
-        
-        if chmod_result.returncode != 0:
-            return {
-                "success": False,
-                "message": f"Failed to set permissions: {chmod_result.stderr}"
-            }
-        
-        # Clean up temp file
-        os.remove(temp_cert_path)
-        
-        # Configure PKCS11 with IP address
-        config_result = subprocess.run([
-            "sudo", "/opt/cloudhsm/bin/configure-pkcs11", "-a", ip_address
-        ], capture_output=True, text=True)
-        
-        if config_result.returncode != 0:
-            return {
-                "success": False,
-                "message": f"PKCS11 configuration failed: {config_result.stderr}"
-            }
+        # One reconfiguration at a time; a concurrent request waits for this one to finish
+        async with _configure_lock:
+            # Write certificate to a temp file of its own first
+            fd, temp_cert_path = tempfile.mkstemp(prefix="customerCA-", suffix=".crt")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(cert_content)
+                
+                # Copy certificate to required location using sudo
+                returncode, stderr = await _run("sudo", "cp", temp_cert_path, CUSTOMER_CA_PATH)
+                if returncode != 0:
+                    return {
+                        "success": False,
+                        "message": f"Failed to copy certificate: {stderr}"
+                    }
+            finally:
+                # Clean up temp file
+                os.remove(temp_cert_path)
+            
+            # Set proper permissions using sudo
+            returncode, stderr = await _run("sudo", "chmod", "644", CUSTOMER_CA_PATH)
+            if returncode != 0:
+                return {
+                    "success": False,
+                    "message": f"Failed to set permissions: {stderr}"
+                }
+            
+            # Configure PKCS11 with all IP addresses
+            returncode, stderr = await _run("sudo", "/opt/cloudhsm/bin/configure-pkcs11", "-a", *ip_addresses)
+            if returncode != 0:
+                return {
+                    "success": False,
+                    "message": f"PKCS11 configuration failed: {stderr}"
+                }
+            
+            # Re-initialize the library so the new configuration is picked up without a restart;
+            # that needs every open session closed first, handles from the old library are void
+            if not await run_in_threadpool(slot_scheduler.reload):
+                raise HTTPException(status_code=409, detail="HSM sessions still in use; configuration written but "
+                                                            "not loaded yet, retry once running requests finished")
+            key_handle_cache.clear()
+            public_key_cache.clear()
+            
+            # Test the connection against the freshly enumerated slots, regardless of the old breaker state
+            test_result = await run_in_threadpool(CloudHSMService().probe_connection)
         
-        # Test the connection
-        test_result = CloudHSMService().check_connection()
         if test_result:
+            circuit_breaker.close()
             return {
                 "success": True,
                 "message": "HSM configured and connected successfully"
@@ -116,10 +142,12 @@ async def configure_hsm(
                 "message": f"HSM configuration completed but connection test failed"
             }
             
-    except subprocess.TimeoutExpired:
+    except HTTPException:
+        raise
+    except asyncio.TimeoutError:
         return {
             "success": False,
-            "message": "Connection test timed out. Check IP address and network connectivity."
+            "message": "Configuration command timed out"
         }
     except Exception as e:
         return {
@@ -127,8 +155,19 @@ async def configure_hsm(
             "message": f"Configuration failed: {str(e)}"
         }
 
+async def _run(*command) -> Tuple[int, str]:
+    """Run a command without blocking the event loop; returns its exit code and stderr"""
+    process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    try:
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout=CONFIGURE_COMMAND_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise
+    return process.returncode, stderr.decode(errors="replace")
+
 @router.post("/test-connection")
-async def test_hsm_connection():
+def test_hsm_connection():
     """Test current HSM connection (unauthenticated)"""
     try:
         pkcs11_connected = CloudHSMService().check_connection()
@@ -143,13 +182,18 @@ async def test_hsm_connection():
                 "success": False,
                 "message": f"HSM connection failed"
             }
-    except subprocess.TimeoutExpired:
-        return {
-            "success": False,
-            "message": "Connection test timed out"
-        }
     except Exception as e:
         return {
             "success": False,
             "message": f"Connection test failed: {str(e)}"
-        }
\ No newline at end of file
+        }
+
+@router.get("/slots")
+async def hsm_slot_stats():
+    """Per-slot throughput and latency (unauthenticated)"""
+    return {"slots": slot_scheduler.stats()}
+
+@router.get("/admission")
+async def hsm_admission_stats():
+    """Session admission counters and queue depths (unauthenticated)"""
+    return admission_controller.stats()
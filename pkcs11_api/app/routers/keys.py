@@ -1,18 +1,55 @@
-from fastapi import APIRouter, Depends, HTTPException
+import csv
+import hashlib
+import io
+import itertools
+import json
+import os
+import tempfile
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
 from app.models.database import get_db
-from app.models.keys import KeyListResponse, KeySearchRequest, KeyDetailResponse
+from app.models.keys import (KeyListResponse, KeyChangesResponse, KeySearchRequest, KeyDetailResponse, KeyStatsResponse,
+                             WrapKeysRequest, ModifyKeysRequest, ModifyKeysResponse)
 from app.models.key_schemas import CreateKeyRequest, CreateKeyResponse, DeleteKeyRequest, DeleteKeyResponse
-from app.services.cloudhsm_service import CloudHSMService
+from app.services.bulk_jobs import bulk_jobs
+from app.services.cloudhsm_service import CloudHSMService, ARCHIVE_FORMAT, ARCHIVE_VERSION
+from app.services.errors import IdempotencyKeyReusedError
+from app.services.idempotency import idempotency_store, fingerprint, MAX_KEY_LENGTH
+from app.services.inventory_feed import inventory_feed
+from app.services.inventory_snapshot import inventory_snapshot
+from app.services.key_handle_cache import key_handle_cache
+from app.services.label_index import label_index
+from app.services.key_pool_service import key_pool
+from app.services.key_records import key_infos
+from app.services.public_key_cache import public_key_cache
 from app.utils.auth_dependency import get_current_user
 
 router = APIRouter(prefix="/keys", tags=["keys"])
 
+# Public key exports may be cached by clients this long; a key ID only changes hands after a delete
+PUBLIC_KEY_MAX_AGE = int(os.getenv("PUBLIC_KEY_MAX_AGE", "86400"))
+PUBLIC_KEY_MEDIA_TYPES = {
+    "pem": "application/x-pem-file",
+    "der": "application/pkix-spki",
+    "jwk": "application/jwk+json"
+}
+
 @router.get("/", response_model=KeyListResponse)
 @router.get("", response_model=KeyListResponse)
-async def list_keys(current_user = Depends(get_current_user), db: Session = Depends(get_db)):
+def list_keys(current_user = Depends(get_current_user), db: Session = Depends(get_db)):
     """List all keys in CloudHSM"""
     
+    # After a restart, answer from the persisted inventory while the HSM is enumerated in the background;
+    # clients pick up any difference through /keys/changes
+    restored = inventory_feed.unverified_keys(current_user.username)
+    if restored:
+        inventory_feed.revalidate(current_user.username, current_user.password)
+        keys, sync_token = restored
+        return KeyListResponse(keys=key_infos(keys), count=len(keys), sync_token=sync_token, verified=False)
+    
     # Initialize CloudHSM service
     hsm_service = CloudHSMService()
     
@@ -20,26 +57,49 @@ async def list_keys(current_user = Depends(get_current_user), db: Session = Depe
     keys = hsm_service.list_keys(current_user.username, current_user.password)
     
     return KeyListResponse(
-        keys=keys,
-        count=len(keys)
+        keys=key_infos(keys),
+        count=len(keys),
+        sync_token=hsm_service.sync_token
     )
 
+@router.get("/changes", response_model=KeyChangesResponse)
+def key_changes(since: Optional[str] = None, current_user = Depends(get_current_user)):
+    """Keys added and removed since a previous sync token"""
+    
+    delta = inventory_feed.changes_since(current_user.username, since) if since else None
+    if delta:
+        added, removed, sync_token = delta
+        return KeyChangesResponse(added=key_infos(added), removed=key_infos(removed), sync_token=sync_token)
+    
+    # Unknown or expired token, fall back to a full listing
+    hsm_service = CloudHSMService()
+    keys = hsm_service.list_keys(current_user.username, current_user.password)
+    if not hsm_service.sync_token:
+        raise HTTPException(status_code=502, detail="Could not enumerate keys for a full resync")
+    
+    return KeyChangesResponse(added=key_infos(keys), removed=[], sync_token=hsm_service.sync_token, reset=True)
+
 @router.post("/", response_model=KeyListResponse)
-async def filter_keys(search_request: KeySearchRequest, current_user = Depends(get_current_user), db: Session = Depends(get_db)):
+def filter_keys(search_request: KeySearchRequest, current_user = Depends(get_current_user), db: Session = Depends(get_db)):
     """Filter keys and return KeyInfo list for client-side filtering"""
     
     # Initialize CloudHSM service
     hsm_service = CloudHSMService()
     
     # Filter keys using search criteria
-    keys = hsm_service.filter_keys(
-        current_user.username, 
-        current_user.password,
-        search_request.key_class,
-        search_request.key_type,
-        search_request.label,
-        search_request.key_id
-    )
+    try:
+        keys = hsm_service.filter_keys(
+            current_user.username, 
+            current_user.password,
+            search_request.key_class,
+            search_request.key_type,
+            search_request.label,
+            search_request.key_id,
+            search_request.key_size,
+            search_request.attribute_filters()
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return KeyListResponse(
         keys=keys,
@@ -47,21 +107,26 @@ async def filter_keys(search_request: KeySearchRequest, current_user = Depends(g
     )
 
 @router.post("/find", response_model=KeyDetailResponse)
-async def find_key(search_request: KeySearchRequest, current_user = Depends(get_current_user), db: Session = Depends(get_db)):
+def find_key(search_request: KeySearchRequest, current_user = Depends(get_current_user), db: Session = Depends(get_db)):
     """Find specific key with detailed attributes"""
     
     # Initialize CloudHSM service
     hsm_service = CloudHSMService()
     
     # Find key using filters
-    key_detail = hsm_service.find_key(
-        current_user.username, 
-        current_user.password,
-        search_request.key_class,
-        search_request.key_type,
-        search_request.label,
-        search_request.key_id
-    )
+    try:
+        key_detail = hsm_service.find_key(
+            current_user.username, 
+            current_user.password,
+            search_request.key_class,
+            search_request.key_type,
+            search_request.label,
+            search_request.key_id,
+            search_request.key_size,
+            search_request.attribute_filters()
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     if not key_detail:
         raise HTTPException(status_code=404, detail="Key not found")
@@ -69,39 +134,380 @@ async def find_key(search_request: KeySearchRequest, current_user = Depends(get_
     return key_detail
 
 @router.post("/create", response_model=CreateKeyResponse)
-async def create_key(create_request: CreateKeyRequest, current_user = Depends(get_current_user), db: Session = Depends(get_db)):
+def create_key(
+    create_request: CreateKeyRequest,
+    idempotency_key: Optional[str] = Header(None, description="Retries with the same key return the first outcome instead of generating again"),
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     """Create a new key in CloudHSM"""
     
+    # Keys created under an Idempotency-Key get a CKA_ID chosen up front and kept with the in-flight
+    # marker, so a retry can tell the key its attempt generated from any other key with the label
+    marker = {"key_id": os.urandom(16).hex()} if idempotency_key else {}
+    
+    def create():
+        # Initialize CloudHSM service
+        hsm_service = CloudHSMService()
+        
+        # Create key
+        result = hsm_service.create_key(
+            current_user.username,
+            current_user.password,
+            create_request,
+            bytes.fromhex(marker["key_id"]) if marker.get("key_id") else None
+        )
+        
+        if not result.success:
+            return 400, {"detail": result.message}
+        return 200, result.model_dump()
+    
+    def recover():
+        # An earlier attempt with this key may have generated the key before it failed or timed out
+        if not marker.get("key_id"):
+            return None
+        result = CloudHSMService().recover_created_key(current_user.username, current_user.password, create_request,
+                                                       bytes.fromhex(marker["key_id"]))
+        return (200, result.model_dump()) if result else None
+    
+    return _idempotent(current_user, idempotency_key, "create", create_request.model_dump(), create, recover, marker)
+
+@router.post("/delete", response_model=DeleteKeyResponse)
+def delete_key(
+    delete_request: DeleteKeyRequest,
+    idempotency_key: Optional[str] = Header(None, description="Retries with the same key return the first outcome"),
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Delete key(s) from CloudHSM"""
+    
+    def delete():
+        # Initialize CloudHSM service
+        hsm_service = CloudHSMService()
+        
+        # Delete key
+        result = hsm_service.delete_key(
+            current_user.username,
+            current_user.password,
+            delete_request
+        )
+        
+        if not result.success:
+            return 400, {"detail": result.message}
+        return 200, result.model_dump()
+    
+    return _idempotent(current_user, idempotency_key, "delete", delete_request.model_dump(), delete)
+
+@router.post("/modify", response_model=ModifyKeysResponse)
+def modify_keys(
+    modify_request: ModifyKeysRequest,
+    idempotency_key: Optional[str] = Header(None, description="Retries with the same key return the first outcome instead of modifying again"),
+    current_user = Depends(get_current_user)
+):
+    """Relabel, re-ID or change usage flags of every key matching the selectors, with a result per key"""
+    
+    def modify():
+        # Initialize CloudHSM service
+        hsm_service = CloudHSMService()
+        
+        try:
+            result = hsm_service.modify_keys(current_user.username, current_user.password, modify_request)
+        except ValueError as e:
+            return 400, {"detail": str(e)}
+        return 200, result.model_dump()
+    
+    return _idempotent(current_user, idempotency_key, "modify", modify_request.model_dump(), modify)
+
+def _idempotent(current_user, idempotency_key: Optional[str], operation: str, payload, action, recover=None, marker=None):
+    """Run a (status_code, body) action at most once per Idempotency-Key and turn its outcome into a response
+
+    recover returns the outcome of an earlier attempt that was interrupted, or None to run action again;
+    marker is kept with the in-flight key and holds what the interrupted attempt used once recover runs.
+    """
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+    
+    try:
+        status_code, body, replayed = idempotency_store.execute(
+            current_user.username, idempotency_key, operation, fingerprint(operation, payload), action, recover, marker
+        )
+    except IdempotencyKeyReusedError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    if status_code >= 400:
+        raise HTTPException(status_code=status_code, detail=body.get("detail"), headers=headers)
+    return JSONResponse(status_code=status_code, content=body, headers=headers)
+
+@router.get("/public/{key_id}")
+def public_key(
+    key_id: str,
+    request: Request,
+    format: Literal["pem", "der", "jwk"] = Query("pem", description="Output format"),
+    current_user = Depends(get_current_user)
+):
+    """Public key of an RSA or EC key pair by key ID, with a strong ETag for conditional requests"""
+    
+    try:
+        bytes.fromhex(key_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Key ID must be hex")
+    
     # Initialize CloudHSM service
     hsm_service = CloudHSMService()
     
-    # Create key
-    result = hsm_service.create_key(
-        current_user.username,
-        current_user.password,
-        create_request
+    material = hsm_service.public_key(current_user.username, current_user.password, key_id)
+    if not material:
+        raise HTTPException(status_code=404, detail="Public key not found")
+    if format == "jwk" and not material.jwk:
+        raise HTTPException(status_code=400, detail="Key cannot be represented as a JWK")
+    
+    etag = material.etag(format)
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={PUBLIC_KEY_MAX_AGE}, immutable"}
+    
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    if format == "der":
+        content = material.spki
+    elif format == "jwk":
+        content = json.dumps(material.jwk)
+    else:
+        content = material.pem
+    
+    return Response(content=content, media_type=PUBLIC_KEY_MEDIA_TYPES[format], headers=headers)
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses the weak comparison, so W/ prefixes are ignored"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+@router.get("/stats", response_model=KeyStatsResponse)
+def key_stats(current_user = Depends(get_current_user)):
+    """Key counts by class, type and boolean flag, plus partition usage"""
+    
+    # Initialize CloudHSM service
+    hsm_service = CloudHSMService()
+    
+    return hsm_service.key_stats(current_user.username, current_user.password)
+
+@router.get("/search", response_model=KeyListResponse)
+def search_keys(
+    prefix: Optional[str] = Query(None, description="Label starts with"),
+    contains: Optional[str] = Query(None, description="Label contains"),
+    glob: Optional[str] = Query(None, description="Label matches shell-style pattern, e.g. payments-*-v?"),
+    id_prefix: Optional[str] = Query(None, description="Key ID (hex) starts with"),
+    key_class: Optional[str] = None,
+    key_type: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    current_user = Depends(get_current_user)
+):
+    """Search keys by label or ID pattern, case-insensitively, from the in-memory index"""
+    
+    _ensure_label_index(current_user)
+    
+    keys = label_index.search(current_user.username, prefix, contains, glob, id_prefix, key_class, key_type, limit)
+    
+    return KeyListResponse(
+        keys=key_infos(keys),
+        count=len(keys)
     )
+
+@router.get("/typeahead")
+def typeahead(q: str = Query("", description="Label prefix typed so far"), limit: int = Query(10, ge=1, le=100), current_user = Depends(get_current_user)):
+    """Label suggestions for a prefix, served from the in-memory index"""
     
-    if not result.success:
-        raise HTTPException(status_code=400, detail=result.message)
+    _ensure_label_index(current_user)
     
-    return result
+    return {"suggestions": label_index.typeahead(current_user.username, q, limit) or []}
 
-@router.post("/delete", response_model=DeleteKeyResponse)
-async def delete_key(delete_request: DeleteKeyRequest, current_user = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Delete key(s) from CloudHSM"""
+def _ensure_label_index(current_user):
+    """Build the user's label index with a full enumeration the first time it is needed
+
+    An index seeded from the persisted inventory is enumerated again first, so searches never
+    answer from keys the HSM has not confirmed since the restart.
+    """
+    if not label_index.has_user(current_user.username) or inventory_feed.is_unverified(current_user.username):
+        CloudHSMService().list_keys(current_user.username, current_user.password)
+
+@router.get("/export")
+def export_keys(
+    format: Literal["csv", "jsonl"] = Query("jsonl", description="Output format"),
+    search: KeySearchRequest = Depends(),
+    cursor: Optional[int] = Query(None, description="Resume after the row with this cursor"),
+    current_user = Depends(get_current_user)
+):
+    """Stream every matching key with its full attribute set as CSV or JSONL; takes the same filters as POST /keys"""
     
     # Initialize CloudHSM service
     hsm_service = CloudHSMService()
     
-    # Delete key
-    result = hsm_service.delete_key(
+    rows = hsm_service.export_keys(
         current_user.username,
         current_user.password,
-        delete_request
+        search.key_class,
+        search.key_type,
+        search.label,
+        search.key_id,
+        search.key_size,
+        search.attribute_filters(),
+        cursor
     )
     
-    if not result.success:
-        raise HTTPException(status_code=400, detail=result.message)
+    # Pull the first row here so session, admission and filter errors still map to a status code
+    try:
+        first = next(rows, None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rows = itertools.chain([first], rows) if first else iter(())
+    
+    if format == "csv":
+        return StreamingResponse(_csv_lines(rows), media_type="text/csv",
+                                 headers={"Content-Disposition": "attachment; filename=keys.csv"})
+    
+    return StreamingResponse((json.dumps(row) + "\n" for row in rows), media_type="application/x-ndjson",
+                             headers={"Content-Disposition": "attachment; filename=keys.jsonl"})
+
+@router.post("/wrap")
+def wrap_keys(wrap_request: WrapKeysRequest, current_user = Depends(get_current_user)):
+    """Stream the matching keys as a JSONL archive, wrapped under an AES key, for migration to another partition"""
+    
+    # Initialize CloudHSM service
+    hsm_service = CloudHSMService()
+    
+    # Check the wrapping key before there is a job to report on
+    if not hsm_service.has_wrapping_key(current_user.username, current_user.password, wrap_request.wrapping_label):
+        raise HTTPException(status_code=404, detail="Wrapping key not found")
     
-    return result
\ No newline at end of file
+    job = bulk_jobs.create("wrap", current_user.username)
+    lines = hsm_service.wrap_keys(current_user.username, current_user.password, wrap_request.wrapping_label, wrap_request, job)
+    
+    # The archive header comes first; without one the wrapping key was deleted in the meantime
+    try:
+        first = next(lines, None)
+    except ValueError as e:
+        job.finish(str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+    if first is None:
+        job.finish("Wrapping key not found")
+        raise HTTPException(status_code=404, detail="Wrapping key not found")
+    
+    return StreamingResponse(itertools.chain([first], lines), media_type="application/x-ndjson",
+                             headers={"Content-Disposition": "attachment; filename=keys-archive.jsonl", "X-Job-Id": job.job_id})
+
+@router.post("/unwrap", status_code=202)
+async def unwrap_keys(
+    request: Request,
+    wrapping_label: str = Query(..., description="AES key with CKA_UNWRAP the archive was wrapped under"),
+    idempotency_key: Optional[str] = Header(None, description="Retries with the same key return the first job instead of starting another"),
+    current_user = Depends(get_current_user)
+):
+    """Start restoring a key archive from /keys/wrap; poll /keys/jobs/{job_id} for progress"""
+    
+    # Spool the archive so a large upload does not sit in memory; the job reads its entries from the spool
+    digest = hashlib.sha256(wrapping_label.encode() + b"\0")
+    archive = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    handed_over = False
+    try:
+        async for chunk in request.stream():
+            archive.write(chunk)
+            digest.update(chunk)
+        archive.seek(0)
+        
+        # Validate every line up front so a broken archive is still a 400, but keep none of them
+        try:
+            header = json.loads(archive.readline() or "null")
+            if not isinstance(header, dict) or header.get("format") != ARCHIVE_FORMAT or header.get("version") != ARCHIVE_VERSION:
+                raise ValueError("Not a key archive")
+            total = 0
+            for line in archive:
+                if line.strip():
+                    json.loads(line)
+                    total += 1
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid key archive: {e}")
+        
+        def start():
+            nonlocal handed_over
+            # Initialize CloudHSM service
+            hsm_service = CloudHSMService()
+            
+            if not hsm_service.has_wrapping_key(current_user.username, current_user.password, wrapping_label, True):
+                return 404, {"detail": "Unwrapping key not found"}
+            
+            job = bulk_jobs.create("unwrap", current_user.username)
+            bulk_jobs.run(job, _unwrap_archive, current_user, wrapping_label, archive, total)
+            handed_over = True
+            return 202, {"job_id": job.job_id, "total": total}
+        
+        return await run_in_threadpool(_idempotent, current_user, idempotency_key, "unwrap", digest.digest(), start)
+    finally:
+        if not handed_over:
+            archive.close()
+
+def _unwrap_archive(current_user, wrapping_label: str, archive, total: int, job):
+    """Background part of /keys/unwrap: unwrap the spooled archive's entries as they are read, then drop the spool"""
+    def entries():
+        archive.seek(0)
+        archive.readline()  # Header
+        for line in archive:
+            if line.strip():
+                yield json.loads(line)
+    
+    try:
+        CloudHSMService().unwrap_keys(current_user.username, current_user.password, wrapping_label, entries(), total, job)
+    finally:
+        archive.close()
+
+@router.get("/jobs/{job_id}")
+async def bulk_job_status(job_id: str, current_user = Depends(get_current_user)):
+    """Progress and throughput of a wrap or unwrap job"""
+    job = bulk_jobs.get(job_id, current_user.username)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+EXPORT_COLUMNS = [
+    "cursor", "key_class", "key_type", "label", "key_id", "key_size", "token", "private",
+    "sensitive", "extractable", "local", "modifiable", "destroyable"
+]
+
+def _csv_lines(rows):
+    """Format export rows as CSV one line at a time"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@router.get("/pool")
+async def key_pool_stats(current_user = Depends(get_current_user)):
+    """Pre-generated RSA key pool levels, refill rate and hit rate"""
+    return key_pool.stats(current_user.username)
+
+@router.get("/snapshot")
+async def inventory_snapshot_stats(current_user = Depends(get_current_user)):
+    """Persisted inventory: keys restored at startup, load time and changes waiting to be written"""
+    return inventory_snapshot.stats()
+
+@router.get("/idempotency")
+async def idempotency_stats(current_user = Depends(get_current_user)):
+    """Idempotency-Key replays and requests waiting on an in-flight original"""
+    return idempotency_store.stats()
+
+@router.get("/cache")
+async def key_handle_cache_stats(current_user = Depends(get_current_user)):
+    """Label/ID to handle cache size and hit rate"""
+    return key_handle_cache.stats()
+
+@router.get("/public-cache")
+async def public_key_cache_stats(current_user = Depends(get_current_user)):
+    """Public key export cache size and hit rate"""
+    return public_key_cache.stats()
@@ -0,0 +1,124 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from app.services.errors import AdmissionTimeoutError
+
+# Priority classes, lower value is served first
+INTERACTIVE = 0
+BULK = 1
+
+
+class _Ticket:
+    __slots__ = ("username", "priority", "granted")
+
+    def __init__(self, username: str, priority: int):
+        self.username = username
+        self.priority = priority
+        self.granted = False
+
+
+class AdmissionController:
+    """Bounds concurrent PKCS#11 sessions and queues the rest fairly per user"""
+
+    def __init__(self):
+        self.max_sessions = int(os.getenv("HSM_MAX_SESSIONS", "32"))
+        # Permits bulk jobs can never take, so interactive reads always get through
+        self.interactive_reserved = int(os.getenv("HSM_INTERACTIVE_RESERVED", "4"))
+        self.deadlines = {
+            INTERACTIVE: float(os.getenv("HSM_QUEUE_DEADLINE_INTERACTIVE", "5")),
+            BULK: float(os.getenv("HSM_QUEUE_DEADLINE_BULK", "60")),
+        }
+
+        self._cond = threading.Condition()
+        self._active = 0
+        # priority -> username -> waiting tickets, users served round-robin
+        self._queues = {INTERACTIVE: OrderedDict(), BULK: OrderedDict()}
+        self._hold_time = 0.1  # moving average of seconds a session is held
+        self._admitted = 0
+        self._rejected = 0
+
+    def _limit(self, priority: int) -> int:
+        if priority == INTERACTIVE:
+            return self.max_sessions
+        return max(self.max_sessions - self.interactive_reserved, 1)
+
+    def _queued(self) -> int:
+        return sum(len(tickets) for queue in self._queues.values() for tickets in queue.values())
+
+    def _dispatch(self):
+        """Grant free permits to waiting tickets, highest priority and least recently served user first"""
+        for priority in (INTERACTIVE, BULK):
+            queue = self._queues[priority]
+            while queue and self._active < self._limit(priority):
+                username, tickets = next(iter(queue.items()))
+                ticket = tickets.popleft()
+                if tickets:
+                    queue.move_to_end(username)
+                else:
+                    del queue[username]
+                ticket.granted = True
+                self._active += 1
+        self._cond.notify_all()
+
+    def _retry_after(self) -> int:
+        return math.ceil(self._hold_time * (self._queued() + 1) / self.max_sessions)
+
+    def acquire(self, username: str, priority: int = INTERACTIVE, deadline: float = None):
+        """Block until a session permit is granted or the queue deadline passes"""
+        deadline = self.deadlines[priority] if deadline is None else deadline
+        ticket = _Ticket(username or "", priority)
+
+        with self._cond:
+            self._queues[priority].setdefault(ticket.username, deque()).append(ticket)
+            self._dispatch()
+
+            expires = time.monotonic() + deadline
+            while not ticket.granted:
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    tickets = self._queues[priority].get(ticket.username)
+                    tickets.remove(ticket)
+                    if not tickets:
+                        del self._queues[priority][ticket.username]
+                    self._rejected += 1
+                    raise AdmissionTimeoutError(
+                        f"HSM session limit reached, request waited more than {deadline:g}s",
+                        retry_after=self._retry_after()
+                    )
+                self._cond.wait(remaining)
+
+            self._admitted += 1
+
+    def release(self, held: float):
+        with self._cond:
+            self._active -= 1
+            self._hold_time = 0.9 * self._hold_time + 0.1 * held
+            self._dispatch()
+
+    @contextmanager
+    def admit(self, username: str, priority: int = INTERACTIVE, deadline: float = None):
+        """Hold a session permit for the duration of the block"""
+        self.acquire(username, priority, deadline)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "max_sessions": self.max_sessions,
+                "active": self._active,
+                "queued_interactive": sum(len(t) for t in self._queues[INTERACTIVE].values()),
+                "queued_bulk": sum(len(t) for t in self._queues[BULK].values()),
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "avg_hold_ms": self._hold_time * 1000
+            }
+
+
+admission_controller = AdmissionController()
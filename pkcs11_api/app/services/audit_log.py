@@ -0,0 +1,217 @@
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Iterable, Optional
+from sqlalchemy import insert
+from app.models.database import AuditEvent, SessionLocal
+from app.models.keys import KeyInfo
+
+
+class AuditLog:
+    """Append-only key lifecycle audit trail, queued in memory and group committed by a background writer"""
+
+    def __init__(self):
+        self.queue_size = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+        self.batch_size = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+        # How long the writer waits for more events before committing a partial batch
+        self.flush_interval = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.2"))
+        # How long a request may block on a full queue before its event is spilled to disk
+        self.enqueue_timeout = float(os.getenv("AUDIT_ENQUEUE_TIMEOUT", "2"))
+        # Events the database could not take yet, replayed by the writer once it can
+        self.spill_path = os.getenv("AUDIT_SPILL_FILE", "audit_spill.jsonl")
+        self.replay_interval = float(os.getenv("AUDIT_REPLAY_INTERVAL", "5"))
+
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._written = 0
+        self._batches = 0
+        self._spilled = 0
+        self._replayed = 0
+        self._unreadable = 0
+        self._spill_pending = False
+        self._next_replay = 0.0
+
+    def record(self, username: str, action: str, keys: Iterable[KeyInfo] = (), outcome: str = "success",
+               detail: Optional[str] = None, label: Optional[str] = None):
+        """Queue one event per affected key; a failure that affected no key is recorded against the requested label"""
+        timestamp = datetime.utcnow()
+        events = [
+            dict(timestamp=timestamp, username=username, action=action, outcome=outcome, detail=detail,
+                 key_class=key.key_class, key_type=key.key_type, label=key.label, key_id=key.key_id)
+            for key in keys
+        ]
+        if not events and outcome != "success":
+            events = [dict(timestamp=timestamp, username=username, action=action, outcome=outcome, detail=detail, label=label)]
+
+        for event in events:
+            try:
+                self._queue.put(event, timeout=self.enqueue_timeout)
+            except queue.Full:
+                if not self._spill([event], "queue full"):
+                    # Nowhere to put it: hold the request until the writer catches up
+                    self._queue.put(event)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "written": self._written,
+                "batches": self._batches,
+                "spilled": self._spilled,
+                "replayed": self._replayed,
+                "unreadable": self._unreadable,
+                "spill_pending": self._spill_pending
+            }
+
+    def start(self):
+        """Start the background writer thread"""
+        if self._thread:
+            return
+        self._stop.clear()
+        # Events spilled before a restart are replayed on the writer's first pass
+        self._spill_pending = os.path.exists(self.spill_path)
+        self._next_replay = 0.0
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the writer once every queued event is committed"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+            self._thread = None
+        # Anything recorded after the writer exited
+        while self._write_batch(self._take_batch(block=False)):
+            pass
+        if self._spill_pending:
+            self._replay_spill()
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            self._write_batch(self._take_batch(block=True))
+            if self._spill_pending and time.monotonic() >= self._next_replay:
+                if not self._replay_spill():
+                    self._next_replay = time.monotonic() + self.replay_interval
+
+    def _take_batch(self, block: bool) -> list:
+        """Collect up to batch_size events, waiting at most flush_interval for the batch to fill"""
+        batch = []
+        try:
+            if block:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not block:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write_batch(self, batch: list) -> int:
+        """Insert a batch in one transaction; a batch the database keeps refusing goes to the spill file instead"""
+        if not batch:
+            return 0
+
+        while not self._insert(batch, attempts=3):
+            if self._spill(batch, "database write failed"):
+                break
+            # Neither the database nor the spill file takes it: keep it and let the full queue hold requests back
+            time.sleep(self.replay_interval)
+        return len(batch)
+
+    def _insert(self, batch: list, attempts: int) -> bool:
+        for attempt in range(attempts):
+            db = SessionLocal()
+            try:
+                db.execute(insert(AuditEvent), batch)
+                db.commit()
+                with self._lock:
+                    self._written += len(batch)
+                    self._batches += 1
+                return True
+            except Exception as e:
+                db.rollback()
+                print(f"Error writing audit batch (attempt {attempt + 1}): {e}")
+                time.sleep(0.5 * (attempt + 1))
+            finally:
+                db.close()
+        return False
+
+    def _spill(self, events: list, reason: str) -> bool:
+        """Append events to the spill file, fsynced, so they survive until the writer replays them"""
+        with self._spill_lock:
+            try:
+                with open(self.spill_path, "a") as f:
+                    for event in events:
+                        f.write(json.dumps({**event, "timestamp": event["timestamp"].isoformat()}) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                print(f"AUDIT: {reason} and spill file {self.spill_path} unwritable ({e}); "
+                      f"holding {len(events)} event(s) in memory")
+                return False
+            self._spill_pending = True
+        with self._lock:
+            self._spilled += len(events)
+        print(f"AUDIT: {reason}; spilled {len(events)} event(s) to {self.spill_path} for replay")
+        return True
+
+    def _replay_spill(self) -> bool:
+        """Move spilled events into the database, keeping whatever is not committed in the file"""
+        with self._spill_lock:
+            try:
+                with open(self.spill_path) as f:
+                    lines = f.read().splitlines()
+            except FileNotFoundError:
+                self._spill_pending = False
+                return True
+            except OSError as e:
+                print(f"AUDIT: cannot read spill file {self.spill_path}: {e}")
+                return False
+
+            events = []
+            for line in lines:
+                try:
+                    event = json.loads(line)
+                    event["timestamp"] = datetime.fromisoformat(event["timestamp"])
+                    events.append(event)
+                except (ValueError, KeyError, TypeError):
+                    # Only a write torn by a crash ends up here
+                    with self._lock:
+                        self._unreadable += 1
+                    print(f"AUDIT: unreadable line in spill file {self.spill_path}, event lost: {line!r}")
+
+            done = 0
+            while done < len(events):
+                batch = events[done:done + self.batch_size]
+                if not self._insert(batch, attempts=1):
+                    break
+                done += len(batch)
+            with self._lock:
+                self._replayed += done
+
+            remaining = events[done:]
+            if remaining:
+                with open(self.spill_path, "w") as f:
+                    for event in remaining:
+                        f.write(json.dumps({**event, "timestamp": event["timestamp"].isoformat()}) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                print(f"AUDIT: {len(remaining)} spilled event(s) still waiting for the database")
+                return False
+            os.remove(self.spill_path)
+            self._spill_pending = False
+            if done:
+                print(f"AUDIT: replayed {done} spilled event(s) from {self.spill_path}")
+            return True
+
+audit_log = AuditLog()
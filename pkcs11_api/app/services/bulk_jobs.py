@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Optional
+
+
+class BulkJob:
+    """Progress and throughput of one long running bulk operation"""
+
+    MAX_FAILURES = 100
+
+    def __init__(self, kind: str, username: str):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.username = username
+        self.status = "pending"
+        self.total = None
+        self.done = 0
+        self.skipped = 0
+        self.failed = 0
+        self.failures = []  # first MAX_FAILURES {"label", "error"} entries
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def start(self, total: int):
+        with self._lock:
+            self.status = "running"
+            self.total = total
+            self.started_at = time.time()
+
+    def record(self, label: Optional[str] = None, error: Optional[str] = None, skipped: Optional[str] = None):
+        """Count one processed key, with the error or skip reason if it was not migrated"""
+        with self._lock:
+            if error:
+                self.failed += 1
+                if len(self.failures) < self.MAX_FAILURES:
+                    self.failures.append({"label": label, "error": error})
+            elif skipped:
+                self.skipped += 1
+            else:
+                self.done += 1
+
+    def finish(self, error: Optional[str] = None):
+        with self._lock:
+            self.status = "failed" if error else "completed"
+            self.error = error
+            self.finished_at = time.time()
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            processed = self.done + self.skipped + self.failed
+            elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0
+            return {
+                "job_id": self.job_id,
+                "kind": self.kind,
+                "status": self.status,
+                "total": self.total,
+                "done": self.done,
+                "skipped": self.skipped,
+                "failed": self.failed,
+                "progress": processed / self.total if self.total else None,
+                "keys_per_second": processed / elapsed if elapsed else None,
+                "elapsed_seconds": elapsed,
+                "error": self.error,
+                "failures": list(self.failures)
+            }
+
+
+class BulkJobRegistry:
+    """Recent bulk jobs per process, so progress can be polled while they run"""
+
+    def __init__(self):
+        self.history = int(os.getenv("BULK_JOB_HISTORY", "50"))
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # job_id -> BulkJob, oldest first
+
+    def create(self, kind: str, username: str) -> BulkJob:
+        job = BulkJob(kind, username)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id: str, username: str) -> Optional[BulkJob]:
+        """Look up a job; users only see their own"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job if job and job.username == username else None
+
+    def run(self, job: BulkJob, target: Callable, *args):
+        """Run target(*args, job) on a background thread, marking the job finished or failed"""
+        def run():
+            try:
+                target(*args, job)
+                job.finish()
+            except Exception as e:
+                print(f"Error in {job.kind} job {job.job_id}: {e}")
+                job.finish(error=str(e))
+
+        threading.Thread(target=run, name=f"{job.kind}-{job.job_id[:8]}", daemon=True).start()
+
+
+bulk_jobs = BulkJobRegistry()
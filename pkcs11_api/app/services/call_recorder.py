@@ -0,0 +1,92 @@
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+# C_* functions PyKCS11 makes for one wrapper call; attribute reads, signatures and wrapped keys
+# first ask the HSM for the output size. Low level C_* calls count as themselves.
+C_FUNCTIONS = {
+    "getSlotList": ("C_GetSlotList", "C_GetSlotList"),
+    "getTokenInfo": ("C_GetTokenInfo",),
+    "openSession": ("C_OpenSession",),
+    "closeSession": ("C_CloseSession",),
+    "login": ("C_Login",),
+    "logout": ("C_Logout",),
+    "getAttributeValue": ("C_GetAttributeValue", "C_GetAttributeValue"),
+    "setAttributeValue": ("C_SetAttributeValue",),
+    "generateKey": ("C_GenerateKey",),
+    "generateKeyPair": ("C_GenerateKeyPair",),
+    "createObject": ("C_CreateObject",),
+    "destroyObject": ("C_DestroyObject",),
+    "generateRandom": ("C_GenerateRandom",),
+    "sign": ("C_SignInit", "C_Sign", "C_Sign"),
+    "verify": ("C_VerifyInit", "C_Verify"),
+    "encrypt": ("C_EncryptInit", "C_Encrypt", "C_Encrypt"),
+    "decrypt": ("C_DecryptInit", "C_Decrypt", "C_Decrypt"),
+    "wrapKey": ("C_WrapKey", "C_WrapKey"),
+    "unwrapKey": ("C_UnwrapKey",),
+}
+
+# findObjects fetches handles this many at a time, until a C_FindObjects call comes back empty
+FIND_OBJECTS_CHUNK = 10
+
+
+class CallLog:
+    """PKCS#11 C_* function calls made on behalf of one request, by function name"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def add(self, function: str, count: int = 1):
+        # Batch workers record into the same log from several threads
+        with self._lock:
+            self._counts[function] += count
+
+    @property
+    def total(self) -> int:
+        with self._lock:
+            return sum(self._counts.values())
+
+    def counts(self) -> dict:
+        with self._lock:
+            return dict(self._counts)
+
+
+_current: ContextVar[Optional[CallLog]] = ContextVar("pkcs11_call_log", default=None)
+
+
+@contextmanager
+def record_calls() -> Iterator[CallLog]:
+    """Record every PKCS#11 call made in this context, including threadpool work that copies it"""
+    log = CallLog()
+    token = _current.set(log)
+    try:
+        yield log
+    finally:
+        _current.reset(token)
+
+
+def find_calls(found: int) -> int:
+    """C_* calls of one findObjects that found this many objects"""
+    return 2 + found // FIND_OBJECTS_CHUNK + 1
+
+
+def count_call(operation: str, result=None):
+    """Record the C_* calls behind one PyKCS11 call; findObjects and getAttributeValue need the result to count them"""
+    log = _current.get()
+    if log is None:
+        return
+    if operation == "findObjects":
+        log.add("C_FindObjectsInit")
+        log.add("C_FindObjects", len(result or ()) // FIND_OBJECTS_CHUNK + 1)
+        log.add("C_FindObjectsFinal")
+        return
+    if operation == "getAttributeValue" and result and None in result:
+        # CKR_ATTRIBUTE_TYPE_INVALID or CKR_ATTRIBUTE_SENSITIVE: PyKCS11 went on to read the attributes
+        # one at a time, a size query each plus the value of those the object has
+        log.add("C_GetAttributeValue", 1 + sum(1 if value is None else 2 for value in result))
+        return
+    for function in C_FUNCTIONS.get(operation, (operation,)):
+        log.add(function)
@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+import PyKCS11
+from app.services.errors import CircuitOpenError
+
+# PKCS#11 errors that mean the HSM could not be reached, as opposed to a bad request or credentials
+CONNECTION_ERRORS = {
+    PyKCS11.CKR_DEVICE_ERROR,
+    PyKCS11.CKR_DEVICE_REMOVED,
+    PyKCS11.CKR_TOKEN_NOT_PRESENT,
+    PyKCS11.CKR_SESSION_HANDLE_INVALID,
+    PyKCS11.CKR_SESSION_CLOSED,
+    PyKCS11.CKR_GENERAL_ERROR,
+    PyKCS11.CKR_FUNCTION_FAILED,
+}
+
+CLOSED = "closed"
+OPEN = "open"
+
+
+class CircuitBreaker:
+    """Fails HSM requests fast after consecutive connection errors until the health prober succeeds"""
+
+    def __init__(self):
+        self.failure_threshold = int(os.getenv("HSM_BREAKER_FAILURES", "5"))
+        self.probe_interval = float(os.getenv("HSM_HEALTH_PROBE_INTERVAL", "10"))
+
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.last_probe_at = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def check(self):
+        """Raise CircuitOpenError while the breaker is open"""
+        if self.state == OPEN:
+            raise CircuitOpenError("HSM is unreachable, failing fast until the health probe succeeds",
+                                   retry_after=self.probe_interval)
+
+    def record_success(self):
+        with self._lock:
+            # Only the health prober closes an open breaker
+            if self.state == CLOSED:
+                self.consecutive_failures = 0
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_error = str(error)
+            if self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+                print(f"Opening HSM circuit breaker after {self.consecutive_failures} consecutive failures: {error}")
+                self.state = OPEN
+                self.opened_at = time.time()
+
+    def close(self):
+        with self._lock:
+            if self.state == OPEN:
+                print("Closing HSM circuit breaker, health probe succeeded")
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "opened_at": self.opened_at,
+                "last_error": self.last_error,
+                "last_probe_at": self.last_probe_at
+            }
+
+    def start(self):
+        """Start the background health prober"""
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="hsm-health-prober", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        from app.services.cloudhsm_service import CloudHSMService
+
+        while not self._stop.wait(self.probe_interval):
+            if self.state != OPEN:
+                continue
+            self.last_probe_at = time.time()
+            if CloudHSMService().probe_connection():
+                self.close()
+
+
+circuit_breaker = CircuitBreaker()
@@ -1,38 +1,181 @@
 import PyKCS11
+import base64
+import binascii
+import contextvars
+import itertools
+import json
+import math
 import os
-from typing import Optional, List
-from app.models.keys import KeyInfo, KeyDetailResponse
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, Optional, List, Tuple
+from datetime import datetime
+from app.models.keys import (KeyInfo, KeyDetailResponse, KeySearchRequest, KeyStatsResponse,
+                             ModifyKeysRequest, ModifyKeysResponse, ModifyKeyResult)
 from app.models.key_schemas import CreateKeyRequest, DeleteKeyRequest, CreateKeyResponse, DeleteKeyResponse
+from app.models.crypto_schemas import (SignBatchRequest, SignBatchResponse, SignResult,
+                                       VerifyBatchRequest, VerifyBatchResponse, VerifyResult)
+from app.services.admission_controller import admission_controller, INTERACTIVE, BULK
+from app.services.audit_log import audit_log
+from app.services.bulk_jobs import BulkJob
+from app.services.circuit_breaker import circuit_breaker
+from app.services.errors import HSMUnavailableError
+from app.services.inventory_feed import inventory_feed
+from app.services.key_handle_cache import key_handle_cache, HANDLE_ERRORS
+from app.services.key_pool_service import POOL_LABEL_PREFIX, key_pool
+from app.services.key_records import KeyRecord, CLASS_NAMES, TYPE_NAMES, class_name, type_name
+from app.services.key_stats import key_stats_cache
+from app.services.public_key_cache import public_key_cache, PublicKeyMaterial
+from app.services.slot_scheduler import slot_scheduler
+from app.services.stream_cipher import StreamCipher
+from app.utils.public_keys import EC_CURVES, curve_name, rsa_spki, rsa_jwk, ec_spki, ec_jwk
+
+# Boolean key attributes by KeyDetailResponse field name, for search filters and key_stats
+FLAG_ATTRIBUTES = {
+    "token": PyKCS11.CKA_TOKEN,
+    "private": PyKCS11.CKA_PRIVATE,
+    "sensitive": PyKCS11.CKA_SENSITIVE,
+    "extractable": PyKCS11.CKA_EXTRACTABLE,
+    "local": PyKCS11.CKA_LOCAL,
+    "modifiable": PyKCS11.CKA_MODIFIABLE,
+    "destroyable": PyKCS11.CKA_DESTROYABLE
+}
+
+# Boolean attributes each key class has; public keys have no CKA_SENSITIVE or CKA_EXTRACTABLE, and
+# asking for them costs a read per attribute, as PyKCS11 falls back to reading one at a time
+CLASS_FLAGS = {
+    PyKCS11.CKO_SECRET_KEY: list(FLAG_ATTRIBUTES),
+    PyKCS11.CKO_PRIVATE_KEY: list(FLAG_ATTRIBUTES),
+    PyKCS11.CKO_PUBLIC_KEY: [name for name in FLAG_ATTRIBUTES if name not in ("sensitive", "extractable")]
+}
+
+# Attributes read for a detailed view of one key, in KeyDetailResponse field order
+DETAIL_ATTRIBUTES = [
+    PyKCS11.CKA_CLASS,
+    PyKCS11.CKA_KEY_TYPE,
+    PyKCS11.CKA_LABEL,
+    PyKCS11.CKA_ID,
+    PyKCS11.CKA_TOKEN,
+    PyKCS11.CKA_PRIVATE,
+    PyKCS11.CKA_SENSITIVE,
+    PyKCS11.CKA_EXTRACTABLE,
+    PyKCS11.CKA_LOCAL,
+    PyKCS11.CKA_MODIFIABLE,
+    PyKCS11.CKA_DESTROYABLE
+]
+
+# DER DigestInfo prefixes for PKCS#1 v1.5 signatures over a precomputed digest, with the digest length
+DIGEST_INFO = {
+    "SHA256": (bytes.fromhex("3031300d060960864801650304020105000420"), 32),
+    "SHA384": (bytes.fromhex("3041300d060960864801650304020205000430"), 48),
+    "SHA512": (bytes.fromhex("3051300d060960864801650304020305000440"), 64)
+}
+
+PSS_HASHES = {
+    "SHA256": (PyKCS11.CKM_SHA256, PyKCS11.CKG_MGF1_SHA256),
+    "SHA384": (PyKCS11.CKM_SHA384, PyKCS11.CKG_MGF1_SHA384),
+    "SHA512": (PyKCS11.CKM_SHA512, PyKCS11.CKG_MGF1_SHA512)
+}
+
+# Key type each algorithm works with
+ALGORITHM_KEY_TYPES = {
+    "RSA_PKCS": PyKCS11.CKK_RSA,
+    "RSA_PSS": PyKCS11.CKK_RSA,
+    "ECDSA": PyKCS11.CKK_EC,
+    "AES_CBC_PAD": PyKCS11.CKK_AES,
+    "AES_KEY_WRAP_PAD": PyKCS11.CKK_AES
+}
+
+# Key classes and types by the names used in the API and in key archives
+KEY_CLASSES = {
+    "SECRET_KEY": PyKCS11.CKO_SECRET_KEY,
+    "PRIVATE_KEY": PyKCS11.CKO_PRIVATE_KEY,
+    "PUBLIC_KEY": PyKCS11.CKO_PUBLIC_KEY
+}
+KEY_TYPES = {
+    "AES": PyKCS11.CKK_AES,
+    "RSA": PyKCS11.CKK_RSA,
+    "EC": PyKCS11.CKK_EC
+}
+
+# Attributes a key archive preserves, per key class
+ARCHIVE_ATTRIBUTES = {
+    PyKCS11.CKO_SECRET_KEY: {
+        "token": PyKCS11.CKA_TOKEN, "private": PyKCS11.CKA_PRIVATE, "sensitive": PyKCS11.CKA_SENSITIVE,
+        "extractable": PyKCS11.CKA_EXTRACTABLE, "encrypt": PyKCS11.CKA_ENCRYPT, "decrypt": PyKCS11.CKA_DECRYPT,
+        "sign": PyKCS11.CKA_SIGN, "verify": PyKCS11.CKA_VERIFY, "wrap": PyKCS11.CKA_WRAP, "unwrap": PyKCS11.CKA_UNWRAP
+    },
+    PyKCS11.CKO_PRIVATE_KEY: {
+        "token": PyKCS11.CKA_TOKEN, "private": PyKCS11.CKA_PRIVATE, "sensitive": PyKCS11.CKA_SENSITIVE,
+        "extractable": PyKCS11.CKA_EXTRACTABLE, "decrypt": PyKCS11.CKA_DECRYPT, "sign": PyKCS11.CKA_SIGN,
+        "unwrap": PyKCS11.CKA_UNWRAP
+    },
+    PyKCS11.CKO_PUBLIC_KEY: {
+        "token": PyKCS11.CKA_TOKEN, "private": PyKCS11.CKA_PRIVATE, "encrypt": PyKCS11.CKA_ENCRYPT,
+        "verify": PyKCS11.CKA_VERIFY, "wrap": PyKCS11.CKA_WRAP
+    }
+}
+
+# Attributes a bulk modify may set, by ModifyKeysRequest field name; usage flags only where the key class has them
+MODIFY_ATTRIBUTES = {
+    "label": PyKCS11.CKA_LABEL,
+    "key_id": PyKCS11.CKA_ID,
+    "encrypt": PyKCS11.CKA_ENCRYPT,
+    "decrypt": PyKCS11.CKA_DECRYPT,
+    "sign": PyKCS11.CKA_SIGN,
+    "verify": PyKCS11.CKA_VERIFY,
+    "wrap": PyKCS11.CKA_WRAP,
+    "unwrap": PyKCS11.CKA_UNWRAP
+}
+
+# Public keys are not wrapped; the archive carries their (non-secret) key material instead
+PUBLIC_KEY_MATERIAL = {
+    PyKCS11.CKK_RSA: {"modulus": PyKCS11.CKA_MODULUS, "public_exponent": PyKCS11.CKA_PUBLIC_EXPONENT},
+    PyKCS11.CKK_EC: {"ec_params": PyKCS11.CKA_EC_PARAMS, "ec_point": PyKCS11.CKA_EC_POINT}
+}
+
+ARCHIVE_FORMAT = "cloudhsm-key-archive"
+ARCHIVE_VERSION = 1
+# Archive entries read and unwrapped at a time, so large archives are not held in memory
+UNWRAP_BATCH_SIZE = int(os.getenv("UNWRAP_BATCH_SIZE", "1000"))
+
+# Batch crypto is spread over up to HSM_BATCH_SESSIONS sessions, each handling at least BATCH_MIN_PER_SESSION items
+BATCH_SESSIONS = int(os.getenv("HSM_BATCH_SESSIONS", "4"))
+BATCH_MIN_PER_SESSION = int(os.getenv("HSM_BATCH_MIN_PER_SESSION", "16"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("HSM_PIPELINE_QUEUE_SIZE", "256"))
+_CHUNK_DONE = object()
+_CHUNK_FAILED = object()
+_batch_executor = ThreadPoolExecutor(max_workers=int(os.getenv("HSM_BATCH_THREADS", "32")), thread_name_prefix="hsm-batch")
 
 class CloudHSMService:
     def __init__(self):
-        self.pkcs11_lib = os.getenv("PKCS11_LIB", "/opt/cloudhsm/lib/libcloudhsm_pkcs11.so")
         self.session = None
-        self.pkcs11 = None
+        self.sync_token = None
+    
+    @contextmanager
+    def _open_session(self, username: str = None, password: str = None, priority: int = INTERACTIVE, slot: int = None):
+        """Wait for a session permit, then open a (logged in) session on the least loaded HSM slot, or on the given one"""
+        # Fail fast instead of queueing while the HSM is known to be unreachable
+        circuit_breaker.check()
+        with admission_controller.admit(username, priority):
+            with slot_scheduler.session(username, password, slot) as session:
+                self.session = session
+                try:
+                    yield session
+                finally:
+                    self.session = None
     
     def authenticate_user(self, username: str, password: str) -> bool:
         """Authenticate user with CloudHSM using PyKCS11"""
         try:
-            # Initialize PKCS11
-            self.pkcs11 = PyKCS11.PyKCS11Lib()
-            self.pkcs11.load(self.pkcs11_lib)
-            
-            # Get slots
-            slots = self.pkcs11.getSlotList(tokenPresent=True)
-            if not slots:
-                print("No slots found")
-                return False
-            
-            # Open session
-            self.session = self.pkcs11.openSession(slots[0], PyKCS11.CKF_SERIAL_SESSION | PyKCS11.CKF_RW_SESSION)
-            
-            # Login with combined username:password as PIN
-            login_pin = f"{username}:{password}"
-            self.session.login(login_pin)
-            
-            # If we reach here, authentication was successful
-            return True
+            with self._open_session(username, password):
+                # If we reach here, authentication was successful
+                return True
             
+        except HSMUnavailableError:
+            raise
         except PyKCS11.PyKCS11Error as e:
             print(f"CloudHSM authentication failed: {e}")
             return False
@@ -40,247 +183,769 @@ class CloudHSMService:
             print(f"Unexpected error during authentication: {e}")
             return False
     
-    def list_keys(self, username: str, password: str) -> List[KeyInfo]:
-        """List all keys in CloudHSM"""
+    def list_keys(self, username: str, password: str, priority: int = INTERACTIVE) -> List[KeyRecord]:
+        """List all keys in CloudHSM as compact records; convert with key_infos() for a response"""
         keys = []
+        complete = True
         
         try:
-            # Initialize PKCS11
-            self.pkcs11 = PyKCS11.PyKCS11Lib()
-            self.pkcs11.load(self.pkcs11_lib)
-            
-            # Get slots
-            slots = self.pkcs11.getSlotList(tokenPresent=True)
-            if not slots:
-                return keys
-            
-            # Open session
-            self.session = self.pkcs11.openSession(slots[0], PyKCS11.CKF_SERIAL_SESSION | PyKCS11.CKF_RW_SESSION)
-            
-            # Login
-            login_pin = f"{username}:{password}"
-            self.session.login(login_pin)
-            
-            # Find all objects
-            objects = self.session.findObjects()
-            
-            for obj in objects:
-                try:
-                    # Get object attributes
-                    attrs = self.session.getAttributeValue(obj, [
-                        PyKCS11.CKA_CLASS,
-                        PyKCS11.CKA_KEY_TYPE,
-                        PyKCS11.CKA_LABEL,
-                        PyKCS11.CKA_ID
-                    ])
+            # Remember the feed generation so a racing create/delete is not undone by this snapshot
+            generation = inventory_feed.generation(username)
+            
+            with self._open_session(username, password, priority=priority):
+                # Find all objects
+                objects = self.session.findObjects()
+                
+                for obj in objects:
+                    try:
+                        # Get object attributes
+                        attrs = self.session.getAttributeValue(obj, [
+                            PyKCS11.CKA_CLASS,
+                            PyKCS11.CKA_KEY_TYPE,
+                            PyKCS11.CKA_LABEL,
+                            PyKCS11.CKA_ID
+                        ])
+                        
+                        record = KeyRecord.from_attributes(attrs, self._read_curve(obj) if attrs[1] == PyKCS11.CKK_EC else None)
+                        if not key_pool.is_placeholder(record.label):
+                            keys.append(record)
                     
-                    key_info = self._create_key_info(attrs)
-                    if key_info:
-                        keys.append(key_info)
-                    
-                except Exception as e:
-                    print(f"Error processing object {obj}: {e}")
-                    continue
-            
-            # Logout and close
-            self.session.logout()
-            self.session.closeSession()
-            
+                    except HSMUnavailableError:
+                        raise
+                    except Exception as e:
+                        print(f"Error processing object {obj}: {e}")
+                        complete = False
+                        continue
+            
+            # A complete listing doubles as a change feed snapshot
+            if complete:
+                self.sync_token = inventory_feed.observe(username, keys, generation)
+            
+        except HSMUnavailableError:
+            raise
         except Exception as e:
             print(f"Error listing keys: {e}")
         
         return keys
     
-    def filter_keys(self, username: str, password: str, key_class: str = None, key_type: str = None, label: str = None, key_id: str = None) -> List[KeyInfo]:
+    def filter_keys(self, username: str, password: str, key_class: str = None, key_type: str = None, label: str = None, key_id: str = None, key_size: int = None, attributes: dict = None) -> List[KeyInfo]:
         """Filter keys and return KeyInfo list"""
         keys = []
         
         try:
-            # Initialize PKCS11
-            self.pkcs11 = PyKCS11.PyKCS11Lib()
-            self.pkcs11.load(self.pkcs11_lib)
-            
-            # Get slots
-            slots = self.pkcs11.getSlotList(tokenPresent=True)
-            if not slots:
-                return keys
-            
-            # Open session
-            self.session = self.pkcs11.openSession(slots[0], PyKCS11.CKF_SERIAL_SESSION | PyKCS11.CKF_RW_SESSION)
-            
-            # Login
-            login_pin = f"{username}:{password}"
-            self.session.login(login_pin)
-            
-            # Build filter template
-            template = []
-            
-            if key_class:
-                if key_class == "SECRET_KEY":
-                    template.append((PyKCS11.CKA_CLASS, PyKCS11.CKO_SECRET_KEY))
-                elif key_class == "PRIVATE_KEY":
-                    template.append((PyKCS11.CKA_CLASS, PyKCS11.CKO_PRIVATE_KEY))
-                elif key_class == "PUBLIC_KEY":
-                    template.append((PyKCS11.CKA_CLASS, PyKCS11.CKO_PUBLIC_KEY))
-            
-            if key_type:
-                if key_type == "AES":
-                    template.append((PyKCS11.CKA_KEY_TYPE, PyKCS11.CKK_AES))
-                elif key_type == "RSA":
-                    template.append((PyKCS11.CKA_KEY_TYPE, PyKCS11.CKK_RSA))
-                elif key_type == "EC":
-                    template.append((PyKCS11.CKA_KEY_TYPE, PyKCS11.CKK_EC))
-            
-            if label:
-                template.append((PyKCS11.CKA_LABEL, label))
-            
-            if key_id:
-                id_bytes = bytes.fromhex(key_id)
-                template.append((PyKCS11.CKA_ID, id_bytes))
-            
-            # Find objects with template
-            objects = self.session.findObjects(template)
-            
-            for obj in objects:
-                try:
-                    # Get object attributes
-                    attrs = self.session.getAttributeValue(obj, [
-                        PyKCS11.CKA_CLASS,
-                        PyKCS11.CKA_KEY_TYPE,
-                        PyKCS11.CKA_LABEL,
-                        PyKCS11.CKA_ID
-                    ])
+            with self._open_session(username, password):
+                # Build filter template
+                template = self._build_filter_template(key_class, key_type, label, key_id, key_size, attributes)
+                
+                # Find objects with template
+                objects = self._find_keys(template, key_type, key_size)
+                
+                for obj in objects:
+                    try:
+                        # Get object attributes
+                        attrs = self.session.getAttributeValue(obj, [
+                            PyKCS11.CKA_CLASS,
+                            PyKCS11.CKA_KEY_TYPE,
+                            PyKCS11.CKA_LABEL,
+                            PyKCS11.CKA_ID
+                        ])
+                        
+                        key_info = self._create_key_info(attrs, obj)
+                        if key_info and not key_pool.is_placeholder(key_info.label):
+                            keys.append(key_info)
                     
-                    key_info = self._create_key_info(attrs)
-                    if key_info:
-                        keys.append(key_info)
-                    
-                except Exception as e:
-                    print(f"Error processing object {obj}: {e}")
-                    continue
-            
-            # Logout and close
-            self.session.logout()
-            self.session.closeSession()
-            
+                    except HSMUnavailableError:
+                        raise
+                    except Exception as e:
+                        print(f"Error processing object {obj}: {e}")
+                        continue
+            
+        except (HSMUnavailableError, ValueError):
+            raise
         except Exception as e:
             print(f"Error filtering keys: {e}")
         
         return keys
     
-    def find_key(self, username: str, password: str, key_class: str = None, key_type: str = None, label: str = None, key_id: str = None) -> Optional[KeyDetailResponse]:
+    def find_key(self, username: str, password: str, key_class: str = None, key_type: str = None, label: str = None, key_id: str = None, key_size: int = None, attributes: dict = None) -> Optional[KeyDetailResponse]:
         """Find specific key with detailed attributes"""
         
         try:
-            # Initialize PKCS11
-            self.pkcs11 = PyKCS11.PyKCS11Lib()
-            self.pkcs11.load(self.pkcs11_lib)
-            
-            # Get slots
-            slots = self.pkcs11.getSlotList(tokenPresent=True)
-            if not slots:
+            with self._open_session(username, password):
+                # Build filter template
+                template = self._build_filter_template(key_class, key_type, label, key_id, key_size, attributes)
+                
+                # Lookups by label or ID reuse the handle found last time; RSA sizes are not part of the template
+                cacheable = bool(label or key_id) and not self._filters_by_modulus(key_type, key_size)
+                fields = None
+                obj = key_handle_cache.get(username, self.session.slot, template) if cacheable else None
+                if obj is not None:
+                    try:
+                        fields = self._key_detail_fields(self.session.getAttributeValue(obj, DETAIL_ATTRIBUTES))
+                    except PyKCS11.PyKCS11Error as e:
+                        if e.value not in HANDLE_ERRORS:
+                            raise
+                    # A handle reused by another key is as stale as an invalid one
+                    if not fields or (label and fields["label"] != label) or (key_id and fields["key_id"] != key_id.lower()):
+                        key_handle_cache.discard_handles(self.session.slot, [obj])
+                        fields = None
+                
+                if fields is None:
+                    # Find objects with template
+                    objects = self._find_keys(template, key_type, key_size)
+                    
+                    # Get all attributes of the first match that is not key pool stock
+                    for candidate in objects:
+                        candidate_fields = self._key_detail_fields(self.session.getAttributeValue(candidate, DETAIL_ATTRIBUTES))
+                        if not key_pool.is_placeholder(candidate_fields["label"]):
+                            obj, fields = candidate, candidate_fields
+                            break
+                    
+                    if fields is None:
+                        return None
+                    if cacheable:
+                        key_handle_cache.put(username, self.session.slot, template, obj)
+                
+                if fields["key_type"] == "EC":
+                    fields["curve"] = self._read_curve(obj)
+                
+                return KeyDetailResponse(**fields)
+            
+        except (HSMUnavailableError, ValueError):
+            raise
+        except Exception as e:
+            print(f"Error finding key: {e}")
+            return None
+    
+    def public_key(self, username: str, password: str, key_id: str) -> Optional[PublicKeyMaterial]:
+        """Public key material of a key pair by key ID, served from the cache once read"""
+        key_id = key_id.lower()
+        cached = public_key_cache.get(username, key_id)
+        if cached:
+            return cached
+        
+        try:
+            with self._open_session(username, password):
+                material = self._read_public_key(key_id)
+        except HSMUnavailableError:
+            raise
+        except Exception as e:
+            print(f"Error reading public key: {e}")
+            return None
+        
+        if material:
+            public_key_cache.put(username, material)
+        return material
+    
+    def _read_public_key(self, key_id: str) -> Optional[PublicKeyMaterial]:
+        """Read the public half of a pair, falling back to the private key, which also carries an RSA modulus"""
+        for key_class in (PyKCS11.CKO_PUBLIC_KEY, PyKCS11.CKO_PRIVATE_KEY):
+            for obj in self.session.findObjects([(PyKCS11.CKA_CLASS, key_class), (PyKCS11.CKA_ID, bytes.fromhex(key_id))]):
+                key_type = self.session.getAttributeValue(obj, [PyKCS11.CKA_KEY_TYPE])[0]
+                if key_type == PyKCS11.CKK_RSA:
+                    modulus, exponent = (bytes(value) for value in self.session.getAttributeValue(
+                        obj, [PyKCS11.CKA_MODULUS, PyKCS11.CKA_PUBLIC_EXPONENT]))
+                    return PublicKeyMaterial(key_id, "RSA", rsa_spki(modulus, exponent), rsa_jwk(modulus, exponent))
+                if key_type == PyKCS11.CKK_EC and key_class == PyKCS11.CKO_PUBLIC_KEY:
+                    params, point = (bytes(value) for value in self.session.getAttributeValue(
+                        obj, [PyKCS11.CKA_EC_PARAMS, PyKCS11.CKA_EC_POINT]))
+                    return PublicKeyMaterial(key_id, "EC", ec_spki(params, point), ec_jwk(params, point))
+        return None
+    
+    def key_stats(self, username: str, password: str) -> KeyStatsResponse:
+        """Faceted key counts and partition usage, bucketed from one enumeration per key class"""
+        cached = key_stats_cache.get(username)
+        if cached:
+            return cached
+        
+        total = 0
+        by_class = dict.fromkeys(CLASS_NAMES.values(), 0)
+        by_type = dict.fromkeys(TYPE_NAMES.values(), 0)
+        flags = dict.fromkeys(FLAG_ATTRIBUTES, 0)
+        objects = 0
+        with self._open_session(username, password):
+            # One search per key class, so each key is asked only for attributes its class has;
+            # certificates and data objects are never read
+            for key_class, names in CLASS_FLAGS.items():
+                found = self.session.findObjects([(PyKCS11.CKA_CLASS, key_class)])
+                objects += len(found)
+                
+                for obj in found:
+                    try:
+                        attrs = self.session.getAttributeValue(obj, [PyKCS11.CKA_KEY_TYPE, PyKCS11.CKA_LABEL,
+                                                                     *(FLAG_ATTRIBUTES[name] for name in names)])
+                    except HSMUnavailableError:
+                        raise
+                    except Exception as e:
+                        print(f"Error reading object {obj}: {e}")
+                        continue
+                    
+                    # Pool placeholders are not listed either
+                    if key_pool.is_placeholder(self._process_label(attrs[1])):
+                        continue
+                    total += 1
+                    by_class[CLASS_NAMES[key_class]] += 1
+                    if attrs[0] in TYPE_NAMES:
+                        by_type[TYPE_NAMES[attrs[0]]] += 1
+                    for name, value in zip(names, attrs[2:]):
+                        if value:
+                            flags[name] += 1
+        
+        # Key objects, pool placeholders included
+        partition = {"objects": objects}
+        token_info = slot_scheduler.token_info()
+        if token_info:
+            for field in ("ulMaxSessionCount", "ulSessionCount", "ulTotalPublicMemory", "ulFreePublicMemory",
+                          "ulTotalPrivateMemory", "ulFreePrivateMemory"):
+                value = getattr(token_info, field, None)
+                # CK_UNAVAILABLE_INFORMATION and CK_EFFECTIVELY_INFINITE come back as huge or zero values
+                partition[field] = value if isinstance(value, int) and 0 < value < 2 ** 31 else None
+        
+        stats = KeyStatsResponse(
+            total=total,
+            by_class=by_class,
+            by_type=by_type,
+            flags=flags,
+            partition=partition,
+            computed_at=datetime.utcnow().isoformat()
+        )
+        key_stats_cache.put(username, stats)
+        return stats
+    
+    def sign_digests(self, username: str, password: str, request: SignBatchRequest) -> Optional[SignBatchResponse]:
+        """Sign a batch of digests with one private key, spread over parallel sessions; None if the key is missing"""
+        mechanism, prefix = self._signature_mechanism(request.algorithm.value, request.hash_algorithm.value)
+        
+        def sign(session, key, digest: bytes) -> dict:
+            signature = session.sign(key, prefix + digest, mechanism)
+            return {"signature": base64.b64encode(bytes(signature)).decode()}
+        
+        items, results = self._decode_digests(request.hash_algorithm.value, [(digest, None) for digest in request.digests])
+        batch = self._with_key(
+            username, password, [request.label], PyKCS11.CKO_PRIVATE_KEY, PyKCS11.CKA_SIGN, request.algorithm.value,
+            lambda slot, key: self._run_batch(username, password, slot, key, items, sign)
+        )
+        if batch is None:
+            return None
+        results.update(batch)
+        
+        signed = [SignResult(index=index, **results[index]) for index in range(len(request.digests))]
+        failed = sum(1 for result in signed if result.error)
+        return SignBatchResponse(results=signed, signed=len(signed) - failed, failed=failed)
+    
+    def verify_signatures(self, username: str, password: str, request: VerifyBatchRequest) -> Optional[VerifyBatchResponse]:
+        """Verify a batch of digest signatures with one public key, spread over parallel sessions; None if the key is missing"""
+        mechanism, prefix = self._signature_mechanism(request.algorithm.value, request.hash_algorithm.value)
+        
+        def verify(session, key, item: Tuple[bytes, bytes]) -> dict:
+            digest, signature = item
+            return {"valid": bool(session.verify(key, prefix + digest, signature, mechanism))}
+        
+        items, results = self._decode_digests(request.hash_algorithm.value,
+                                              [(item.digest, item.signature) for item in request.items])
+        # Key pairs created here label the public half "<label>-public"
+        batch = self._with_key(
+            username, password, [request.label, f"{request.label}-public"], PyKCS11.CKO_PUBLIC_KEY, PyKCS11.CKA_VERIFY,
+            request.algorithm.value, lambda slot, key: self._run_batch(username, password, slot, key, items, verify)
+        )
+        if batch is None:
+            return None
+        results.update(batch)
+        
+        verified = [VerifyResult(index=index, **results[index]) for index in range(len(request.items))]
+        valid = sum(1 for result in verified if result.valid)
+        failed = sum(1 for result in verified if result.error)
+        return VerifyBatchResponse(results=verified, valid=valid, invalid=len(verified) - valid - failed, failed=failed)
+    
+    def generate_random(self, username: str, password: str, length: int, priority: int = INTERACTIVE) -> bytes:
+        """Draw length random bytes from the HSM's generator"""
+        with self._open_session(username, password, priority=priority):
+            return bytes(self.session.generateRandom(length))
+    
+    def open_cipher(self, username: str, password: str, label: str, iv: bytes, decrypt: bool = False) -> Optional[StreamCipher]:
+        """Start a multipart AES-CBC-PAD operation on a session held until the cipher is closed; None if the key is missing"""
+        usage = PyKCS11.CKA_DECRYPT if decrypt else PyKCS11.CKA_ENCRYPT
+        context = self._open_session(username, password, priority=BULK)
+        context.__enter__()
+        try:
+            for attempt in range(2):
+                key = self._cached_key(username, [label], PyKCS11.CKO_SECRET_KEY, usage, "AES_CBC_PAD", self.session.slot)
+                if key is None:
+                    key = self._resolve_key(username, [label], PyKCS11.CKO_SECRET_KEY, usage, "AES_CBC_PAD")
+                if key is None:
+                    context.__exit__(None, None, None)
+                    return None
+                try:
+                    return StreamCipher(self.session, key, iv, decrypt, on_close=lambda: context.__exit__(None, None, None))
+                except PyKCS11.PyKCS11Error as e:
+                    if e.value not in HANDLE_ERRORS or attempt:
+                        raise
+                    key_handle_cache.discard_handles(self.session.slot, [key])
+        except BaseException as e:
+            context.__exit__(type(e), e, e.__traceback__)
+            raise
+    
+    def _with_key(self, username: str, password: str, labels: List[str], key_class: int, usage: int, algorithm: str,
+                  operation: Callable):
+        """Helper to run operation(slot, handle) with a cached key handle, searching again once if the handle went stale
+
+        The handle is only valid on the slot it was found on; operation must open its sessions there.
+        """
+        for attempt in range(2):
+            cached = self._cached_key(username, labels, key_class, usage, algorithm)
+            if cached is None:
+                with self._open_session(username, password):
+                    key = self._resolve_key(username, labels, key_class, usage, algorithm)
+                    cached = (self.session.slot, key) if key is not None else None
+            if cached is None:
                 return None
             
-            # Open session
-            self.session = self.pkcs11.openSession(slots[0], PyKCS11.CKF_SERIAL_SESSION | PyKCS11.CKF_RW_SESSION)
-            
-            # Login
-            login_pin = f"{username}:{password}"
-            self.session.login(login_pin)
-            
-            # Build filter template
-            template = []
-            
-            if key_class:
-                if key_class == "SECRET_KEY":
-                    template.append((PyKCS11.CKA_CLASS, PyKCS11.CKO_SECRET_KEY))
-                elif key_class == "PRIVATE_KEY":
-                    template.append((PyKCS11.CKA_CLASS, PyKCS11.CKO_PRIVATE_KEY))
-                elif key_class == "PUBLIC_KEY":
-                    template.append((PyKCS11.CKA_CLASS, PyKCS11.CKO_PUBLIC_KEY))
-            
-            if key_type:
-                if key_type == "AES":
-                    template.append((PyKCS11.CKA_KEY_TYPE, PyKCS11.CKK_AES))
-                elif key_type == "RSA":
-                    template.append((PyKCS11.CKA_KEY_TYPE, PyKCS11.CKK_RSA))
-                elif key_type == "EC":
-                    template.append((PyKCS11.CKA_KEY_TYPE, PyKCS11.CKK_EC))
-            
-            if label:
-                template.append((PyKCS11.CKA_LABEL, label))
-            
-            if key_id:
-                id_bytes = bytes.fromhex(key_id)
-                template.append((PyKCS11.CKA_ID, id_bytes))
-            
-            # Find objects with template
+            slot, key = cached
+            try:
+                return operation(slot, key)
+            except PyKCS11.PyKCS11Error as e:
+                if e.value not in HANDLE_ERRORS or attempt:
+                    raise
+                key_handle_cache.discard_handles(slot, [key])
+    
+    def _key_template(self, label: str, key_class: int, usage: int, algorithm: str) -> list:
+        """Helper to build the search template for a key allowed for an operation"""
+        return [
+            (PyKCS11.CKA_CLASS, key_class),
+            (PyKCS11.CKA_LABEL, label),
+            (usage, True),
+            (PyKCS11.CKA_KEY_TYPE, ALGORITHM_KEY_TYPES[algorithm])
+        ]
+    
+    def _cached_key(self, username: str, labels: List[str], key_class: int, usage: int, algorithm: str, slot: int = None):
+        """Helper to get a key handle from the handle cache, without touching the HSM
+
+        With a slot, the handle cached on that slot; without one, (slot, handle) from whichever slot has it.
+        """
+        for label in labels:
+            template = self._key_template(label, key_class, usage, algorithm)
+            key = key_handle_cache.get(username, slot, template) if slot is not None else key_handle_cache.lookup(username, template)
+            if key is not None:
+                return key
+        return None
+    
+    def _resolve_key(self, username: str, labels: List[str], key_class: int, usage: int, algorithm: str):
+        """Helper to find and cache the handle of a key allowed for an operation, under the first label that exists"""
+        for label in labels:
+            template = self._key_template(label, key_class, usage, algorithm)
             objects = self.session.findObjects(template)
-            
-            if not objects:
-                self.session.logout()
-                self.session.closeSession()
-                return None
-            
-            # Get first matching object
-            obj = objects[0]
-            
-            # Get all attributes
-            attrs = self.session.getAttributeValue(obj, [
-                PyKCS11.CKA_CLASS,
-                PyKCS11.CKA_KEY_TYPE,
-                PyKCS11.CKA_LABEL,
-                PyKCS11.CKA_ID,
-                PyKCS11.CKA_TOKEN,
-                PyKCS11.CKA_PRIVATE,
-                PyKCS11.CKA_SENSITIVE,
-                PyKCS11.CKA_EXTRACTABLE,
-                PyKCS11.CKA_LOCAL,
-                PyKCS11.CKA_MODIFIABLE,
-                PyKCS11.CKA_DESTROYABLE
-            ])
-            
-            # Map class and type
-            key_class_str, key_type_str = self._map_class_and_type(attrs[0], attrs[1])
-            
-            # Process label and ID
-            label_str = self._process_label(attrs[2])
-            key_id_str = self._process_key_id(attrs[3])
-            
-            # Logout and close
-            self.session.logout()
-            self.session.closeSession()
-            
-            return KeyDetailResponse(
-                key_class=key_class_str,
-                key_type=key_type_str,
-                label=label_str,
-                key_id=key_id_str,
-                token=bool(attrs[4]),
-                private=bool(attrs[5]),
-                sensitive=bool(attrs[6]),
-                extractable=bool(attrs[7]),
-                local=bool(attrs[8]),
-                modifiable=bool(attrs[9]),
-                destroyable=bool(attrs[10])
-            )
-            
+            if objects:
+                key_handle_cache.put(username, self.session.slot, template, objects[0])
+                return objects[0]
+            
+            # Tell a key of the wrong type apart from a missing one
+            if self.session.findObjects(template[:-1]):
+                raise ValueError(f"Key '{label}' cannot be used with {algorithm}")
+        return None
+    
+    def _signature_mechanism(self, algorithm: str, hash_algorithm: str) -> Tuple[PyKCS11.Mechanism, bytes]:
+        """Helper to build the mechanism for signing a precomputed digest, and the prefix to put in front of it"""
+        if algorithm == "RSA_PKCS":
+            return PyKCS11.Mechanism(PyKCS11.CKM_RSA_PKCS, None), DIGEST_INFO[hash_algorithm][0]
+        if algorithm == "RSA_PSS":
+            hash_mechanism, mgf = PSS_HASHES[hash_algorithm]
+            salt_length = DIGEST_INFO[hash_algorithm][1]
+            return PyKCS11.RSA_PSS_Mechanism(PyKCS11.CKM_RSA_PKCS_PSS, hash_mechanism, mgf, salt_length), b""
+        return PyKCS11.Mechanism(PyKCS11.CKM_ECDSA, None), b""
+    
+    def _decode_digests(self, hash_algorithm: str, pairs: List[Tuple[str, Optional[str]]]) -> Tuple[list, Dict[int, dict]]:
+        """Helper to decode base64 digests (and signatures); returns (index, item) pairs to process and per-index errors"""
+        digest_length = DIGEST_INFO[hash_algorithm][1]
+        items = []
+        errors = {}
+        for index, (digest, signature) in enumerate(pairs):
+            try:
+                digest = base64.b64decode(digest, validate=True)
+                if signature is not None:
+                    signature = base64.b64decode(signature, validate=True)
+            except (binascii.Error, ValueError):
+                errors[index] = {"error": "Invalid base64 encoding"}
+                continue
+            if len(digest) != digest_length:
+                errors[index] = {"error": f"{hash_algorithm} digest must be {digest_length} bytes"}
+                continue
+            items.append((index, digest if signature is None else (digest, signature)))
+        return items, errors
+    
+    def _run_batch(self, username: str, password: str, slot: int, key, items: list, process: Callable) -> Dict[int, dict]:
+        """Helper to run process(session, key, item) over (index, item) pairs on parallel sessions, keyed by index"""
+        return dict(self._pipeline(username, password, slot, key, items, process))
+    
+    def _pipeline(self, username: str, password: str, slot: int, key, items: list, process: Callable) -> Iterator[Tuple[int, dict]]:
+        """Helper to run process(session, key, item) over (index, item) pairs on parallel sessions, yielding results as they complete
+
+        The sessions are opened on the slot the key and item handles were found on, as handles are only valid there.
+        """
+        if not items:
+            return
+        
+        # A few items are not worth the extra session logins
+        sessions = max(1, min(BATCH_SESSIONS, math.ceil(len(items) / BATCH_MIN_PER_SESSION)))
+        chunks = [items[offset::sessions] for offset in range(sessions)]
+        
+        # Bounded so slow consumers (streamed responses) hold back the workers instead of buffering results
+        results = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        cancelled = threading.Event()
+        for chunk in chunks:
+            # Copy the context so the request's PKCS#11 call log also sees the workers' calls
+            _batch_executor.submit(contextvars.copy_context().run, CloudHSMService()._process_chunk,
+                                   username, password, slot, key, chunk, process, results, cancelled)
+        
+        running = len(chunks)
+        try:
+            while running:
+                index, result = results.get()
+                if index is _CHUNK_DONE:
+                    running -= 1
+                elif index is _CHUNK_FAILED:
+                    error, pending = result
+                    if isinstance(error, HSMUnavailableError) or (isinstance(error, PyKCS11.PyKCS11Error) and error.value in HANDLE_ERRORS):
+                        raise error
+                    print(f"Error processing batch chunk: {error}")
+                    for pending_index, _ in pending:
+                        yield pending_index, {"error": str(error)}
+                else:
+                    yield index, result
+        finally:
+            cancelled.set()
+    
+    def _process_chunk(self, username: str, password: str, slot: int, key, chunk: list, process: Callable,
+                       results: queue.Queue, cancelled: threading.Event):
+        """Helper to process part of a batch on one session, with per-item errors; a stale key handle aborts the chunk"""
+        def put(entry):
+            while not cancelled.is_set():
+                try:
+                    results.put(entry, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+        
+        position = 0
+        try:
+            with self._open_session(username, password, priority=BULK, slot=slot):
+                for position, (index, item) in enumerate(chunk):
+                    if cancelled.is_set():
+                        return
+                    try:
+                        result = process(self.session, key, item)
+                    except HSMUnavailableError:
+                        raise
+                    except Exception as e:
+                        if isinstance(e, PyKCS11.PyKCS11Error) and e.value in HANDLE_ERRORS:
+                            raise
+                        result = {"error": str(e)}
+                    put((index, result))
+                position = len(chunk)
         except Exception as e:
-            print(f"Error finding key: {e}")
-            return None
+            put((_CHUNK_FAILED, (e, chunk[position:])))
+        finally:
+            put((_CHUNK_DONE, None))
     
-    def _create_key_info(self, attrs) -> Optional[KeyInfo]:
-        """Helper to create KeyInfo from attributes"""
+    def has_wrapping_key(self, username: str, password: str, label: str, unwrap: bool = False) -> bool:
+        """Check an AES key allowed to wrap (or unwrap) exists under the label"""
+        with self._open_session(username, password):
+            return self._wrapping_key(username, label, unwrap) is not None
+    
+    def wrap_keys(self, username: str, password: str, wrapping_label: str, search: KeySearchRequest, job: BulkJob) -> Iterator[str]:
+        """Stream a JSONL key archive of the matching keys, wrapped under an AES key on parallel sessions; empty if the wrapping key is missing"""
+        with self._open_session(username, password, priority=BULK):
+            wrapping_key = self._wrapping_key(username, wrapping_label)
+            if wrapping_key is None:
+                return
+            
+            template = self._build_filter_template(search.key_class, search.key_type, search.label, search.key_id,
+                                                   search.key_size, search.attribute_filters())
+            objects = self._find_keys(template, search.key_type, search.key_size)
+            slot = self.session.slot
+        
+        job.start(len(objects))
+        yield json.dumps({
+            "format": ARCHIVE_FORMAT,
+            "version": ARCHIVE_VERSION,
+            "mechanism": "AES_KEY_WRAP_PAD",
+            "wrapping_key": wrapping_label,
+            "created_at": datetime.utcnow().isoformat(),
+            "count": len(objects)
+        }) + "\n"
+        
+        error = "Archive download was interrupted"
+        wrapped = []
+        try:
+            for _, result in self._pipeline(username, password, slot, wrapping_key, list(enumerate(objects)), self._wrap_entry):
+                job.record(result.get("label"), error=result.get("error"), skipped=result.get("skipped"))
+                if "entry" in result:
+                    entry = result["entry"]
+                    wrapped.append(KeyInfo(key_class=entry["key_class"], key_type=entry["key_type"],
+                                           label=entry["label"], key_id=entry["key_id"]))
+                    yield json.dumps(entry) + "\n"
+            error = None
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            job.finish(error)
+            # Keys that left the HSM, even if the download was cut short afterwards
+            audit_log.record(username, "wrap", wrapped, detail=f"Wrapped under {wrapping_label}")
+    
+    def unwrap_keys(self, username: str, password: str, unwrapping_label: str, entries: Iterable[dict], total: int, job: BulkJob):
+        """Unwrap (or recreate, for public keys) archived keys on parallel sessions; keys whose label already exists are skipped
+
+        Entries are consumed UNWRAP_BATCH_SIZE at a time, so they can be read lazily from the uploaded archive.
+        """
+        with self._open_session(username, password, priority=BULK):
+            unwrapping_key = self._wrapping_key(username, unwrapping_label, unwrap=True)
+            slot = self.session.slot
+        if unwrapping_key is None:
+            raise ValueError(f"Unwrapping key '{unwrapping_label}' not found")
+        
+        job.start(total)
+        entries = iter(entries)
+        while True:
+            batch = list(itertools.islice(entries, UNWRAP_BATCH_SIZE))
+            if not batch:
+                break
+            created = []
+            try:
+                for _, result in self._pipeline(username, password, slot, unwrapping_key, list(enumerate(batch)), self._unwrap_entry):
+                    job.record(result.get("label"), error=result.get("error"), skipped=result.get("skipped"))
+                    if "key" in result:
+                        created.append(result["key"])
+            finally:
+                inventory_feed.record_created(username, created)
+                audit_log.record(username, "unwrap", created, detail=f"Unwrapped with {unwrapping_label}")
+    
+    def _wrapping_key(self, username: str, label: str, unwrap: bool = False):
+        """Helper to get the handle of an AES wrapping key, from the handle cache or the open session"""
+        usage = PyKCS11.CKA_UNWRAP if unwrap else PyKCS11.CKA_WRAP
+        key = self._cached_key(username, [label], PyKCS11.CKO_SECRET_KEY, usage, "AES_KEY_WRAP_PAD", self.session.slot)
+        if key is None:
+            key = self._resolve_key(username, [label], PyKCS11.CKO_SECRET_KEY, usage, "AES_KEY_WRAP_PAD")
+        return key
+    
+    def _wrap_entry(self, session, wrapping_key, obj) -> dict:
+        """Helper to build the archive entry of one key: preserved attributes plus the wrapped key or public key material"""
+        attrs = session.getAttributeValue(obj, [PyKCS11.CKA_CLASS, PyKCS11.CKA_KEY_TYPE, PyKCS11.CKA_LABEL, PyKCS11.CKA_ID])
+        key_info = self._create_key_info(attrs, obj, session)
+        if key_info is None:
+            return {"error": f"Unreadable object {obj}"}
+        if key_pool.is_placeholder(key_info.label):
+            return {"label": key_info.label, "skipped": "Key pool placeholder"}
+        
+        names = ARCHIVE_ATTRIBUTES.get(attrs[0])
+        if names is None:
+            return {"label": key_info.label, "error": f"Unsupported key class: {key_info.key_class}"}
+        
+        entry = key_info.model_dump()
+        values = session.getAttributeValue(obj, list(names.values()))
+        entry["attributes"] = {name: bool(value) for name, value in zip(names, values) if value is not None}
+        
+        if attrs[0] == PyKCS11.CKO_PUBLIC_KEY:
+            material = PUBLIC_KEY_MATERIAL.get(attrs[1])
+            if material is None:
+                return {"label": key_info.label, "error": f"Unsupported public key type: {key_info.key_type}"}
+            values = session.getAttributeValue(obj, list(material.values()))
+            entry["public"] = {name: base64.b64encode(bytes(value)).decode() for name, value in zip(material, values)}
+        else:
+            if not entry["attributes"].get("extractable"):
+                return {"label": key_info.label, "skipped": "Key is not extractable"}
+            mechanism = PyKCS11.Mechanism(PyKCS11.CKM_AES_KEY_WRAP_PAD, None)
+            entry["wrapped"] = base64.b64encode(bytes(session.wrapKey(wrapping_key, obj, mechanism))).decode()
+        
+        return {"label": key_info.label, "entry": entry}
+    
+    def _unwrap_entry(self, session, unwrapping_key, entry: dict) -> dict:
+        """Helper to restore one archive entry with its label, ID and preserved attributes"""
+        label = entry.get("label")
+        key_class = KEY_CLASSES.get(entry.get("key_class"))
+        key_type = KEY_TYPES.get(entry.get("key_type"))
+        if key_class is None or key_type is None:
+            return {"label": label, "error": f"Unsupported key: {entry.get('key_class')} {entry.get('key_type')}"}
+        
+        if key_pool.is_placeholder(label):
+            return {"label": label, "skipped": "Key pool placeholder"}
+        
+        template = [(PyKCS11.CKA_CLASS, key_class), (PyKCS11.CKA_KEY_TYPE, key_type)]
+        if label:
+            # Re-running an interrupted migration must not create duplicates
+            if session.findObjects([(PyKCS11.CKA_CLASS, key_class), (PyKCS11.CKA_LABEL, label)]):
+                return {"label": label, "skipped": "Label already exists"}
+            template.append((PyKCS11.CKA_LABEL, label))
+        if entry.get("key_id"):
+            template.append((PyKCS11.CKA_ID, bytes.fromhex(entry["key_id"])))
+        
+        names = ARCHIVE_ATTRIBUTES[key_class]
+        for name, value in (entry.get("attributes") or {}).items():
+            if name in names:
+                template.append((names[name], bool(value)))
+        
+        if key_class == PyKCS11.CKO_PUBLIC_KEY:
+            material = PUBLIC_KEY_MATERIAL.get(key_type, {})
+            for name, value in (entry.get("public") or {}).items():
+                if name in material:
+                    template.append((material[name], base64.b64decode(value)))
+            session.createObject(template)
+        else:
+            mechanism = PyKCS11.Mechanism(PyKCS11.CKM_AES_KEY_WRAP_PAD, None)
+            session.unwrapKey(unwrapping_key, base64.b64decode(entry["wrapped"]), template, mechanism)
+        
+        return {"label": label, "key": KeyInfo(key_class=entry["key_class"], key_type=entry["key_type"],
+                                               label=label, key_id=entry.get("key_id"))}
+    
+    def export_keys(self, username: str, password: str, key_class: str = None, key_type: str = None, label: str = None, key_id: str = None, key_size: int = None, attributes: dict = None, cursor: int = None) -> Iterator[dict]:
+        """Stream the full attribute set of every matching key, in handle order, from one session"""
+        with self._open_session(username, password, priority=BULK):
+            # Handles come back sorted by value so a cursor (the last handle value exported) can resume the stream
+            template = self._build_filter_template(key_class, key_type, label, key_id, key_size, attributes)
+            objects = sorted(self._find_keys(template, key_type, key_size), key=lambda obj: obj.value())
+            
+            for obj in objects:
+                if cursor is not None and obj.value() <= cursor:
+                    continue
+                
+                try:
+                    # Read every attribute of the key in one call
+                    attrs = self.session.getAttributeValue(obj, DETAIL_ATTRIBUTES)
+                    row = self._key_detail_fields(attrs)
+                    if key_pool.is_placeholder(row["label"]):
+                        continue
+                    
+                    row["key_size"] = self._read_key_size(obj, row["key_type"])
+                    row["cursor"] = obj.value()
+                    yield row
+                
+                except HSMUnavailableError:
+                    raise
+                except Exception as e:
+                    print(f"Error exporting object {obj}: {e}")
+                    continue
+    
+    def _build_filter_template(self, key_class: str = None, key_type: str = None, label: str = None, key_id: str = None,
+                               key_size: int = None, attributes: dict = None) -> list:
+        """Helper to build a findObjects template from key filters"""
+        template = []
+        
+        if key_class:
+            if key_class == "SECRET_KEY":
+                template.append((PyKCS11.CKA_CLASS, PyKCS11.CKO_SECRET_KEY))
+            elif key_class == "PRIVATE_KEY":
+                template.append((PyKCS11.CKA_CLASS, PyKCS11.CKO_PRIVATE_KEY))
+            elif key_class == "PUBLIC_KEY":
+                template.append((PyKCS11.CKA_CLASS, PyKCS11.CKO_PUBLIC_KEY))
+        
+        if key_type:
+            if key_type == "AES":
+                template.append((PyKCS11.CKA_KEY_TYPE, PyKCS11.CKK_AES))
+            elif key_type == "RSA":
+                template.append((PyKCS11.CKA_KEY_TYPE, PyKCS11.CKK_RSA))
+            elif key_type == "EC":
+                template.append((PyKCS11.CKA_KEY_TYPE, PyKCS11.CKK_EC))
+        
+        if label:
+            template.append((PyKCS11.CKA_LABEL, label))
+        
+        if key_id:
+            id_bytes = bytes.fromhex(key_id)
+            template.append((PyKCS11.CKA_ID, id_bytes))
+        
+        if key_size:
+            # Same units as CreateKeyRequest: bytes for AES, bits for RSA, which never overlap
+            if key_type == "EC":
+                raise ValueError("key_size does not apply to EC keys")
+            if self._filters_by_modulus(key_type, key_size):
+                # Only RSA public keys carry CKA_MODULUS_BITS; _find_keys compares the modulus of both halves
+                if not key_type:
+                    template.append((PyKCS11.CKA_KEY_TYPE, PyKCS11.CKK_RSA))
+            else:
+                template.append((PyKCS11.CKA_VALUE_LEN, key_size))
+        
+        for name, value in (attributes or {}).items():
+            template.append((FLAG_ATTRIBUTES[name], value))
+        
+        return template
+    
+    def _filters_by_modulus(self, key_type: str = None, key_size: int = None) -> bool:
+        """Whether a key_size filter is an RSA size, checked on the modulus after the find"""
+        return bool(key_size) and key_type != "AES" and not (not key_type and key_size in (16, 24, 32))
+    
+    def _find_keys(self, template: list, key_type: str = None, key_size: int = None) -> list:
+        """Helper to find the objects matching a filter template and, for RSA sizes, their modulus length"""
+        objects = self.session.findObjects(template)
+        if self._filters_by_modulus(key_type, key_size):
+            objects = [obj for obj in objects if self._read_key_size(obj, "RSA") == key_size]
+        return objects
+    
+    def _key_detail_fields(self, attrs) -> dict:
+        """Helper to map DETAIL_ATTRIBUTES values to KeyDetailResponse fields"""
+        key_class_str, key_type_str = self._map_class_and_type(attrs[0], attrs[1])
+        
+        return {
+            "key_class": key_class_str,
+            "key_type": key_type_str,
+            "label": self._process_label(attrs[2]),
+            "key_id": self._process_key_id(attrs[3]),
+            "token": bool(attrs[4]),
+            "private": bool(attrs[5]),
+            "sensitive": bool(attrs[6]),
+            "extractable": bool(attrs[7]),
+            "local": bool(attrs[8]),
+            "modifiable": bool(attrs[9]),
+            "destroyable": bool(attrs[10])
+        }
+    
+    def _read_key_size(self, obj, key_type: str) -> Optional[int]:
+        """Helper to read key size, in bits for RSA and bytes for AES like CreateKeyRequest"""
+        if key_type == "AES":
+            value_len = self.session.getAttributeValue(obj, [PyKCS11.CKA_VALUE_LEN])[0]
+            return int(value_len) if value_len else None
+        if key_type == "RSA":
+            modulus = self.session.getAttributeValue(obj, [PyKCS11.CKA_MODULUS])[0]
+            return len(modulus) * 8 if modulus else None
+        return None
+    
+    def _read_curve(self, obj, session=None) -> Optional[str]:
+        """Helper to read the named curve of an EC key; only EC keys have CKA_EC_PARAMS"""
+        params = (session or self.session).getAttributeValue(obj, [PyKCS11.CKA_EC_PARAMS])[0]
+        return curve_name(bytes(params)) if params else None
+    
+    def _read_key_infos(self, objects, skip_errors: bool = True) -> List[Optional[KeyInfo]]:
+        """Helper to read KeyInfo for known handles; unreadable objects are dropped, or None if skip_errors is False"""
+        key_infos = []
+        for obj in objects:
+            try:
+                attrs = self.session.getAttributeValue(obj, [
+                    PyKCS11.CKA_CLASS,
+                    PyKCS11.CKA_KEY_TYPE,
+                    PyKCS11.CKA_LABEL,
+                    PyKCS11.CKA_ID
+                ])
+                key_infos.append(self._create_key_info(attrs, obj))
+            except HSMUnavailableError:
+                raise
+            except Exception as e:
+                print(f"Error reading object {obj}: {e}")
+                if not skip_errors:
+                    key_infos.append(None)
+        return [key for key in key_infos if key or not skip_errors]
+    
+    def _create_key_info(self, attrs, obj=None, session=None) -> Optional[KeyInfo]:
+        """Helper to create KeyInfo from attributes, reading the curve of EC keys when the handle is given"""
         try:
             key_class_str, key_type_str = self._map_class_and_type(attrs[0], attrs[1])
             label_str = self._process_label(attrs[2])
             key_id_str = self._process_key_id(attrs[3])
+            curve = self._read_curve(obj, session) if obj is not None and key_type_str == "EC" else None
             
             return KeyInfo(
                 key_class=key_class_str,
                 key_type=key_type_str,
                 label=label_str,
-                key_id=key_id_str
+                key_id=key_id_str,
+                curve=curve
             )
         except Exception as e:
             print(f"Error creating KeyInfo: {e}")
@@ -288,49 +953,38 @@ class CloudHSMService:
         
     def check_connection(self) -> bool:
         """Check if connection to CloudHSM is established"""
-        session = None
         try: 
-             # Initialize PKCS11
-            self.pkcs11 = PyKCS11.PyKCS11Lib()
-            self.pkcs11.load(self.pkcs11_lib)
+            # Report the degraded state without touching the HSM while the breaker is open
+            circuit_breaker.check()
             
-            # Get slots
-            slots = self.pkcs11.getSlotList(tokenPresent=True)
-            if not slots:
+            # Re-enumerate slots so newly configured HSMs are picked up
+            if not slot_scheduler.slots(refresh=True):
                 return False
             
-            # Open session
-            session = self.pkcs11.openSession(slots[0], PyKCS11.CKF_SERIAL_SESSION | PyKCS11.CKF_RW_SESSION)    
-            return True
+            # Open an unauthenticated session on any usable slot
+            with self._open_session():
+                return True
         
         except Exception as e:
             print(f"Error checking connection: {e}")
             return False
-        finally:
-            if session:
-                session.closeSession()
+    
+    def probe_connection(self) -> bool:
+        """Probe the HSM directly, bypassing the circuit breaker and admission control"""
+        try:
+            if not slot_scheduler.slots(refresh=True):
+                return False
+            
+            with slot_scheduler.session():
+                return True
+        
+        except Exception as e:
+            print(f"HSM health probe failed: {e}")
+            return False
     
     def _map_class_and_type(self, obj_class, key_type):
         """Helper to map PKCS11 constants to strings"""
-        if obj_class == PyKCS11.CKO_SECRET_KEY:
-            key_class_str = "SECRET_KEY"
-        elif obj_class == PyKCS11.CKO_PRIVATE_KEY:
-            key_class_str = "PRIVATE_KEY"
-        elif obj_class == PyKCS11.CKO_PUBLIC_KEY:
-            key_class_str = "PUBLIC_KEY"
-        else:
-            key_class_str = f"UNKNOWN_{obj_class}"
-        
-        if key_type == PyKCS11.CKK_AES:
-            key_type_str = "AES"
-        elif key_type == PyKCS11.CKK_RSA:
-            key_type_str = "RSA"
-        elif key_type == PyKCS11.CKK_EC:
-            key_type_str = "EC"
-        else:
-            key_type_str = f"UNKNOWN_{key_type}"
-        
-        return key_class_str, key_type_str
+        return class_name(obj_class), type_name(key_type)
     
     def _process_label(self, label):
         """Helper to process label attribute"""
@@ -360,56 +1014,71 @@ class CloudHSMService:
         except Exception as e:
             print(f"Error during logout: {e}")
     
-    def create_key(self, username: str, password: str, request: CreateKeyRequest) -> CreateKeyResponse:
-        """Create a new key in CloudHSM"""
+    def create_key(self, username: str, password: str, request: CreateKeyRequest, key_id: bytes = None) -> CreateKeyResponse:
+        """Create a new key in CloudHSM, with key_id as its CKA_ID if given (random for key pairs otherwise)"""
+        if key_pool.is_placeholder(request.label):
+            audit_log.record(username, "create", outcome="failure", label=request.label, detail="Label reserved for the key pool")
+            return CreateKeyResponse(success=False, message=f"Labels starting with {POOL_LABEL_PREFIX} are reserved for the key pool")
+        
         try:
-            # Initialize PKCS11
-            self.pkcs11 = PyKCS11.PyKCS11Lib()
-            self.pkcs11.load(self.pkcs11_lib)
-            
-            # Get slots
-            slots = self.pkcs11.getSlotList(tokenPresent=True)
-            if not slots:
-                return CreateKeyResponse(success=False, message="No HSM slots available")
-            
-            # Open session
-            self.session = self.pkcs11.openSession(slots[0], PyKCS11.CKF_SERIAL_SESSION | PyKCS11.CKF_RW_SESSION)
-            
-            # Login
-            login_pin = f"{username}:{password}"
-            self.session.login(login_pin)
-            
-            # Check if key with same label already exists
-            existing_keys = self.session.findObjects([(PyKCS11.CKA_LABEL, request.label)])
-            if existing_keys:
-                self.session.logout()
-                self.session.closeSession()
+            with self._open_session(username, password):
+                # Check if key with same label already exists
+                existing_keys = self.session.findObjects([(PyKCS11.CKA_LABEL, request.label)])
+                if existing_keys:
+                    audit_log.record(username, "create", outcome="failure", label=request.label, detail="Label already exists")
+                    return CreateKeyResponse(
+                        success=False, 
+                        message=f"KeyWithLabelAlreadyExists: A Key with label {request.label} already exists in HSM, for ease of access we recommend using unique label per key"
+                    )
+                
+                if request.key_class == "SECRET_KEY":
+                    handles = [self._create_secret_key(request, key_id)]
+                elif request.key_class == "PRIVATE_KEY" or request.key_class == "PUBLIC_KEY":
+                    # Serve matching RSA requests from the pre-generated pool when possible
+                    handles = key_pool.take(self.session, username, request, key_id) or self._create_key_pair(request, key_id)
+                else:
+                    return CreateKeyResponse(success=False, message=f"Unsupported key class: {request.key_class}")
+                
+                # Write the new keys through to the change feed and the audit log
+                created = self._read_key_infos(handles)
+                inventory_feed.record_created(username, created)
+                audit_log.record(username, "create", created)
+                
                 return CreateKeyResponse(
-                    success=False, 
-                    message=f"KeyWithLabelAlreadyExists: A Key with label {request.label} already exists in HSM, for ease of access we recommend using unique label per key"
+                    success=True,
+                    message=f"Key '{request.label}' created successfully"
                 )
             
-            if request.key_class == "SECRET_KEY":
-                self._create_secret_key(request)
-            elif request.key_class == "PRIVATE_KEY" or request.key_class == "PUBLIC_KEY":
-                self._create_key_pair(request)
-            else:
-                return CreateKeyResponse(success=False, message=f"Unsupported key class: {request.key_class}")
-            
-            # Logout and close
-            self.session.logout()
-            self.session.closeSession()
-            
-            return CreateKeyResponse(
-                success=True,
-                message=f"Key '{request.label}' created successfully"
-            )
-            
+        except HSMUnavailableError:
+            raise
         except Exception as e:
+            audit_log.record(username, "create", outcome="failure", label=request.label, detail=str(e))
             return CreateKeyResponse(success=False, message=f"Error creating key: {str(e)}")
     
-    def _create_secret_key(self, request: CreateKeyRequest):
-        """Create a secret key (AES)"""
+    def recover_created_key(self, username: str, password: str, request: CreateKeyRequest, key_id: bytes) -> Optional[CreateKeyResponse]:
+        """Find the key an interrupted create_key call generated under key_id and record it like create_key would; None if there is none"""
+        if request.key_class == "SECRET_KEY":
+            templates = [[(PyKCS11.CKA_CLASS, PyKCS11.CKO_SECRET_KEY), (PyKCS11.CKA_LABEL, request.label)]]
+        else:
+            templates = [[(PyKCS11.CKA_CLASS, PyKCS11.CKO_PRIVATE_KEY), (PyKCS11.CKA_LABEL, request.label)],
+                         [(PyKCS11.CKA_CLASS, PyKCS11.CKO_PUBLIC_KEY), (PyKCS11.CKA_LABEL, f"{request.label}-public")]]
+        
+        # The random ID tells the attempt's key apart from another key that was given the label since
+        with self._open_session(username, password):
+            handles = [obj for template in templates
+                       for obj in self.session.findObjects(template + [(PyKCS11.CKA_KEY_TYPE, KEY_TYPES[request.key_type.value]),
+                                                                       (PyKCS11.CKA_ID, key_id)])]
+            if not handles:
+                return None
+            created = self._read_key_infos(handles)
+        
+        # The interrupted request may have died before it got to the change feed and audit log
+        inventory_feed.record_created(username, created)
+        audit_log.record(username, "create", created, detail="Recovered after an interrupted request")
+        return CreateKeyResponse(success=True, message=f"Key '{request.label}' created successfully")
+    
+    def _create_secret_key(self, request: CreateKeyRequest, key_id: bytes = None):
+        """Create a secret key (AES), with key_id as its CKA_ID if given, and return its handle"""
         template = [
             (PyKCS11.CKA_CLASS, PyKCS11.CKO_SECRET_KEY),
             (PyKCS11.CKA_LABEL, request.label),
@@ -418,6 +1087,8 @@ class CloudHSMService:
             (PyKCS11.CKA_SENSITIVE, request.sensitive),
             (PyKCS11.CKA_EXTRACTABLE, request.extractable),
         ]
+        if key_id is not None:
+            template.append((PyKCS11.CKA_ID, key_id))
         
         if request.key_type == "AES":
             template.append((PyKCS11.CKA_KEY_TYPE, PyKCS11.CKK_AES))
@@ -430,13 +1101,12 @@ class CloudHSMService:
                 template.append((PyKCS11.CKA_DECRYPT, request.decrypt))
             
             mechanism = PyKCS11.Mechanism(PyKCS11.CKM_AES_KEY_GEN, None)
-            self.session.generateKey(template, mecha=mechanism)
-            return
+            return self.session.generateKey(template, mecha=mechanism)
         
         raise ValueError(f"Unsupported secret key type: {request.key_type}")
     
-    def _create_key_pair(self, request: CreateKeyRequest):
-        """Create a key pair (RSA/EC)"""
+    def _create_key_pair(self, request: CreateKeyRequest, key_id: bytes = None):
+        """Create a key pair (RSA/EC) sharing one CKA_ID, random unless given, and return the (public, private) handles"""
         if request.key_type == "RSA":
             key_size = request.key_size or 2048
             
@@ -448,111 +1118,248 @@ class CloudHSMService:
                 (PyKCS11.CKA_LABEL, f"{request.label}-public"),
                 (PyKCS11.CKA_TOKEN, request.token),
             ]
+            mechanism = PyKCS11.Mechanism(PyKCS11.CKM_RSA_PKCS_KEY_PAIR_GEN, None)
+        elif request.key_type == "EC":
+            # EC keys sign and derive; they cannot encrypt or decrypt
+            if request.encrypt or request.decrypt:
+                raise ValueError("EC keys cannot be used to encrypt or decrypt")
+            curve = request.curve.value if request.curve else "P-256"
             
-            private_template = [
-                (PyKCS11.CKA_CLASS, PyKCS11.CKO_PRIVATE_KEY),
-                (PyKCS11.CKA_KEY_TYPE, PyKCS11.CKK_RSA),
-                (PyKCS11.CKA_LABEL, request.label),
+            public_template = [
+                (PyKCS11.CKA_CLASS, PyKCS11.CKO_PUBLIC_KEY),
+                (PyKCS11.CKA_KEY_TYPE, PyKCS11.CKK_EC),
+                (PyKCS11.CKA_EC_PARAMS, EC_CURVES[curve]),
+                (PyKCS11.CKA_LABEL, f"{request.label}-public"),
                 (PyKCS11.CKA_TOKEN, request.token),
-                (PyKCS11.CKA_PRIVATE, request.private),
-                (PyKCS11.CKA_SENSITIVE, request.sensitive),
-                (PyKCS11.CKA_EXTRACTABLE, request.extractable),
             ]
+            mechanism = PyKCS11.Mechanism(PyKCS11.CKM_EC_KEY_PAIR_GEN, None)
+        else:
+            raise ValueError(f"Unsupported key pair type: {request.key_type}")
+        
+        private_template = [
+            (PyKCS11.CKA_CLASS, PyKCS11.CKO_PRIVATE_KEY),
+            (PyKCS11.CKA_KEY_TYPE, KEY_TYPES[request.key_type.value]),
+            (PyKCS11.CKA_LABEL, request.label),
+            (PyKCS11.CKA_TOKEN, request.token),
+            (PyKCS11.CKA_PRIVATE, request.private),
+            (PyKCS11.CKA_SENSITIVE, request.sensitive),
+            (PyKCS11.CKA_EXTRACTABLE, request.extractable),
+        ]
+        
+        if request.encrypt is not None:
+            public_template.append((PyKCS11.CKA_ENCRYPT, request.encrypt))
+        if request.verify is not None:
+            public_template.append((PyKCS11.CKA_VERIFY, request.verify))
+        if request.decrypt is not None:
+            private_template.append((PyKCS11.CKA_DECRYPT, request.decrypt))
+        if request.sign is not None:
+            private_template.append((PyKCS11.CKA_SIGN, request.sign))
+        # Both halves carry the ID, so the pair can be found together and exported by /keys/public/{key_id}
+        key_id = key_id or os.urandom(16)
+        public_template.append((PyKCS11.CKA_ID, key_id))
+        private_template.append((PyKCS11.CKA_ID, key_id))
+        
+        return self.session.generateKeyPair(
+            public_template,
+            private_template,
+            mecha=mechanism
+        )
+    
+    def replenish_key_pool(self, username: str, password: str):
+        """Generate placeholder RSA pairs until each pool of the user reaches its target"""
+        try:
+            with self._open_session(username, password, priority=BULK):
+                for key_size in key_pool.key_sizes:
+                    for profile in key_pool.profiles:
+                        request = key_pool.profile_request(key_size, profile)
+                        # Recount from the token every cycle; pairs may have been claimed or lost since the last one
+                        level = self._count_pool_pairs(request.label)
+                        
+                        # Bound the work per cycle so refills do not monopolize the HSM
+                        missing = min(key_pool.target - level, key_pool.refill_batch)
+                        for _ in range(max(missing, 0)):
+                            self._create_key_pair(request)
+                            key_pool.record_refill()
+                            level += 1
+                        
+                        key_pool.record_level(username, key_size, profile, level)
             
-            if request.encrypt is not None:
-                public_template.append((PyKCS11.CKA_ENCRYPT, request.encrypt))
-            if request.verify is not None:
-                public_template.append((PyKCS11.CKA_VERIFY, request.verify))
-            if request.decrypt is not None:
-                private_template.append((PyKCS11.CKA_DECRYPT, request.decrypt))
-            if request.sign is not None:
-                private_template.append((PyKCS11.CKA_SIGN, request.sign))
-            
-            mechanism = PyKCS11.Mechanism(PyKCS11.CKM_RSA_PKCS_KEY_PAIR_GEN, None)
-            self.session.generateKeyPair(
-                public_template,
-                private_template,
-                mecha=mechanism
-            )
-            return
+        except Exception as e:
+            print(f"Error replenishing key pool: {e}")
+    
+    def _count_pool_pairs(self, label: str) -> int:
+        """Helper to count the placeholder pairs whose halves are both on the token; an orphaned half cannot be claimed"""
+        def pair_ids(key_class: int, key_label: str) -> set:
+            return {
+                bytes(self.session.getAttributeValue(obj, [PyKCS11.CKA_ID])[0] or b"")
+                for obj in self.session.findObjects([(PyKCS11.CKA_CLASS, key_class), (PyKCS11.CKA_LABEL, key_label)])
+            }
         
-        raise ValueError(f"Unsupported key pair type: {request.key_type}")
+        return len((pair_ids(PyKCS11.CKO_PRIVATE_KEY, label) & pair_ids(PyKCS11.CKO_PUBLIC_KEY, f"{label}-public")) - {b""})
     
     def delete_key(self, username: str, password: str, request: DeleteKeyRequest) -> DeleteKeyResponse:
         """Delete key(s) from CloudHSM"""
         try:
-            # Initialize PKCS11
-            self.pkcs11 = PyKCS11.PyKCS11Lib()
-            self.pkcs11.load(self.pkcs11_lib)
-            
-            # Get slots
-            slots = self.pkcs11.getSlotList(tokenPresent=True)
-            if not slots:
-                return DeleteKeyResponse(success=False, message="No HSM slots available")
-            
-            # Open session
-            self.session = self.pkcs11.openSession(slots[0], PyKCS11.CKF_SERIAL_SESSION | PyKCS11.CKF_RW_SESSION)
-            
-            # Login
-            login_pin = f"{username}:{password}"
-            self.session.login(login_pin)
-            
-            # Build filter template
-            template = []
-            
-            if request.key_class:
-                if request.key_class == "SECRET_KEY":
-                    template.append((PyKCS11.CKA_CLASS, PyKCS11.CKO_SECRET_KEY))
-                elif request.key_class == "PRIVATE_KEY":
-                    template.append((PyKCS11.CKA_CLASS, PyKCS11.CKO_PRIVATE_KEY))
-                elif request.key_class == "PUBLIC_KEY":
-                    template.append((PyKCS11.CKA_CLASS, PyKCS11.CKO_PUBLIC_KEY))
-            
-            if request.key_type:
-                if request.key_type == "AES":
-                    template.append((PyKCS11.CKA_KEY_TYPE, PyKCS11.CKK_AES))
-                elif request.key_type == "RSA":
-                    template.append((PyKCS11.CKA_KEY_TYPE, PyKCS11.CKK_RSA))
-                elif request.key_type == "EC":
-                    template.append((PyKCS11.CKA_KEY_TYPE, PyKCS11.CKK_EC))
-            
-            if request.label:
-                template.append((PyKCS11.CKA_LABEL, request.label))
-            
-            if request.key_id:
-                id_bytes = bytes.fromhex(request.key_id)
-                template.append((PyKCS11.CKA_ID, id_bytes))
-            
-            # Find objects to delete
-            objects = self.session.findObjects(template)
-            
-            if not objects:
-                self.session.logout()
-                self.session.closeSession()
-                return DeleteKeyResponse(success=False, message="No matching keys found")
-            
-            # Delete all matching objects
-            deleted_count = 0
-            for obj in objects:
+            with self._open_session(username, password):
+                # Build filter template
+                template = self._build_filter_template(request.key_class, request.key_type, request.label, request.key_id)
+                
+                # Find objects to delete
+                objects = self.session.findObjects(template)
+                
+                # Read what is being deleted for the change feed; key pool stock is not the user's to delete
+                key_infos = {
+                    obj: key for obj, key in zip(objects, self._read_key_infos(objects, skip_errors=False))
+                    if not (key and key_pool.is_placeholder(key.label))
+                }
+                objects = list(key_infos)
+                
+                if not objects:
+                    audit_log.record(username, "delete", outcome="failure", label=request.label, detail="No matching keys found")
+                    return DeleteKeyResponse(success=False, message="No matching keys found")
+                
+                # Delete all matching objects
+                deleted = []
                 try:
-                    self.session.destroyObject(obj)
-                    deleted_count += 1
-                except Exception as e:
-                    print(f"Error deleting object {obj}: {e}")
-            
-            # Logout and close
-            self.session.logout()
-            self.session.closeSession()
-            
-            return DeleteKeyResponse(
-                success=True,
-                message=f"Successfully deleted {deleted_count} key(s)",
-                deleted_count=deleted_count
-            )
+                    for obj in objects:
+                        try:
+                            self.session.destroyObject(obj)
+                            deleted.append(key_infos[obj])
+                        except HSMUnavailableError:
+                            raise
+                        except Exception as e:
+                            print(f"Error deleting object {obj}: {e}")
+                finally:
+                    # The HSM may hand destroyed handles out again for new objects
+                    key_handle_cache.discard_handles(self.session.slot, objects)
+                    key_handle_cache.discard_keys([key.label for key in key_infos.values() if key and key.label],
+                                                  [key.key_id for key in key_infos.values() if key and key.key_id])
+                    # A deleted key's ID may be reused for a new pair
+                    public_key_cache.discard(key.key_id for key in key_infos.values() if key and key.key_id)
+                
+                deleted_count = len(deleted)
+                inventory_feed.record_deleted(username, [key for key in deleted if key])
+                audit_log.record(username, "delete", [key for key in deleted if key])
+                
+                return DeleteKeyResponse(
+                    success=True,
+                    message=f"Successfully deleted {deleted_count} key(s)",
+                    deleted_count=deleted_count
+                )
             
+        except HSMUnavailableError:
+            raise
         except Exception as e:
+            audit_log.record(username, "delete", outcome="failure", label=request.label, detail=str(e))
             return DeleteKeyResponse(success=False, message=f"Error deleting key: {str(e)}")
     
+    def modify_keys(self, username: str, password: str, request: ModifyKeysRequest) -> ModifyKeysResponse:
+        """Set label, ID or usage flags on every key matching any selector, with the writes spread over parallel sessions"""
+        changes = request.attribute_changes()
+        if not changes:
+            raise ValueError("No attribute changes requested")
+        # An empty selector would match the whole partition
+        if not request.selectors or not all(selector.model_dump(exclude_none=True) for selector in request.selectors):
+            raise ValueError("At least one selector is required and every selector needs a criterion")
+        # A key renamed into the pool would be handed out to the next matching create
+        if key_pool.is_placeholder(changes.get("label")):
+            raise ValueError(f"Labels starting with {POOL_LABEL_PREFIX} are reserved for the key pool")
+        try:
+            new_id = bytes.fromhex(changes["key_id"]) if "key_id" in changes else None
+            for selector in request.selectors:
+                if selector.key_id:
+                    bytes.fromhex(selector.key_id)
+        except ValueError:
+            raise ValueError("Key IDs must be hexadecimal")
+        
+        # Resolve every target up front on one session; a key matched by several selectors is modified once
+        targets = []
+        with self._open_session(username, password):
+            objects = {}
+            for selector in request.selectors:
+                template = self._build_filter_template(selector.key_class, selector.key_type, selector.label, selector.key_id,
+                                                       selector.key_size, selector.attribute_filters())
+                for obj in self._find_keys(template, selector.key_type, selector.key_size):
+                    objects.setdefault(obj.value(), obj)
+            
+            for obj in objects.values():
+                try:
+                    attrs = self.session.getAttributeValue(obj, [
+                        PyKCS11.CKA_CLASS,
+                        PyKCS11.CKA_KEY_TYPE,
+                        PyKCS11.CKA_LABEL,
+                        PyKCS11.CKA_ID,
+                        PyKCS11.CKA_MODIFIABLE
+                    ])
+                except HSMUnavailableError:
+                    raise
+                except Exception as e:
+                    print(f"Error reading object {obj}: {e}")
+                    continue
+                key_info = self._create_key_info(attrs[:4], obj)
+                if key_info and not key_pool.is_placeholder(key_info.label):
+                    targets.append((obj, attrs[0], key_info, bool(attrs[4])))
+            # The handles are only valid on this slot
+            slot = self.session.slot
+        
+        results = {}
+        items = []
+        for index, (obj, key_class, key_info, modifiable) in enumerate(targets):
+            if not modifiable:
+                results[index] = {"error": "Key is not modifiable (CKA_MODIFIABLE is false)"}
+                continue
+            template = [
+                (MODIFY_ATTRIBUTES[name], new_id if name == "key_id" else value)
+                for name, value in changes.items()
+                if name in ("label", "key_id") or name in ARCHIVE_ATTRIBUTES.get(key_class, {})
+            ]
+            if not template:
+                results[index] = {"error": f"None of the requested attributes apply to {key_info.key_class} keys"}
+                continue
+            items.append((index, (obj, template)))
+        
+        def modify(session, key, item) -> dict:
+            obj, template = item
+            try:
+                session.setAttributeValue(obj, template)
+            except PyKCS11.PyKCS11Error as e:
+                # Deleted since it was resolved; must not abort the rest of the chunk like a stale signing key would
+                if e.value in HANDLE_ERRORS:
+                    return {"error": "Key no longer exists"}
+                raise
+            return {}
+        
+        results.update(self._run_batch(username, password, slot, None, items, modify))
+        
+        modified = [targets[index] for index in range(len(targets)) if not results[index].get("error")]
+        if modified:
+            # Cached handles were found by label, ID and usage templates the keys may no longer match
+            key_handle_cache.discard_handles(slot, [obj for obj, _, _, _ in modified])
+            key_handle_cache.discard_keys([key_info.label for _, _, key_info, _ in modified if key_info.label],
+                                          [key_info.key_id for _, _, key_info, _ in modified if key_info.key_id])
+            if "label" in changes or "key_id" in changes:
+                before = [key_info for _, _, key_info, _ in modified]
+                after = [key_info.model_copy(update={name: changes[name].lower() if name == "key_id" else changes[name]
+                                                     for name in ("label", "key_id") if name in changes})
+                         for key_info in before]
+                if "key_id" in changes:
+                    public_key_cache.discard([key.key_id for key in before if key.key_id] + [changes["key_id"].lower()])
+                inventory_feed.record_deleted(username, before)
+                inventory_feed.record_created(username, after)
+            audit_log.record(username, "modify", [key_info for _, _, key_info, _ in modified], detail=f"Set {', '.join(changes)}")
+        for index, (_, _, key_info, _) in enumerate(targets):
+            if results[index].get("error"):
+                audit_log.record(username, "modify", [key_info], outcome="failure", detail=results[index]["error"])
+        
+        failed = len(targets) - len(modified)
+        return ModifyKeysResponse(
+            results=[ModifyKeyResult(key=key_info, modified=not results[index].get("error"), error=results[index].get("error"))
+                     for index, (_, _, key_info, _) in enumerate(targets)],
+            matched=len(targets),
+            modified=len(modified),
+            failed=failed
+        )
+    
     def __del__(self):
         """Cleanup session on object destruction"""
         self.logout()
\ No newline at end of file
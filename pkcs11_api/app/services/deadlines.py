@@ -0,0 +1,71 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import PyKCS11
+from app.services.call_recorder import count_call
+from app.services.circuit_breaker import circuit_breaker, CONNECTION_ERRORS
+from app.services.errors import DeadlineExceededError
+
+DEFAULT_DEADLINE = float(os.getenv("HSM_DEADLINE_DEFAULT", "10"))
+CONNECT_DEADLINE = float(os.getenv("HSM_DEADLINE_CONNECT", "5"))
+KEYGEN_DEADLINE = float(os.getenv("HSM_DEADLINE_KEYGEN", "120"))
+
+# Seconds each PKCS#11 call may take before the request gives up on it
+OPERATION_DEADLINES = {
+    "getSlotList": CONNECT_DEADLINE,
+    "getTokenInfo": CONNECT_DEADLINE,
+    "openSession": CONNECT_DEADLINE,
+    "closeSession": CONNECT_DEADLINE,
+    "login": CONNECT_DEADLINE,
+    "logout": CONNECT_DEADLINE,
+    "generateKey": KEYGEN_DEADLINE,
+    "generateKeyPair": KEYGEN_DEADLINE,
+}
+
+# Calls the client library may answer locally while the HSM is unreachable, so they never reset the breaker
+LOCAL_OPERATIONS = {"getSlotList", "getTokenInfo", "openSession", "logout", "closeSession"}
+
+# PKCS#11 calls run here so a hung client library only ties up a worker, never the request
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("HSM_CALL_THREADS", "64")), thread_name_prefix="pkcs11")
+
+
+def call_with_deadline(operation: str, fn, *args, **kwargs):
+    """Run one PKCS#11 call under its deadline and feed the outcome to the circuit breaker"""
+    deadline = OPERATION_DEADLINES.get(operation, DEFAULT_DEADLINE)
+    future = _executor.submit(fn, *args, **kwargs)
+    result = None
+    try:
+        result = future.result(timeout=deadline)
+    except TimeoutError:
+        error = DeadlineExceededError(f"PKCS#11 {operation} did not complete within {deadline:g}s",
+                                      retry_after=circuit_breaker.probe_interval)
+        circuit_breaker.record_failure(error)
+        raise error
+    except PyKCS11.PyKCS11Error as e:
+        if e.value in CONNECTION_ERRORS:
+            circuit_breaker.record_failure(e)
+        elif operation not in LOCAL_OPERATIONS:
+            circuit_breaker.record_success()
+        raise
+    finally:
+        count_call(operation, result)
+    if operation not in LOCAL_OPERATIONS:
+        circuit_breaker.record_success()
+    return result
+
+
+class DeadlineSession:
+    """Session proxy that puts every PyKCS11 session call under its operation deadline"""
+
+    def __init__(self, session, slot: int = None):
+        self._session = session
+        # Object handles are only valid on the slot they were found on
+        self.slot = slot
+
+    def __getattr__(self, name):
+        attr = getattr(self._session, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return call_with_deadline(name, attr, *args, **kwargs)
+        return call
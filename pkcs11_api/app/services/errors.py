@@ -0,0 +1,26 @@
+class HSMUnavailableError(Exception):
+    """The HSM cannot take the request right now; callers should retry later"""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = max(int(retry_after), 1)
+
+
+class AdmissionTimeoutError(HSMUnavailableError):
+    """Waited longer than the request deadline for a free HSM session"""
+
+
+class CircuitOpenError(HSMUnavailableError):
+    """Recent PKCS#11 calls kept failing to reach the HSM, so new ones fail fast"""
+
+
+class DeadlineExceededError(HSMUnavailableError):
+    """A PKCS#11 call did not complete within its deadline"""
+
+
+class IdempotencyInProgressError(HSMUnavailableError):
+    """The original request with this Idempotency-Key is still running"""
+
+
+class IdempotencyKeyReusedError(Exception):
+    """An Idempotency-Key was sent again with a different request"""
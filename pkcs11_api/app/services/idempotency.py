@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Optional, Tuple
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from app.models.database import IdempotencyRecord, SessionLocal
+from app.services.errors import IdempotencyInProgressError, IdempotencyKeyReusedError
+
+MAX_KEY_LENGTH = 255
+
+# status_code of the marker stored before an action runs, until its outcome replaces it, and of
+# one whose action raised
+IN_FLIGHT = 0
+INTERRUPTED = -1
+
+
+def fingerprint(operation: str, payload) -> str:
+    """Digest of what a request asked for, so a key reused for a different request is caught"""
+    body = payload if isinstance(payload, bytes) else json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(operation.encode() + b"\0" + body).hexdigest()
+
+
+class IdempotencyStore:
+    """Stores the outcome of create/delete/modify/bulk requests by Idempotency-Key so retries replay it instead of redoing the work"""
+
+    def __init__(self):
+        self.ttl = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+        self.max_keys = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+        # How long a duplicate waits for the original request before it is told to retry later
+        self.wait_timeout = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "300"))
+        # How long an in-flight marker of another process is trusted before a retry takes it over
+        self.lease = float(os.getenv("IDEMPOTENCY_LEASE", "300"))
+
+        self._lock = threading.Lock()
+        self._running = {}  # (username, key) -> (fingerprint, event set when the original finishes)
+        self._replays = 0
+        self._waits = 0
+        self._recoveries = 0
+
+    def execute(self, username: str, key: Optional[str], operation: str, request_fingerprint: str,
+                action: Callable[[], Tuple[int, dict]],
+                recover: Optional[Callable[[], Optional[Tuple[int, dict]]]] = None,
+                marker: Optional[dict] = None) -> Tuple[int, dict, bool]:
+        """Run action once per key and return (status_code, body, replayed)
+
+        Outcomes the action returns are stored; exceptions are not, so a retry after e.g. an
+        unavailable HSM runs the action again. Before the action runs the key is claimed with an
+        in-flight marker in the database, so workers of other processes see it too; marker holds
+        what a retry needs to find the attempt's work again (e.g. the CKA_ID of the key a create
+        generates). A retry that finds the marker of an attempt that raised, or whose worker has
+        not finished it within IDEMPOTENCY_LEASE, gets the stored marker values in place and first
+        calls recover(), which returns the outcome the attempt had or None to run the action again.
+        """
+        if not key:
+            status_code, body = action()
+            return status_code, body, False
+
+        marker = marker if marker is not None else {}
+        while True:
+            with self._lock:
+                running = self._running.get((username, key))
+                if running is None:
+                    stored = self._load(username, key)
+                    if stored is None or stored.status_code in (IN_FLIGHT, INTERRUPTED):
+                        if stored is not None and stored.fingerprint != request_fingerprint:
+                            raise IdempotencyKeyReusedError("Idempotency-Key was already used for a different request")
+                        if stored is not None and stored.status_code == IN_FLIGHT and \
+                                stored.created_at > datetime.utcnow() - timedelta(seconds=self.lease):
+                            # Claimed by a worker of another process that is still on it
+                            raise IdempotencyInProgressError("A request with this Idempotency-Key is still in progress", retry_after=5)
+                        interrupted = stored is not None
+                        if interrupted:
+                            # Carry on with what the interrupted attempt used
+                            marker.clear()
+                            marker.update(json.loads(stored.response) or {})
+                        if not self._claim(username, key, operation, request_fingerprint, marker, stored):
+                            # Another worker claimed it first; look again
+                            continue
+                        done = threading.Event()
+                        self._running[(username, key)] = (request_fingerprint, done)
+                        break
+                elif running[0] != request_fingerprint:
+                    raise IdempotencyKeyReusedError("Idempotency-Key was already used for a different request")
+
+            if running is None:
+                if stored.fingerprint != request_fingerprint:
+                    raise IdempotencyKeyReusedError("Idempotency-Key was already used for a different request")
+                with self._lock:
+                    self._replays += 1
+                return stored.status_code, json.loads(stored.response), True
+
+            # Same request still in flight; wait for its outcome, or run it ourselves if it failed
+            with self._lock:
+                self._waits += 1
+            if not running[1].wait(self.wait_timeout):
+                raise IdempotencyInProgressError("A request with this Idempotency-Key is still in progress", retry_after=5)
+
+        try:
+            outcome = None
+            if interrupted and recover:
+                outcome = recover()
+                if outcome is not None:
+                    with self._lock:
+                        self._recoveries += 1
+            status_code, body = outcome or action()
+            self._store(username, key, operation, request_fingerprint, status_code, body)
+            return status_code, body, False
+        except BaseException:
+            # Keep the marker so the next retry recovers instead of starting from scratch
+            self._interrupt(username, key)
+            raise
+        finally:
+            with self._lock:
+                self._running.pop((username, key), None)
+            done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"in_progress": len(self._running), "replays": self._replays, "waits": self._waits,
+                    "recoveries": self._recoveries}
+
+    def _load(self, username: str, key: str) -> Optional[IdempotencyRecord]:
+        db = SessionLocal()
+        try:
+            record = db.get(IdempotencyRecord, (username, key))
+            if record and record.created_at < datetime.utcnow() - timedelta(seconds=self.ttl):
+                return None
+            return record
+        finally:
+            db.close()
+
+    def _claim(self, username: str, key: str, operation: str, request_fingerprint: str, marker: dict,
+               stored: Optional[IdempotencyRecord]) -> bool:
+        """Insert the in-flight marker, or take over the interrupted one that was loaded; False if another worker got there first"""
+        now = datetime.utcnow()
+        values = dict(operation=operation, fingerprint=request_fingerprint, status_code=IN_FLIGHT,
+                      response=json.dumps(marker, default=str), created_at=now)
+        db = SessionLocal()
+        try:
+            if stored is None:
+                # An expired record still holds the key until pruned
+                db.execute(delete(IdempotencyRecord).where(
+                    IdempotencyRecord.username == username, IdempotencyRecord.key == key,
+                    IdempotencyRecord.created_at < now - timedelta(seconds=self.ttl)))
+                db.execute(insert(IdempotencyRecord).values(username=username, key=key, **values))
+            else:
+                # Only the marker as it was loaded is taken over, so one retry wins
+                result = db.execute(update(IdempotencyRecord).where(
+                    IdempotencyRecord.username == username, IdempotencyRecord.key == key,
+                    IdempotencyRecord.status_code == stored.status_code,
+                    IdempotencyRecord.created_at == stored.created_at).values(**values))
+                if result.rowcount != 1:
+                    db.rollback()
+                    return False
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def _interrupt(self, username: str, key: str):
+        db = SessionLocal()
+        try:
+            db.execute(update(IdempotencyRecord).where(
+                IdempotencyRecord.username == username, IdempotencyRecord.key == key,
+                IdempotencyRecord.status_code == IN_FLIGHT).values(status_code=INTERRUPTED))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Error marking idempotency key {key} interrupted: {e}")
+        finally:
+            db.close()
+
+    def _store(self, username: str, key: str, operation: str, request_fingerprint: str, status_code: int, body: dict):
+        db = SessionLocal()
+        try:
+            db.merge(IdempotencyRecord(
+                username=username, key=key, operation=operation, fingerprint=request_fingerprint,
+                status_code=status_code, response=json.dumps(body, default=str), created_at=datetime.utcnow()
+            ))
+            db.flush()
+            # Keep the table bounded: drop expired keys, then the oldest beyond IDEMPOTENCY_MAX_KEYS
+            db.execute(delete(IdempotencyRecord).where(
+                IdempotencyRecord.created_at < datetime.utcnow() - timedelta(seconds=self.ttl)))
+            excess = db.scalar(select(func.count()).select_from(IdempotencyRecord)) - self.max_keys
+            if excess > 0:
+                oldest = select(IdempotencyRecord.created_at).order_by(IdempotencyRecord.created_at).offset(excess - 1).limit(1)
+                db.execute(delete(IdempotencyRecord).where(IdempotencyRecord.created_at <= oldest.scalar_subquery()))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Error storing idempotency key {key}: {e}")
+        finally:
+            db.close()
+
+
+idempotency_store = IdempotencyStore()
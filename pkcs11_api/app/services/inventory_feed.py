@@ -0,0 +1,248 @@
+import hashlib
+import os
+import threading
+import uuid
+from collections import deque
+from typing import Callable, Iterable, List, Optional, Tuple
+from app.models.database import SessionLocal
+from app.models.keys import KeyInfo
+from app.services.admission_controller import BULK
+from app.services.session_service import SessionService
+
+
+def fingerprint(key: KeyInfo) -> int:
+    """64-bit fingerprint of the identifying attributes of a key"""
+    identity = f"{key.key_class}|{key.key_type}|{key.label or ''}|{key.key_id or ''}"
+    return int.from_bytes(hashlib.blake2b(identity.encode(), digest_size=8).digest(), "big")
+
+
+class _UserFeed:
+    """Current fingerprint set of one user plus the recent generations of changes"""
+
+    def __init__(self, history: int):
+        self.generation = 0
+        self.current = set()
+        self.records = {}  # fingerprint -> KeyInfo, for current keys and removals still in history
+        self.changes = deque(maxlen=history)  # (generation, added, removed)
+
+    def apply(self, added: set, removed: set, keys: dict) -> Tuple[List[KeyInfo], List[KeyInfo]]:
+        """Advance one generation with the given fingerprint delta and return the keys it added and removed"""
+        if not added and not removed:
+            return [], []
+        removed_keys = [self.records[fp] for fp in removed]
+        self.generation += 1
+        self.current |= added
+        self.current -= removed
+        self.records.update({fp: keys[fp] for fp in added})
+
+        evicted = self.changes[0] if len(self.changes) == self.changes.maxlen else None
+        self.changes.append((self.generation, frozenset(added), frozenset(removed)))
+
+        # Drop records of removed keys no longer referenced by the retained history
+        if evicted:
+            referenced = set().union(*(r for _, _, r in self.changes))
+            for fp in evicted[2] - referenced - self.current:
+                self.records.pop(fp, None)
+
+        return [keys[fp] for fp in added], removed_keys
+
+    def since(self, generation: int) -> Optional[Tuple[List[KeyInfo], List[KeyInfo]]]:
+        """Net keys added and removed after the given generation, None if it fell out of history"""
+        if generation > self.generation:
+            return None
+        if generation < self.generation and (not self.changes or self.changes[0][0] > generation + 1):
+            return None
+
+        net = {}  # fingerprint -> +1 added, -1 removed
+        for change_generation, added, removed in self.changes:
+            if change_generation <= generation:
+                continue
+            for fp in added:
+                if net.get(fp) == -1:
+                    del net[fp]
+                else:
+                    net[fp] = 1
+            for fp in removed:
+                if net.get(fp) == 1:
+                    del net[fp]
+                else:
+                    net[fp] = -1
+
+        added = [self.records[fp] for fp, change in net.items() if change == 1]
+        removed = [self.records[fp] for fp, change in net.items() if change == -1]
+        return added, removed
+
+
+class InventoryFeed:
+    """Per-user change feed over key inventory snapshots and create/delete write-through events"""
+
+    def __init__(self):
+        self.history = int(os.getenv("INVENTORY_FEED_HISTORY", "64"))
+        self.snapshot_interval = float(os.getenv("INVENTORY_SNAPSHOT_INTERVAL", "300"))
+        # Tokens from a previous process can never be resumed
+        self.epoch = uuid.uuid4().hex[:8]
+
+        self._lock = threading.Lock()
+        self._feeds = {}  # username -> _UserFeed
+        self._unverified = set()   # users whose feed was restored from disk and not enumerated since
+        self._revalidating = set()
+        self._listeners = []
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _token(self, feed: _UserFeed) -> str:
+        return f"{self.epoch}.{feed.generation}"
+
+    def add_listener(self, listener: Callable[[str, List[KeyInfo], List[KeyInfo]], None]):
+        """Call listener(username, added, removed) for every applied change, in generation order"""
+        self._listeners.append(listener)
+
+    def _apply(self, username: str, feed: _UserFeed, added: set, removed: set, keys: dict):
+        added_keys, removed_keys = feed.apply(added, removed, keys)
+        if added_keys or removed_keys:
+            for listener in self._listeners:
+                try:
+                    listener(username, added_keys, removed_keys)
+                except Exception as e:
+                    print(f"Error notifying inventory listener: {e}")
+
+    def generation(self, username: str) -> Optional[int]:
+        """Current generation, taken before an enumeration starts"""
+        with self._lock:
+            feed = self._feeds.get(username)
+            return feed.generation if feed else None
+
+    def observe(self, username: str, keys: Iterable[KeyInfo], started_at: Optional[int]) -> str:
+        """Record a full enumeration as a snapshot and return the sync token for it"""
+        snapshot = {fingerprint(key): key for key in keys}
+
+        with self._lock:
+            feed = self._feeds.get(username)
+            if feed is None:
+                feed = self._feeds[username] = _UserFeed(self.history)
+                self._apply(username, feed, set(snapshot), set(), snapshot)
+            elif feed.generation == started_at:
+                self._apply(username, feed, set(snapshot) - feed.current, feed.current - set(snapshot), snapshot)
+            # Otherwise a write-through event raced the enumeration; it already describes the change
+            self._unverified.discard(username)
+            return self._token(feed)
+
+    def restore(self, username: str, keys: Iterable[KeyInfo]):
+        """Seed a user's feed from a persisted inventory snapshot until a live enumeration confirms it"""
+        snapshot = {fingerprint(key): key for key in keys}
+        with self._lock:
+            if username in self._feeds:
+                return
+            feed = self._feeds[username] = _UserFeed(self.history)
+            self._apply(username, feed, set(snapshot), set(), snapshot)
+            self._unverified.add(username)
+
+    def is_unverified(self, username: str) -> bool:
+        """Whether the user's feed was restored from disk and not enumerated since"""
+        with self._lock:
+            return username in self._unverified
+
+    def unverified_keys(self, username: str) -> Optional[Tuple[List[KeyInfo], str]]:
+        """Restored keys and their sync token while the user's feed still awaits revalidation"""
+        with self._lock:
+            if username not in self._unverified:
+                return None
+            feed = self._feeds[username]
+            return [feed.records[fp] for fp in feed.current], self._token(feed)
+
+    def revalidate(self, username: str, password: str):
+        """Enumerate a user's keys in the background; differences to the restored snapshot go out as changes"""
+        with self._lock:
+            if username in self._revalidating:
+                return
+            self._revalidating.add(username)
+        threading.Thread(target=self._revalidate, args=(username, password), name="inventory-revalidate", daemon=True).start()
+
+    def _revalidate(self, username: str, password: str):
+        from app.services.cloudhsm_service import CloudHSMService
+
+        try:
+            CloudHSMService().list_keys(username, password, priority=BULK)
+        except Exception as e:
+            print(f"Error revalidating inventory of {username}: {e}")
+        finally:
+            with self._lock:
+                self._revalidating.discard(username)
+
+    def record_created(self, username: str, keys: List[KeyInfo]):
+        self._record(username, keys, created=True)
+
+    def record_deleted(self, username: str, keys: List[KeyInfo]):
+        self._record(username, keys, created=False)
+
+    def _record(self, username: str, keys: List[KeyInfo], created: bool):
+        changed = {fingerprint(key): key for key in keys}
+        with self._lock:
+            feed = self._feeds.get(username)
+            # Without a baseline snapshot the next enumeration will pick the change up
+            if feed is None:
+                return
+            if created:
+                self._apply(username, feed, set(changed) - feed.current, set(), changed)
+            else:
+                self._apply(username, feed, set(), set(changed) & feed.current, changed)
+
+    def changes_since(self, username: str, token: str) -> Optional[Tuple[List[KeyInfo], List[KeyInfo], str]]:
+        """Keys added and removed since the token, or None if the caller must resync with a full listing"""
+        epoch, _, generation = (token or "").partition(".")
+        if epoch != self.epoch or not generation.isdigit():
+            return None
+
+        with self._lock:
+            feed = self._feeds.get(username)
+            if feed is None:
+                return None
+            delta = feed.since(int(generation))
+            if delta is None:
+                return None
+            return delta[0], delta[1], self._token(feed)
+
+    def start(self):
+        """Start the background snapshot thread"""
+        if self.snapshot_interval <= 0 or self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="inventory-snapshots", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        # Revalidate snapshots restored at startup right away instead of after a full interval
+        if self._unverified:
+            try:
+                self._snapshot_all()
+            except Exception as e:
+                print(f"Error revalidating restored inventory: {e}")
+        while not self._stop.wait(self.snapshot_interval):
+            try:
+                self._snapshot_all()
+            except Exception as e:
+                print(f"Error taking inventory snapshots: {e}")
+
+    def _snapshot_all(self):
+        """Enumerate the keys of every user with an active session at bulk priority"""
+        from app.services.cloudhsm_service import CloudHSMService
+
+        db = SessionLocal()
+        try:
+            credentials = {s.username: s.password for s in SessionService(db).get_active_sessions()}
+        finally:
+            db.close()
+
+        for username, password in credentials.items():
+            if self._stop.is_set():
+                return
+            CloudHSMService().list_keys(username, password, priority=BULK)
+
+
+inventory_feed = InventoryFeed()
@@ -0,0 +1,126 @@
+import os
+import queue
+import threading
+import time
+from typing import List
+from sqlalchemy import delete, insert, select
+from app.models.database import InventoryRecord, SessionLocal
+from app.models.keys import KeyInfo
+from app.services.inventory_feed import inventory_feed, fingerprint
+from app.services.key_records import KeyRecord
+
+
+class InventorySnapshot:
+    """Persists the per-user key inventory so a restart serves listings from disk while the HSM is re-enumerated"""
+
+    def __init__(self):
+        self.enabled = os.getenv("INVENTORY_PERSIST", "true").lower() == "true"
+        # How long the writer waits for more changes before committing them
+        self.flush_interval = float(os.getenv("INVENTORY_PERSIST_INTERVAL", "1"))
+
+        self._queue = queue.Queue()
+        self._loading = False
+        self._thread = None
+        self._stop = threading.Event()
+        self.loaded_keys = 0
+        self.load_seconds = None
+
+    def apply(self, username: str, added: List[KeyInfo], removed: List[KeyInfo]):
+        """Inventory feed listener queueing every change for the writer"""
+        if self.enabled and not self._loading:
+            self._queue.put((username, added, removed))
+
+    def load(self):
+        """Restore every persisted inventory into the change feed, before the first request comes in"""
+        if not self.enabled:
+            return
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            users = {}
+            for record in db.execute(select(InventoryRecord)).scalars():
+                users.setdefault(record.username, []).append(KeyRecord.from_values(
+                    record.key_class, record.key_type, record.label, record.key_id, record.curve
+                ))
+        finally:
+            db.close()
+
+        # Restoring is not a change; keep the writer from persisting the same keys again
+        self._loading = True
+        try:
+            for username, keys in users.items():
+                inventory_feed.restore(username, keys)
+        finally:
+            self._loading = False
+
+        self.loaded_keys = sum(len(keys) for keys in users.values())
+        self.load_seconds = time.perf_counter() - started
+        print(f"Loaded inventory snapshot of {self.loaded_keys} keys for {len(users)} users in {self.load_seconds * 1000:.1f}ms")
+
+    def start(self):
+        """Start the background writer thread"""
+        if not self.enabled or self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="inventory-snapshot-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the writer once every queued change is on disk"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+            self._thread = None
+        self._write(self._take(block=False))
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "pending_changes": self._queue.qsize(),
+            "loaded_keys": self.loaded_keys,
+            "load_ms": self.load_seconds * 1000 if self.load_seconds is not None else None
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._write(self._take(block=True))
+
+    def _take(self, block: bool) -> list:
+        changes = []
+        try:
+            if block:
+                changes.append(self._queue.get(timeout=self.flush_interval))
+            while True:
+                changes.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return changes
+
+    def _write(self, changes: list):
+        """Apply queued changes in order, in one transaction"""
+        if not changes:
+            return
+        db = SessionLocal()
+        try:
+            for username, added, removed in changes:
+                stale = [f"{fingerprint(key):016x}" for key in list(added) + list(removed)]
+                # Chunked to stay under SQLite's bound parameter limit on a first full snapshot
+                for offset in range(0, len(stale), 500):
+                    db.execute(delete(InventoryRecord).where(
+                        InventoryRecord.username == username, InventoryRecord.fingerprint.in_(stale[offset:offset + 500])))
+                if added:
+                    db.execute(insert(InventoryRecord), [
+                        dict(username=username, fingerprint=f"{fingerprint(key):016x}", key_class=key.key_class,
+                             key_type=key.key_type, label=key.label, key_id=key.key_id, curve=key.curve)
+                        for key in added
+                    ])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Error writing inventory snapshot: {e}")
+        finally:
+            db.close()
+
+
+inventory_snapshot = InventorySnapshot()
+inventory_feed.add_listener(inventory_snapshot.apply)
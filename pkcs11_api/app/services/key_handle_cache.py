@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+import PyKCS11
+
+# Errors meaning a cached handle no longer points at the key it was cached for
+HANDLE_ERRORS = {PyKCS11.CKR_OBJECT_HANDLE_INVALID, PyKCS11.CKR_KEY_HANDLE_INVALID}
+
+
+class KeyHandleCache:
+    """Maps a user's label/ID search template to the object handle it found, so repeated operations skip findObjects
+
+    Handles are only valid on the slot whose session found them, so entries are kept per slot.
+    """
+
+    def __init__(self):
+        self.max_entries = int(os.getenv("KEY_HANDLE_CACHE_SIZE", "1024"))
+        # Bounds how long a handle reused after an out-of-band delete can go unnoticed
+        self.ttl = float(os.getenv("KEY_HANDLE_CACHE_TTL", "300"))
+        self._lock = threading.Lock()
+        self._handles = OrderedDict()  # (username, slot, template) -> (handle, cached_at), least recently used first
+        self._latest = {}  # (username, template) -> slot of the most recent entry, for lookups before a session is open
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def get(self, username: str, slot: int, template: list):
+        """Cached handle for the template on a slot"""
+        if self.max_entries <= 0:
+            return None
+        key = (username, slot, tuple(template))
+        with self._lock:
+            entry = self._handles.get(key)
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                self._handles.pop(key, None)
+                self._misses += 1
+                return None
+            self._handles.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def lookup(self, username: str, template: list) -> Optional[Tuple[int, object]]:
+        """(slot, handle) cached for the template on any slot; sessions using the handle must be opened on that slot"""
+        with self._lock:
+            slot = self._latest.get((username, tuple(template)))
+        if slot is None:
+            if self.max_entries > 0:
+                with self._lock:
+                    self._misses += 1
+            return None
+        handle = self.get(username, slot, template)
+        return (slot, handle) if handle is not None else None
+
+    def put(self, username: str, slot: int, template: list, handle):
+        if self.max_entries <= 0:
+            return
+        key = (username, slot, tuple(template))
+        with self._lock:
+            self._handles[key] = (handle, time.monotonic())
+            self._handles.move_to_end(key)
+            self._latest[(username, key[2])] = slot
+            while len(self._handles) > self.max_entries:
+                (evicted_user, evicted_slot, evicted_template), _ = self._handles.popitem(last=False)
+                if self._latest.get((evicted_user, evicted_template)) == evicted_slot:
+                    del self._latest[(evicted_user, evicted_template)]
+
+    def discard_handles(self, slot: int, handles: Iterable):
+        """Forget every entry pointing at one of the slot's handles, e.g. after they were destroyed or went stale"""
+        stale = {handle.value() for handle in handles}
+        with self._lock:
+            for key in [key for key, (handle, _) in self._handles.items() if key[1] == slot and handle.value() in stale]:
+                del self._handles[key]
+                self._invalidations += 1
+
+    def discard_keys(self, labels: Iterable[str], key_ids: Iterable[str] = ()):
+        """Forget entries on every slot whose template searches one of the labels or hex key IDs
+
+        Other slots hold their own handles for the same keys, which discard_handles cannot name.
+        """
+        labels = set(labels)
+        key_ids = {key_id.lower() for key_id in key_ids}
+
+        def searched(template) -> bool:
+            for attribute, value in template:
+                if attribute == PyKCS11.CKA_LABEL and value in labels:
+                    return True
+                if attribute == PyKCS11.CKA_ID and bytes(value).hex() in key_ids:
+                    return True
+            return False
+
+        with self._lock:
+            for key in [key for key in self._handles if searched(key[2])]:
+                del self._handles[key]
+                self._invalidations += 1
+
+    def discard_user(self, username: str):
+        """Forget a user's entries when their login session ends"""
+        with self._lock:
+            for key in [key for key in self._handles if key[0] == username]:
+                del self._handles[key]
+                self._invalidations += 1
+            for key in [key for key in self._latest if key[0] == username]:
+                del self._latest[key]
+
+    def clear(self):
+        """Forget every entry, e.g. after the PKCS#11 library was re-initialized and all handles are void"""
+        with self._lock:
+            self._invalidations += len(self._handles)
+            self._handles.clear()
+            self._latest.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._handles),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "invalidations": self._invalidations,
+                "hit_rate": self._hits / lookups if lookups else None
+            }
+
+
+key_handle_cache = KeyHandleCache()
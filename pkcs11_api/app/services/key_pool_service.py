@@ -0,0 +1,234 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional, Tuple
+import PyKCS11
+from app.models.database import SessionLocal
+from app.models.key_schemas import CreateKeyRequest
+from app.services.session_service import SessionService
+
+# Placeholder keys are stored under this label prefix until a create request claims them
+POOL_LABEL_PREFIX = "__keypool__"
+
+# Fixed attribute templates the pool pre-generates; a create request must match one exactly
+POOL_PROFILES = {
+    "default": dict(token=True, private=True, sensitive=True, extractable=False,
+                    encrypt=None, decrypt=None, sign=None, verify=None),
+    "signing": dict(token=True, private=True, sensitive=True, extractable=False,
+                    encrypt=False, decrypt=False, sign=True, verify=True),
+    "encryption": dict(token=True, private=True, sensitive=True, extractable=False,
+                       encrypt=True, decrypt=True, sign=False, verify=False),
+}
+
+
+class RSAKeyPool:
+    """Keeps pre-generated RSA key pairs on the HSM per user, key size and profile"""
+
+    def __init__(self):
+        self.target = int(os.getenv("RSA_KEY_POOL_TARGET", "0"))
+        self.key_sizes = [int(size) for size in os.getenv("RSA_KEY_POOL_SIZES", "2048,3072,4096").split(",") if size.strip()]
+        self.profiles = [name.strip() for name in os.getenv("RSA_KEY_POOL_PROFILES", "default").split(",") if name.strip() in POOL_PROFILES]
+        self.refill_interval = float(os.getenv("RSA_KEY_POOL_REFILL_INTERVAL", "30"))
+        self.refill_batch = int(os.getenv("RSA_KEY_POOL_REFILL_BATCH", "4"))
+
+        self._lock = threading.Lock()
+        self._levels = {}       # (username, key_size, profile) -> complete pairs counted on the HSM by the last refill
+        self._hits = {}         # (key_size, profile) -> requests served from the pool
+        self._misses = {}       # (key_size, profile) -> matching requests that found the pool empty
+        self._refills = deque()  # timestamps of generated placeholder pairs, for the refill rate
+        self._claimed = set()    # CKA_IDs of placeholder pairs a take is relabeling right now
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.target > 0 and bool(self.key_sizes) and bool(self.profiles)
+
+    def placeholder_label(self, key_size: int, profile: str) -> str:
+        """Label shared by all pool pairs of one key size and profile"""
+        return f"{POOL_LABEL_PREFIX}:rsa-{key_size}:{profile}"
+
+    def is_placeholder(self, label: Optional[str]) -> bool:
+        return bool(label) and label.startswith(POOL_LABEL_PREFIX)
+
+    def profile_request(self, key_size: int, profile: str) -> CreateKeyRequest:
+        """Create request used to generate a placeholder pair"""
+        return CreateKeyRequest(
+            label=self.placeholder_label(key_size, profile),
+            key_class="PRIVATE_KEY",
+            key_type="RSA",
+            key_size=key_size,
+            **POOL_PROFILES[profile]
+        )
+
+    def match(self, request: CreateKeyRequest) -> Optional[Tuple[int, str]]:
+        """Return the (key_size, profile) a create request can be served from, if any"""
+        if not self.enabled or request.key_type != "RSA":
+            return None
+        if request.key_class not in ("PRIVATE_KEY", "PUBLIC_KEY"):
+            return None
+
+        key_size = request.key_size or 2048
+        if key_size not in self.key_sizes:
+            return None
+
+        for profile in self.profiles:
+            if all(getattr(request, field) == value for field, value in POOL_PROFILES[profile].items()):
+                return key_size, profile
+        return None
+
+    def take(self, session, username: str, request: CreateKeyRequest, key_id: bytes = None) -> Optional[Tuple[int, int]]:
+        """Claim a pre-generated pair for the request by relabeling it, under key_id or a random ID; returns (public, private) handles or None on a miss"""
+        spec = self.match(request)
+        if not spec:
+            return None
+
+        key_size, profile = spec
+        label = self.placeholder_label(key_size, profile)
+
+        # Only the claim is made under the lock; the HSM calls run outside so stats() and other takes never wait on them
+        private_keys = session.findObjects([
+            (PyKCS11.CKA_CLASS, PyKCS11.CKO_PRIVATE_KEY),
+            (PyKCS11.CKA_LABEL, label)
+        ])
+
+        for private_key in private_keys:
+            pair_id = session.getAttributeValue(private_key, [PyKCS11.CKA_ID])[0]
+            if not pair_id:
+                continue
+            pair_id = bytes(pair_id)
+            with self._lock:
+                if pair_id in self._claimed:
+                    continue
+                self._claimed.add(pair_id)
+
+            try:
+                claimed = self._claim(session, label, private_key, pair_id, request, key_id)
+            finally:
+                with self._lock:
+                    self._claimed.discard(pair_id)
+            if claimed is None:
+                continue
+
+            with self._lock:
+                self._hits[spec] = self._hits.get(spec, 0) + 1
+            return claimed
+
+        with self._lock:
+            self._misses[spec] = self._misses.get(spec, 0) + 1
+        return None
+
+    def _claim(self, session, label: str, private_key, pair_id: bytes, request: CreateKeyRequest,
+               key_id: bytes = None) -> Optional[Tuple[int, int]]:
+        """Relabel one placeholder pair for the request; None if its public half is gone, placeholder restored on failure"""
+        public_keys = session.findObjects([
+            (PyKCS11.CKA_CLASS, PyKCS11.CKO_PUBLIC_KEY),
+            (PyKCS11.CKA_LABEL, f"{label}-public"),
+            (PyKCS11.CKA_ID, pair_id)
+        ])
+        if not public_keys:
+            return None
+
+        # Give the claimed pair a fresh ID so it no longer links back to the pool
+        key_id = key_id or os.urandom(16)
+        session.setAttributeValue(private_key, [
+            (PyKCS11.CKA_LABEL, request.label),
+            (PyKCS11.CKA_ID, key_id)
+        ])
+        try:
+            session.setAttributeValue(public_keys[0], [
+                (PyKCS11.CKA_LABEL, f"{request.label}-public"),
+                (PyKCS11.CKA_ID, key_id)
+            ])
+        except Exception:
+            # Put the private half back so the pair stays whole in the pool
+            try:
+                session.setAttributeValue(private_key, [(PyKCS11.CKA_LABEL, label), (PyKCS11.CKA_ID, pair_id)])
+            except Exception as e:
+                print(f"Error returning key pool pair to the pool: {e}")
+            raise
+        return public_keys[0], private_key
+
+    def record_level(self, username: str, key_size: int, profile: str, level: int):
+        with self._lock:
+            self._levels[(username, key_size, profile)] = level
+
+    def record_refill(self, count: int = 1):
+        now = time.monotonic()
+        with self._lock:
+            self._refills.extend([now] * count)
+
+    def stats(self, username: Optional[str] = None) -> dict:
+        """Pool levels, refill rate and hit rate"""
+        now = time.monotonic()
+        with self._lock:
+            while self._refills and now - self._refills[0] > 3600:
+                self._refills.popleft()
+
+            pools = []
+            for key_size in self.key_sizes:
+                for profile in self.profiles:
+                    spec = (key_size, profile)
+                    hits = self._hits.get(spec, 0)
+                    misses = self._misses.get(spec, 0)
+                    levels = {
+                        user: level for (user, size, name), level in self._levels.items()
+                        if size == key_size and name == profile and (username is None or user == username)
+                    }
+                    pools.append({
+                        "key_size": key_size,
+                        "profile": profile,
+                        "target": self.target,
+                        "levels": levels,
+                        "hits": hits,
+                        "misses": misses,
+                        "hit_rate": hits / (hits + misses) if hits + misses else None
+                    })
+
+            return {
+                "enabled": self.enabled,
+                "refills_last_hour": len(self._refills),
+                "refills_per_minute": sum(1 for t in self._refills if now - t <= 60),
+                "pools": pools
+            }
+
+    def start(self):
+        """Start the background refill thread"""
+        if not self.enabled or self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rsa-key-pool", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._refill_all()
+            except Exception as e:
+                print(f"Error refilling RSA key pool: {e}")
+            self._stop.wait(self.refill_interval)
+
+    def _refill_all(self):
+        """Top up the pools of every user with an active session"""
+        from app.services.cloudhsm_service import CloudHSMService
+
+        db = SessionLocal()
+        try:
+            credentials = {s.username: s.password for s in SessionService(db).get_active_sessions()}
+        finally:
+            db.close()
+
+        for username, password in credentials.items():
+            if self._stop.is_set():
+                return
+            CloudHSMService().replenish_key_pool(username, password)
+
+
+key_pool = RSAKeyPool()
@@ -0,0 +1,76 @@
+import sys
+from typing import Iterable, List, Optional
+import PyKCS11
+from app.models.keys import KeyInfo
+
+# API names of PKCS#11 key classes and types; records share these (interned) strings instead of holding copies
+CLASS_NAMES = {
+    PyKCS11.CKO_SECRET_KEY: "SECRET_KEY",
+    PyKCS11.CKO_PRIVATE_KEY: "PRIVATE_KEY",
+    PyKCS11.CKO_PUBLIC_KEY: "PUBLIC_KEY"
+}
+TYPE_NAMES = {
+    PyKCS11.CKK_AES: "AES",
+    PyKCS11.CKK_RSA: "RSA",
+    PyKCS11.CKK_EC: "EC"
+}
+
+
+def class_name(obj_class) -> str:
+    return CLASS_NAMES.get(obj_class) or f"UNKNOWN_{obj_class}"
+
+
+def type_name(key_type) -> str:
+    return TYPE_NAMES.get(key_type) or f"UNKNOWN_{key_type}"
+
+
+class KeyRecord:
+    """Compact in-process form of a KeyInfo for large inventories
+
+    Holds CKA_LABEL as PyKCS11 returns it, a str (raw bytes are decoded on first access), and the
+    raw CKA_ID bytes, hex-encoded on first access. Reads like a KeyInfo (key_class, key_type,
+    label, key_id, curve), so the change feed, label index and snapshot writer take either; build
+    KeyInfo with to_key_info() only when responding.
+    """
+
+    __slots__ = ("key_class", "key_type", "_label", "_key_id", "curve")
+
+    def __init__(self, key_class: str, key_type: str, label, key_id, curve: Optional[str] = None):
+        self.key_class = key_class
+        self.key_type = key_type
+        self._label = label    # str, or raw bytes until first read
+        self._key_id = key_id  # bytes until first read, then the hex str or None
+        self.curve = curve
+
+    @classmethod
+    def from_attributes(cls, attrs, curve: Optional[str] = None) -> "KeyRecord":
+        """Record from CKA_CLASS, CKA_KEY_TYPE, CKA_LABEL and CKA_ID values as getAttributeValue returns them"""
+        # PyKCS11 decodes CKA_LABEL to str; raw byte lists are kept as bytes until first read
+        label = attrs[2] if isinstance(attrs[2], str) else bytes(attrs[2]) if attrs[2] else None
+        return cls(class_name(attrs[0]), type_name(attrs[1]), label or None, bytes(attrs[3]) if attrs[3] else None, curve)
+
+    @classmethod
+    def from_values(cls, key_class: str, key_type: str, label: Optional[str], key_id: Optional[str],
+                    curve: Optional[str] = None) -> "KeyRecord":
+        """Record from already decoded values, e.g. a persisted snapshot row"""
+        return cls(sys.intern(key_class), sys.intern(key_type), label, key_id, curve)
+
+    @property
+    def label(self) -> Optional[str]:
+        if isinstance(self._label, bytes):
+            self._label = self._label.decode("utf-8", errors="ignore") or None
+        return self._label
+
+    @property
+    def key_id(self) -> Optional[str]:
+        if isinstance(self._key_id, bytes):
+            self._key_id = self._key_id.hex() or None
+        return self._key_id
+
+    def to_key_info(self) -> KeyInfo:
+        return KeyInfo(key_class=self.key_class, key_type=self.key_type, label=self.label, key_id=self.key_id, curve=self.curve)
+
+
+def key_infos(keys: Iterable) -> List[KeyInfo]:
+    """KeyInfo models for a response from records, KeyInfo or a mix of both"""
+    return [key.to_key_info() if isinstance(key, KeyRecord) else key for key in keys]
@@ -0,0 +1,35 @@
+import os
+import threading
+import time
+from typing import List, Optional
+from app.models.keys import KeyInfo, KeyStatsResponse
+from app.services.inventory_feed import inventory_feed
+
+
+class KeyStatsCache:
+    """Per-user faceted key counts, reused until they expire or the inventory changes"""
+
+    def __init__(self):
+        self.ttl = float(os.getenv("KEY_STATS_TTL", "60"))
+        self._lock = threading.Lock()
+        self._stats = {}  # username -> (computed_at, KeyStatsResponse)
+
+    def get(self, username: str) -> Optional[KeyStatsResponse]:
+        with self._lock:
+            cached = self._stats.get(username)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+        return None
+
+    def put(self, username: str, stats: KeyStatsResponse):
+        with self._lock:
+            self._stats[username] = (time.monotonic(), stats)
+
+    def invalidate(self, username: str, added: List[KeyInfo] = None, removed: List[KeyInfo] = None):
+        """Inventory feed listener, any create, delete or snapshot delta drops the cached counts"""
+        with self._lock:
+            self._stats.pop(username, None)
+
+
+key_stats_cache = KeyStatsCache()
+inventory_feed.add_listener(key_stats_cache.invalidate)
@@ -0,0 +1,144 @@
+import bisect
+import fnmatch
+import re
+import threading
+from typing import List, Optional
+from app.models.keys import KeyInfo
+from app.services.inventory_feed import inventory_feed
+
+
+def _label_key(key: KeyInfo) -> tuple:
+    """Sort key for the label index: case-insensitive label first, full identity as tie-breaker"""
+    label = key.label or ""
+    return (label.casefold(), label, key.key_class, key.key_type, key.key_id or "")
+
+
+def _id_key(key: KeyInfo) -> tuple:
+    return (key.key_id or "", key.label or "", key.key_class, key.key_type)
+
+
+class _SortedKeys:
+    """Keys kept sorted by a tuple key so prefixes resolve with two binary searches"""
+
+    def __init__(self, sort_key):
+        self.sort_key = sort_key
+        self.keys = []     # sort tuples, first element is the searchable string
+        self.entries = []  # KeyInfo in the same order
+
+    def add(self, key: KeyInfo):
+        sort_key = self.sort_key(key)
+        position = bisect.bisect_left(self.keys, sort_key)
+        if position < len(self.keys) and self.keys[position] == sort_key:
+            return
+        self.keys.insert(position, sort_key)
+        self.entries.insert(position, key)
+
+    def add_many(self, keys: List[KeyInfo]):
+        """Add a batch, re-sorting once instead of inserting one by one for large batches"""
+        if len(keys) < 64:
+            for key in keys:
+                self.add(key)
+            return
+        merged = dict(zip(self.keys, self.entries))
+        merged.update((self.sort_key(key), key) for key in keys)
+        self.keys = sorted(merged)
+        self.entries = [merged[sort_key] for sort_key in self.keys]
+
+    def remove(self, key: KeyInfo):
+        sort_key = self.sort_key(key)
+        position = bisect.bisect_left(self.keys, sort_key)
+        if position < len(self.keys) and self.keys[position] == sort_key:
+            del self.keys[position]
+            del self.entries[position]
+
+    def prefix_range(self, prefix: str) -> range:
+        start = bisect.bisect_left(self.keys, (prefix,))
+        # Every string starting with prefix sorts below prefix followed by the highest code point
+        end = bisect.bisect_left(self.keys, (prefix + "\U0010ffff",), lo=start)
+        return range(start, end)
+
+
+class _UserIndex:
+    def __init__(self):
+        self.labels = _SortedKeys(_label_key)
+        self.ids = _SortedKeys(_id_key)
+
+
+class LabelIndex:
+    """Per-user in-memory index of key labels and IDs for prefix, substring and glob search"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._users = {}  # username -> _UserIndex
+
+    def has_user(self, username: str) -> bool:
+        with self._lock:
+            return username in self._users
+
+    def apply(self, username: str, added: List[KeyInfo], removed: List[KeyInfo]):
+        """Inventory feed listener keeping the index in step with snapshots, creates and deletes"""
+        with self._lock:
+            index = self._users.setdefault(username, _UserIndex())
+            for key in removed:
+                index.labels.remove(key)
+                if key.key_id:
+                    index.ids.remove(key)
+            index.labels.add_many(added)
+            index.ids.add_many([key for key in added if key.key_id])
+
+    def search(self, username: str, prefix: str = None, contains: str = None, glob: str = None,
+               id_prefix: str = None, key_class: str = None, key_type: str = None, limit: int = None) -> List[KeyInfo]:
+        """Keys matching every given label/ID condition (case-insensitive), in label order"""
+        with self._lock:
+            index = self._users.get(username)
+            if index is None:
+                return []
+
+            if id_prefix:
+                candidates = (index.ids.entries[i] for i in index.ids.prefix_range(id_prefix.lower()))
+            else:
+                # Narrow the scan to a label prefix, taken from the literal head of the glob if none is given
+                head = prefix or (re.match(r"[^*?\[]*", glob).group(0) if glob else "")
+                positions = index.labels.prefix_range(head.casefold()) if head else range(len(index.labels.entries))
+                candidates = (index.labels.entries[i] for i in positions)
+
+            pattern = re.compile(fnmatch.translate(glob.casefold())) if glob else None
+            needle = contains.casefold() if contains else None
+
+            results = []
+            for key in candidates:
+                label = (key.label or "").casefold()
+                if prefix and not label.startswith(prefix.casefold()):
+                    continue
+                if needle and needle not in label:
+                    continue
+                if pattern and not pattern.match(label):
+                    continue
+                if key_class and key.key_class != key_class:
+                    continue
+                if key_type and key.key_type != key_type:
+                    continue
+                results.append(key)
+                if limit and len(results) >= limit:
+                    break
+            return results
+
+    def typeahead(self, username: str, query: str, limit: int = 10) -> Optional[List[str]]:
+        """Distinct labels starting with query, in label order; None if the user has no index yet"""
+        with self._lock:
+            index = self._users.get(username)
+            if index is None:
+                return None
+
+            suggestions = []
+            for position in index.labels.prefix_range(query.casefold()):
+                label = index.labels.keys[position][1]
+                if label and (not suggestions or suggestions[-1] != label):
+                    suggestions.append(label)
+                    if len(suggestions) >= limit:
+                        break
+            return suggestions
+
+
+label_index = LabelIndex()
+inventory_feed.add_listener(label_index.apply)
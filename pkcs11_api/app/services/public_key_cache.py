@@ -0,0 +1,79 @@
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+from app.utils.public_keys import pem
+
+
+class PublicKeyMaterial:
+    """A public key as SubjectPublicKeyInfo DER plus its JWK members, identified by a digest of the DER"""
+
+    def __init__(self, key_id: str, key_type: str, spki: bytes, jwk: Optional[dict]):
+        self.key_id = key_id
+        self.key_type = key_type
+        self.spki = spki
+        self.jwk = dict(jwk, kid=key_id) if jwk else None
+        self.digest = base64.urlsafe_b64encode(hashlib.sha256(spki).digest()).rstrip(b"=").decode()
+        self.pem = pem(spki)
+
+    def etag(self, format: str) -> str:
+        """Strong ETag for one representation; the same key material always yields the same tag"""
+        return f'"{self.digest}.{format}"'
+
+
+class PublicKeyCache:
+    """Bounded LRU of public key material by user and key ID, so repeat exports never reach the HSM"""
+
+    def __init__(self):
+        self.max_entries = int(os.getenv("PUBLIC_KEY_CACHE_SIZE", "4096"))
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()  # (username, key_id) -> PublicKeyMaterial, least recently used first
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, username: str, key_id: str) -> Optional[PublicKeyMaterial]:
+        with self._lock:
+            material = self._keys.get((username, key_id))
+            if material is None:
+                self._misses += 1
+                return None
+            self._keys.move_to_end((username, key_id))
+            self._hits += 1
+            return material
+
+    def put(self, username: str, material: PublicKeyMaterial):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._keys[(username, material.key_id)] = material
+            self._keys.move_to_end((username, material.key_id))
+            while len(self._keys) > self.max_entries:
+                self._keys.popitem(last=False)
+
+    def discard(self, key_ids: Iterable[str]):
+        """Forget keys for every user, e.g. after they were deleted and their ID may be reused"""
+        stale = set(key_ids)
+        with self._lock:
+            for key in [key for key in self._keys if key[1] in stale]:
+                del self._keys[key]
+
+    def clear(self):
+        """Forget every key, e.g. after the HSM was pointed at another cluster"""
+        with self._lock:
+            self._keys.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._keys),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else None
+            }
+
+
+public_key_cache = PublicKeyCache()
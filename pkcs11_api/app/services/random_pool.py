@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+from app.services.admission_controller import BULK
+
+
+class _UserBuffer:
+    """Random bytes drawn with one user's login, and the password to draw more with while they are logged in"""
+
+    def __init__(self, password: str):
+        self.password = password
+        self.data = bytearray()
+
+
+class RandomPool:
+    """Bounded per-user buffers of HSM random bytes, drawn with C_GenerateRandom in batches and handed out exactly once
+
+    Each user is only served bytes drawn with their own login, and the refill thread stops using
+    a login once discard_user() was called for it.
+    """
+
+    def __init__(self):
+        # Bytes buffered per logged-in user
+        self.capacity = int(os.getenv("RANDOM_POOL_SIZE", str(1024 * 1024)))
+        # Bytes per C_GenerateRandom call when refilling
+        self.batch_size = int(os.getenv("RANDOM_POOL_BATCH", str(64 * 1024)))
+        # The refill thread tops the buffer up once it falls below this share of its capacity
+        self.low_water = float(os.getenv("RANDOM_POOL_LOW_WATER", "0.5"))
+        self.retry_interval = float(os.getenv("RANDOM_POOL_RETRY_INTERVAL", "5"))
+
+        self._cond = threading.Condition()
+        self._users = {}  # username -> _UserBuffer
+        self._hits = 0
+        self._misses = 0
+        self._bytes_served = 0
+        self._refills = 0
+        self._refill_latencies = deque(maxlen=100)  # seconds per C_GenerateRandom batch
+        self._last_error = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0 and self.batch_size > 0
+
+    def take(self, username: str, password: str, length: int) -> Optional[bytes]:
+        """Remove length bytes from the buffer, or return None when it holds too few and the caller must go to the HSM"""
+        if not self.enabled:
+            return None
+        with self._cond:
+            buffer = self._users.get(username)
+            if buffer is None:
+                buffer = self._users[username] = _UserBuffer(password)
+            buffer.password = password
+            if len(buffer.data) < length:
+                self._misses += 1
+                self._cond.notify_all()
+                return None
+
+            data = bytes(buffer.data[:length])
+            # Served bytes leave the buffer, so no two requests ever see the same bytes
+            del buffer.data[:length]
+            self._hits += 1
+            self._bytes_served += length
+            if len(buffer.data) < self.capacity * self.low_water:
+                self._cond.notify_all()
+            return data
+
+    def discard_user(self, username: str):
+        """Drop a user's bytes and stop refilling with their login, e.g. on logout"""
+        with self._cond:
+            self._users.pop(username, None)
+
+    def stats(self) -> dict:
+        with self._cond:
+            lookups = self._hits + self._misses
+            latencies = sorted(self._refill_latencies)
+            level = sum(len(buffer.data) for buffer in self._users.values())
+            capacity = self.capacity * len(self._users)
+            return {
+                "enabled": self.enabled,
+                "users": len(self._users),
+                "level": level,
+                "capacity": capacity,
+                "fill_ratio": level / capacity if capacity > 0 else None,
+                "batch_size": self.batch_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else None,
+                "bytes_served": self._bytes_served,
+                "refills": self._refills,
+                "refill_p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else None,
+                "refill_p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else None,
+                "last_error": self._last_error
+            }
+
+    def start(self):
+        """Start the background refill thread"""
+        if not self.enabled or self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="random-pool", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+            # Bytes nobody drew are never handed out after a restart either
+            self._users.clear()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._cond:
+                # Sleep until the buffer of a logged-in consumer runs low
+                while not self._stop.is_set() and not (low := self._low_users()):
+                    self._cond.wait()
+                username = low[0] if low else None
+            if self._stop.is_set():
+                return
+
+            try:
+                self._refill(username)
+            except Exception as e:
+                with self._cond:
+                    self._last_error = str(e)
+                print(f"Error refilling random pool: {e}")
+                self._stop.wait(self.retry_interval)
+
+    def _low_users(self) -> list:
+        """Users whose buffer fell below the low water mark, emptiest first; caller holds the lock"""
+        low = [(len(buffer.data), username) for username, buffer in self._users.items()
+               if len(buffer.data) < self.capacity * self.low_water]
+        return [username for _, username in sorted(low)]
+
+    def _refill(self, username: str):
+        """Fill a user's buffer to capacity, one batch at a time so consumers can draw in between"""
+        from app.services.cloudhsm_service import CloudHSMService
+
+        while not self._stop.is_set():
+            with self._cond:
+                buffer = self._users.get(username)
+                if buffer is None:
+                    return
+                missing = self.capacity - len(buffer.data)
+                password = buffer.password
+            if missing <= 0:
+                return
+
+            started = time.perf_counter()
+            data = CloudHSMService().generate_random(username, password, min(missing, self.batch_size), priority=BULK)
+            with self._cond:
+                self._refill_latencies.append(time.perf_counter() - started)
+                self._refills += 1
+                self._last_error = None
+                # Bytes of a user who logged out meanwhile are dropped with their buffer
+                if self._users.get(username) is buffer:
+                    buffer.data += data[:self.capacity - len(buffer.data)]
+
+
+random_pool = RandomPool()
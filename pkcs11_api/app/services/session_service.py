@@ -1,5 +1,7 @@
 from sqlalchemy.orm import Session
 from app.models.database import UserSession
+from app.services.key_handle_cache import key_handle_cache
+from app.services.random_pool import random_pool
 from datetime import datetime
 
 class SessionService:
@@ -10,6 +12,8 @@ class SessionService:
         """Create new session or update existing one"""
         # Delete any existing sessions for this user
         self.db.query(UserSession).filter(UserSession.username == username).delete()
+        key_handle_cache.discard_user(username)
+        random_pool.discard_user(username)
         
         # Create new session
         session = UserSession.create_session(username, password)
@@ -35,6 +39,8 @@ class SessionService:
             # Clean up expired session
             self.db.delete(session)
             self.db.commit()
+            key_handle_cache.discard_user(username)
+            random_pool.discard_user(username)
             return None
         
         return session
@@ -45,11 +51,22 @@ class SessionService:
         if session:
             self.db.delete(session)
             self.db.commit()
+            key_handle_cache.discard_user(username)
+            random_pool.discard_user(username)
+    
+    def get_active_sessions(self) -> list:
+        """Get all unexpired sessions, used by background workers that act on behalf of users"""
+        return self.db.query(UserSession).filter(
+            UserSession.expiry > datetime.utcnow()
+        ).all()
     
     def cleanup_expired_sessions(self):
         """Clean up all expired sessions"""
         expired_sessions = self.db.query(UserSession).filter(
             UserSession.expiry < datetime.utcnow()
         )
+        # The random pool refills with the logins of its consumers; stop using the expired ones
+        for session in expired_sessions.all():
+            random_pool.discard_user(session.username)
         expired_sessions.delete()
         self.db.commit()
\ No newline at end of file
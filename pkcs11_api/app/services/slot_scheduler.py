@@ -0,0 +1,336 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import List, Optional
+import PyKCS11
+from app.services.circuit_breaker import CONNECTION_ERRORS
+from app.services.deadlines import call_with_deadline, DeadlineSession
+from app.services.errors import DeadlineExceededError
+
+
+class SlotStats:
+    """Request counters and a sliding latency window for one slot"""
+
+    WINDOW_SECONDS = 60
+
+    def __init__(self):
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.last_error = None
+        self.cooldown_until = 0.0
+        self.window = deque()  # (finished_at, latency_seconds)
+
+    def record(self, latency: float, error: Optional[Exception] = None):
+        now = time.monotonic()
+        self.requests += 1
+        if error is not None:
+            self.errors += 1
+            self.last_error = str(error)
+        self.window.append((now, latency))
+        while self.window and now - self.window[0][0] > self.WINDOW_SECONDS:
+            self.window.popleft()
+
+    def to_dict(self) -> dict:
+        now = time.monotonic()
+        latencies = sorted(latency for finished, latency in self.window if now - finished <= self.WINDOW_SECONDS)
+        return {
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "cooling_down": now < self.cooldown_until,
+            "throughput_per_second": len(latencies) / self.WINDOW_SECONDS,
+            "latency_ms_p50": latencies[len(latencies) // 2] * 1000 if latencies else None,
+            "latency_ms_p95": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else None,
+        }
+
+
+class _SlotLogin:
+    """The user logged in on a slot, a digest of the password the HSM accepted and their open sessions"""
+
+    def __init__(self, username: str):
+        self.username = username
+        self.salt = os.urandom(16)
+        self.digest = None
+        self.sessions = 0
+        self.busy = True  # logging in or out
+
+    def hash(self, password: str) -> bytes:
+        return hmac.new(self.salt, (password or "").encode(), hashlib.sha256).digest()
+
+
+class SlotScheduler:
+    """Shares one PKCS#11 library across requests and spreads sessions over all usable slots"""
+
+    def __init__(self):
+        self.pkcs11_lib = os.getenv("PKCS11_LIB", "/opt/cloudhsm/lib/libcloudhsm_pkcs11.so")
+        self.slot_refresh_interval = float(os.getenv("HSM_SLOT_REFRESH_INTERVAL", "60"))
+        self.error_cooldown = float(os.getenv("HSM_SLOT_ERROR_COOLDOWN", "30"))
+        self.drain_timeout = float(os.getenv("HSM_RELOAD_DRAIN_TIMEOUT", "30"))
+
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._active = 0          # sessions open or being opened on the current library
+        self._reloading = False
+        self._pkcs11 = None
+        self._slots = []
+        self._slots_loaded_at = 0.0
+        self._stats = {}   # slot -> SlotStats
+        self._logins = {}  # slot -> _SlotLogin of the user the application is logged in as there
+        # How long a session waits for another user's login on its slot to end
+        self.login_wait_timeout = float(os.getenv("HSM_LOGIN_WAIT_TIMEOUT", "30"))
+
+    def library(self) -> PyKCS11.PyKCS11Lib:
+        """Load the PKCS#11 library once per process, or again after a reload"""
+        with self._lock:
+            self._idle.wait_for(lambda: not self._reloading)
+            if self._pkcs11 is None:
+                pkcs11 = PyKCS11.PyKCS11Lib()
+                pkcs11.load(self.pkcs11_lib)
+                self._pkcs11 = pkcs11
+            return self._pkcs11
+
+    def use_library(self, pkcs11):
+        """Use an already loaded library instead of PKCS11_LIB, e.g. the in-memory token of the call budget checks"""
+        with self._lock:
+            self._pkcs11 = pkcs11
+            self._slots = []
+            self._slots_loaded_at = 0.0
+
+    def slots(self, refresh: bool = False) -> List[int]:
+        """Enumerate slots with a token present, cached for HSM_SLOT_REFRESH_INTERVAL"""
+        pkcs11 = self.library()
+        with self._lock:
+            stale = time.monotonic() - self._slots_loaded_at > self.slot_refresh_interval
+            if not (refresh or stale or not self._slots):
+                return list(self._slots)
+
+        slots = call_with_deadline("getSlotList", pkcs11.getSlotList, tokenPresent=True)
+
+        with self._lock:
+            self._slots = list(slots)
+            self._slots_loaded_at = time.monotonic()
+            for slot in self._slots:
+                self._stats.setdefault(slot, SlotStats())
+            return list(self._slots)
+
+    def _candidates(self, username: str = None) -> List[int]:
+        """Usable slots ordered by least outstanding requests; cooling-down slots and slots another user is logged in on last"""
+        slots = self.slots()
+        now = time.monotonic()
+        with self._lock:
+            return sorted(slots, key=lambda slot: (
+                now < self._stats[slot].cooldown_until,
+                bool(username) and not self._slot_available(slot, username),
+                self._stats[slot].outstanding,
+                self._stats[slot].requests
+            ))
+
+    def _begin(self, slot: int):
+        with self._lock:
+            self._stats.setdefault(slot, SlotStats()).outstanding += 1
+
+    def _finish(self, slot: int, started: float, error: Optional[Exception] = None):
+        with self._lock:
+            # Stats start over on reload
+            stats = self._stats.setdefault(slot, SlotStats())
+            stats.outstanding = max(stats.outstanding - 1, 0)
+            stats.record(time.monotonic() - started, error)
+            slot_error = isinstance(error, PyKCS11.PyKCS11Error) and error.value in CONNECTION_ERRORS
+            if slot_error or isinstance(error, DeadlineExceededError):
+                stats.cooldown_until = time.monotonic() + self.error_cooldown
+
+    def _login(self, session, slot: int, username: str, password: str):
+        """Log the user in on the slot, or join their existing login after checking the password against it.
+
+        PKCS#11 login state belongs to the whole application on a slot: C_Login for a user who is
+        already logged in returns CKR_USER_ALREADY_LOGGED_IN without checking the PIN. So the first
+        session logs in for real and keeps a salted digest of the accepted password, later sessions
+        of the same user must match it, and other users wait until the slot is logged out.
+        """
+        with self._lock:
+            if not self._idle.wait_for(lambda: self._slot_available(slot, username), timeout=self.login_wait_timeout):
+                raise PyKCS11.PyKCS11Error(PyKCS11.CKR_USER_ANOTHER_ALREADY_LOGGED_IN,
+                                           f"Slot {slot} stayed logged in as another user")
+            login = self._logins.get(slot)
+            if login is not None:
+                if not hmac.compare_digest(login.digest, login.hash(password)):
+                    raise PyKCS11.PyKCS11Error(PyKCS11.CKR_PIN_INCORRECT, "Incorrect password")
+                login.sessions += 1
+                return
+            # Hold other sessions of the slot back until this login settled
+            login = self._logins[slot] = _SlotLogin(username)
+
+        try:
+            try:
+                call_with_deadline("login", session.login, f"{username}:{password}")
+            except PyKCS11.PyKCS11Error as e:
+                if e.value not in (PyKCS11.CKR_USER_ALREADY_LOGGED_IN, PyKCS11.CKR_USER_ANOTHER_ALREADY_LOGGED_IN):
+                    raise
+                # Left over from before a reload or a failed logout; start over so the PIN is really checked
+                call_with_deadline("logout", session.logout)
+                call_with_deadline("login", session.login, f"{username}:{password}")
+        except BaseException:
+            with self._lock:
+                self._logins.pop(slot, None)
+                self._idle.notify_all()
+            raise
+
+        with self._lock:
+            login.digest = login.hash(password)
+            login.sessions = 1
+            login.busy = False
+            self._idle.notify_all()
+
+    def _logout(self, session, slot: int, username: str):
+        with self._lock:
+            login = self._logins.get(slot)
+            if login is None or login.username != username:
+                return
+            login.sessions -= 1
+            if login.sessions > 0:
+                return
+            # Only log out once the last session of this user on the slot is done; new logins wait for it
+            login.busy = True
+
+        try:
+            call_with_deadline("logout", session.logout)
+        except Exception as e:
+            print(f"Error logging out on slot {slot}: {e}")
+        finally:
+            with self._lock:
+                if self._logins.get(slot) is login:
+                    del self._logins[slot]
+                self._idle.notify_all()
+
+    def _slot_available(self, slot: int, username: str) -> bool:
+        """Whether a session of the user can log in on the slot now; caller holds the lock"""
+        login = self._logins.get(slot)
+        return login is None or (login.username == username and not login.busy)
+
+    @contextmanager
+    def session(self, username: str = None, password: str = None, slot: int = None):
+        """Open a session on the least loaded slot, failing over to the next one on slot errors.
+
+        Pass slot to open the session on that slot only, e.g. to use object handles found there.
+        """
+        # Hold new sessions back while a reload swaps the library; open ones count towards the drain
+        with self._lock:
+            self._idle.wait_for(lambda: not self._reloading)
+            self._active += 1
+        try:
+            yield from self._open(username, password, slot)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._idle.notify_all()
+
+    def _open(self, username: str = None, password: str = None, pinned: int = None):
+        slots = self._candidates(username)
+        if not slots:
+            raise PyKCS11.PyKCS11Error(PyKCS11.CKR_TOKEN_NOT_PRESENT, "No HSM slots available")
+        if pinned is not None:
+            # Handles of a slot that went away are as stale as invalid ones; callers search again
+            if pinned not in slots:
+                raise PyKCS11.PyKCS11Error(PyKCS11.CKR_OBJECT_HANDLE_INVALID, f"Slot {pinned} is no longer available")
+            slots = [pinned]
+
+        pkcs11 = self.library()
+        last_error = None
+        for slot in slots:
+            started = time.monotonic()
+            self._begin(slot)
+            try:
+                session = call_with_deadline("openSession", pkcs11.openSession, slot,
+                                             PyKCS11.CKF_SERIAL_SESSION | PyKCS11.CKF_RW_SESSION)
+            except (PyKCS11.PyKCS11Error, DeadlineExceededError) as e:
+                print(f"Error opening session on slot {slot}, failing over: {e}")
+                self._finish(slot, started, e)
+                last_error = e
+                continue
+
+            error = None
+            try:
+                if username:
+                    self._login(session, slot, username, password)
+                try:
+                    yield DeadlineSession(session, slot)
+                finally:
+                    if username:
+                        self._logout(session, slot, username)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                try:
+                    call_with_deadline("closeSession", session.closeSession)
+                except Exception as e:
+                    print(f"Error closing session on slot {slot}: {e}")
+                self._finish(slot, started, error)
+            return
+
+        raise last_error
+
+    def token_info(self):
+        """Token info of the first usable slot, for partition capacity figures"""
+        slots = self._candidates()
+        if not slots:
+            return None
+        pkcs11 = self.library()
+        return call_with_deadline("getTokenInfo", pkcs11.getTokenInfo, slots[0])
+
+    def stats(self) -> dict:
+        """Per-slot throughput and latency"""
+        with self._lock:
+            return {str(slot): stats.to_dict() for slot, stats in self._stats.items()}
+
+    def reset(self):
+        """Forget cached slots, e.g. after the HSM endpoints were reconfigured"""
+        with self._lock:
+            self._slots = []
+            self._slots_loaded_at = 0.0
+
+    def reload(self) -> bool:
+        """Re-initialize the library once open sessions finished, so a new client configuration takes effect.
+
+        A process can only have one configuration of a Cryptoki library initialized, so the old
+        library is finalized before the new one is loaded and nothing may use it any more. New
+        sessions wait while open ones drain; returns False and keeps the old library if they did
+        not finish within HSM_RELOAD_DRAIN_TIMEOUT.
+        """
+        with self._lock:
+            self._idle.wait_for(lambda: not self._reloading)
+            self._reloading = True
+            if not self._idle.wait_for(lambda: self._active == 0, timeout=self.drain_timeout):
+                self._reloading = False
+                self._idle.notify_all()
+                return False
+            old = self._pkcs11
+            self._pkcs11 = None
+            self._slots = []
+            self._slots_loaded_at = 0.0
+            self._stats = {}
+            self._logins = {}
+
+        pkcs11 = None
+        try:
+            if old is not None:
+                # C_Finalize and unload now rather than whenever the object is collected, which
+                # would finalize the shared library underneath the new one
+                old.lib.Unload()
+            pkcs11 = PyKCS11.PyKCS11Lib()
+            pkcs11.load(self.pkcs11_lib)
+        finally:
+            with self._lock:
+                self._pkcs11 = pkcs11
+                self._reloading = False
+                self._idle.notify_all()
+        return True
+
+
+slot_scheduler = SlotScheduler()
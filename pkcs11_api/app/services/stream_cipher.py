@@ -0,0 +1,43 @@
+import PyKCS11
+from app.services.deadlines import call_with_deadline
+
+AES_BLOCK_SIZE = 16
+
+
+class StreamCipher:
+    """Multipart AES-CBC-PAD encryption or decryption on one session, fed chunk by chunk"""
+
+    def __init__(self, session, key, iv: bytes, decrypt: bool = False, on_close=None):
+        self.session = session
+        self.decrypt = decrypt
+        self._on_close = on_close
+        self._prefix = "C_Decrypt" if decrypt else "C_Encrypt"
+
+        # PyKCS11 has no multipart cipher API, so go through the low level C_*Init/Update/Final calls
+        mechanism = PyKCS11.Mechanism(PyKCS11.CKM_AES_CBC_PAD, iv)
+        self._call("Init", mechanism.to_native(), key)
+
+    def _call(self, step: str, *args):
+        name = self._prefix + step
+        rv = call_with_deadline(name, getattr(self.session.lib, name), self.session.session, *args)
+        if rv != PyKCS11.CKR_OK:
+            raise PyKCS11.PyKCS11Error(rv)
+
+    def update(self, chunk: bytes) -> bytes:
+        """Feed one chunk; returns whatever output the HSM produced for it"""
+        # Output of a CBC update never exceeds the input plus one block
+        output = PyKCS11.ckbytelist(bytes(len(chunk) + AES_BLOCK_SIZE))
+        self._call("Update", PyKCS11.ckbytelist(chunk), output)
+        return bytes(output)
+
+    def final(self) -> bytes:
+        """Finish the operation, returning the last (padded or unpadded) block"""
+        output = PyKCS11.ckbytelist(bytes(AES_BLOCK_SIZE))
+        self._call("Final", output)
+        return bytes(output)
+
+    def close(self):
+        """Release the session; an unfinished operation is abandoned with it"""
+        if self._on_close:
+            on_close, self._on_close = self._on_close, None
+            on_close()
@@ -0,0 +1,28 @@
+from app.services.call_recorder import record_calls
+
+
+class PKCS11CallHeadersMiddleware:
+    """Adds the number of PKCS#11 C_* calls a request made as X-PKCS11-Calls response headers, with a per-function breakdown.
+
+    Calls made while a streamed body is sent come after the headers and are not included.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with record_calls() as log:
+            async def send_with_counts(message):
+                if message["type"] == "http.response.start":
+                    counts = ",".join(f"{name}={count}" for name, count in sorted(log.counts().items()))
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-pkcs11-calls", str(log.total).encode()),
+                        (b"x-pkcs11-call-breakdown", counts.encode()),
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_with_counts)
@@ -0,0 +1,108 @@
+import base64
+from typing import Optional, Tuple
+
+# Named curves by JWK "crv" name, with the DER-encoded OID CKA_EC_PARAMS carries for them
+EC_CURVES = {
+    "P-256": bytes.fromhex("06082a8648ce3d030107"),
+    "P-384": bytes.fromhex("06052b81040022"),
+    "P-521": bytes.fromhex("06052b81040023"),
+    "secp256k1": bytes.fromhex("06052b8104000a"),
+}
+
+# Field size in bytes of each curve, i.e. the length of each point coordinate
+EC_COORDINATE_SIZES = {"P-256": 32, "P-384": 48, "P-521": 66, "secp256k1": 32}
+
+RSA_ENCRYPTION_OID = bytes.fromhex("06092a864886f70d010101")
+EC_PUBLIC_KEY_OID = bytes.fromhex("06072a8648ce3d0201")
+DER_NULL = bytes.fromhex("0500")
+
+
+def der_length(length: int) -> bytes:
+    """DER length octets"""
+    if length < 0x80:
+        return bytes([length])
+    encoded = length.to_bytes((length.bit_length() + 7) // 8, "big")
+    return bytes([0x80 | len(encoded)]) + encoded
+
+
+def der(tag: int, content: bytes) -> bytes:
+    """One DER TLV"""
+    return bytes([tag]) + der_length(len(content)) + content
+
+
+def der_integer(value: bytes) -> bytes:
+    """Unsigned big-endian bytes as a DER INTEGER"""
+    value = value.lstrip(b"\x00") or b"\x00"
+    if value[0] & 0x80:
+        value = b"\x00" + value
+    return der(0x02, value)
+
+
+def der_unwrap_octet_string(value: bytes) -> bytes:
+    """Strip the DER OCTET STRING around a CKA_EC_POINT; some tokens return the bare point"""
+    if len(value) < 2 or value[0] != 0x04:
+        return value
+    if value[1] < 0x80:
+        header, length = 2, value[1]
+    else:
+        size = value[1] & 0x7f
+        header, length = 2 + size, int.from_bytes(value[2:2 + size], "big")
+    if header + length == len(value) and value[header:header + 1] in (b"\x04", b"\x02", b"\x03"):
+        return value[header:]
+    return value
+
+
+def curve_name(ec_params: bytes) -> Optional[str]:
+    """JWK curve name for a CKA_EC_PARAMS value, if it is a supported named curve"""
+    for name, oid in EC_CURVES.items():
+        if oid == bytes(ec_params):
+            return name
+    return None
+
+
+def rsa_spki(modulus: bytes, public_exponent: bytes) -> bytes:
+    """SubjectPublicKeyInfo DER for an RSA public key"""
+    algorithm = der(0x30, RSA_ENCRYPTION_OID + DER_NULL)
+    key = der(0x30, der_integer(modulus) + der_integer(public_exponent))
+    return der(0x30, algorithm + der(0x03, b"\x00" + key))
+
+
+def ec_spki(ec_params: bytes, ec_point: bytes) -> bytes:
+    """SubjectPublicKeyInfo DER for an EC public key"""
+    algorithm = der(0x30, EC_PUBLIC_KEY_OID + bytes(ec_params))
+    return der(0x30, algorithm + der(0x03, b"\x00" + der_unwrap_octet_string(bytes(ec_point))))
+
+
+def pem(spki: bytes) -> str:
+    """PEM "PUBLIC KEY" block for SubjectPublicKeyInfo DER"""
+    body = base64.b64encode(spki).decode()
+    lines = [body[i:i + 64] for i in range(0, len(body), 64)]
+    return "-----BEGIN PUBLIC KEY-----\n" + "\n".join(lines) + "\n-----END PUBLIC KEY-----\n"
+
+
+def b64url(value: bytes) -> str:
+    return base64.urlsafe_b64encode(value).rstrip(b"=").decode()
+
+
+def rsa_jwk(modulus: bytes, public_exponent: bytes) -> dict:
+    """RFC 7517 JWK members of an RSA public key"""
+    return {
+        "kty": "RSA",
+        "n": b64url(bytes(modulus).lstrip(b"\x00")),
+        "e": b64url(bytes(public_exponent).lstrip(b"\x00")),
+    }
+
+
+def ec_jwk(ec_params: bytes, ec_point: bytes) -> Optional[dict]:
+    """RFC 7517 JWK members of an EC public key; None for curves or point encodings JWK cannot express"""
+    crv = curve_name(ec_params)
+    point = der_unwrap_octet_string(bytes(ec_point))
+    if not crv or point[:1] != b"\x04":
+        return None
+    x, y = _split_point(point, EC_COORDINATE_SIZES[crv])
+    return {"kty": "EC", "crv": crv, "x": b64url(x), "y": b64url(y)}
+
+
+def _split_point(point: bytes, size: int) -> Tuple[bytes, bytes]:
+    """X and Y of an uncompressed point"""
+    return point[1:1 + size], point[1 + size:1 + 2 * size]
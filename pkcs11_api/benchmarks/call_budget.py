@@ -0,0 +1,159 @@
+"""Check how many PKCS#11 C_* calls each endpoint makes against its budget.
+
+Runs the API in-process against the library in PKCS11_LIB, e.g. SoftHSM in CI, or with --fake
+against an in-memory token so no HSM or PKCS#11 library is needed (the Docker build runs it so).
+Exits non-zero when an endpoint goes over budget:
+
+    PKCS11_LIB=/usr/lib/softhsm/libsofthsm2.so HSM_USERNAME=cu HSM_PASSWORD=... \\
+        python -m benchmarks.call_budget --keys 50
+    python -m benchmarks.call_budget --fake
+
+Calls are counted at the C_* level, as PyKCS11 makes them: an attribute read is two
+C_GetAttributeValue calls, or one per attribute on top when the object lacks one of them, a
+findObjects over N objects is C_FindObjectsInit, N // 10 + 1 C_FindObjects and C_FindObjectsFinal.
+The in-memory token, like an HSM, only gives objects the attributes of their class. It creates --keys AES keys and one RSA pair under a
+unique label prefix and deletes them again. Typeahead, which never reaches the token, is checked
+on latency over a synthetic 100k-label index instead (see benchmarks.label_index).
+"""
+import argparse
+import base64
+import hashlib
+import math
+import os
+import statistics
+import sys
+import uuid
+from collections import Counter
+
+os.environ["PKCS11_CALL_HEADERS"] = "true"
+# A slot list refresh would land in whichever check runs when it is due
+os.environ.setdefault("HSM_SLOT_REFRESH_INTERVAL", "3600")
+# Pool placeholders are enumerated but not listed, which would throw the per-object budgets off
+os.environ["RSA_KEY_POOL_TARGET"] = "0"
+
+from fastapi.testclient import TestClient  # noqa: E402
+import main as api  # noqa: E402
+from app.services.call_recorder import find_calls  # noqa: E402
+from app.services.cloudhsm_service import BATCH_SESSIONS, BATCH_MIN_PER_SESSION, KEY_CLASSES  # noqa: E402
+from app.services.slot_scheduler import slot_scheduler  # noqa: E402
+from benchmarks.fake_token import FakeToken  # noqa: E402
+from benchmarks.label_index import build_index, synthetic_keys, typeahead_timings  # noqa: E402
+
+# One logged-in session: C_OpenSession, C_Login, C_Logout, C_CloseSession
+SESSION = 4
+# One getAttributeValue: C_GetAttributeValue for the sizes, then for the values
+READ = 2
+# One sign: C_SignInit, then C_Sign for the size and for the signature
+SIGN = 3
+
+SIGN_BATCH = 100
+# Median typeahead latency allowed at TYPEAHEAD_LABELS labels, in-process on the label index
+TYPEAHEAD_LABELS = 100000
+TYPEAHEAD_BUDGET_MS = 1.0
+
+
+def checks(prefix: str, sync_token: str, objects: int, ec_keys: int, by_class: dict) -> list:
+    """(name, method, path, body, allowed calls[, expected status]) in order; later checks rely on the warm-up of earlier ones
+
+    Budgets state what each endpoint is meant to cost, not what a run happened to measure, so a
+    change that adds a search or an attribute read per key fails here.
+    """
+    sessions = max(1, min(BATCH_SESSIONS, math.ceil(SIGN_BATCH / BATCH_MIN_PER_SESSION)))
+    sign_request = {
+        "label": f"{prefix}-rsa",
+        "digests": [base64.b64encode(hashlib.sha256(str(i).encode()).digest()).decode() for i in range(SIGN_BATCH)]
+    }
+    return [
+        # One enumeration, one attribute read per object plus the curve of EC keys
+        ("list keys", "GET", "/keys", None, SESSION + find_calls(objects) + READ * (objects + ec_keys)),
+        # Served from the change feed and label index once a listing has been seen
+        ("changes since last listing", "GET", f"/keys/changes?since={sync_token}", None, 0),
+        ("search label index", "GET", f"/keys/search?prefix={prefix}", None, 0),
+        ("typeahead label index", "GET", f"/keys/typeahead?q={prefix}", None, 0),
+        ("find by label", "POST", "/keys/find", {"label": f"{prefix}-0"}, SESSION + find_calls(1) + READ),
+        ("find by label, cached handle", "POST", "/keys/find", {"label": f"{prefix}-0"}, SESSION + READ),
+        # Only the public half has CKA_MODULUS_BITS, so RSA sizes are checked on the modulus of each match
+        ("find RSA private key by size", "POST", "/keys/find",
+         {"label": f"{prefix}-rsa", "key_class": "PRIVATE_KEY", "key_size": 2048}, SESSION + find_calls(1) + READ + READ),
+        ("find EC key by size", "POST", "/keys/find", {"key_type": "EC", "key_size": 256}, SESSION, 400),
+        # One search per key class, one read per key bucketed client-side, plus C_GetTokenInfo, then cached
+        ("key stats", "GET", "/keys/stats", None,
+         SESSION + sum(find_calls(by_class.get(key_class, 0)) for key_class in KEY_CLASSES) + READ * objects + 1),
+        ("key stats, cached", "GET", "/keys/stats", None, 0),
+        # Key lookup on the request session, then one session per batch worker; workers may share a login
+        (f"sign {SIGN_BATCH} digests", "POST", "/crypto/sign", sign_request,
+         SESSION + find_calls(1) + SESSION * sessions + SIGN * SIGN_BATCH),
+        (f"sign {SIGN_BATCH} digests, cached handle", "POST", "/crypto/sign", sign_request,
+         SESSION * sessions + SIGN * SIGN_BATCH),
+        # Label check, C_GenerateKey and the read-back for the change feed
+        ("create AES key", "POST", "/keys/create",
+         {"label": f"{prefix}-created", "key_class": "SECRET_KEY", "key_type": "AES"}, SESSION + find_calls(0) + 1 + READ),
+        # Search, the read for the change feed and audit log, C_DestroyObject
+        ("delete AES key", "POST", "/keys/delete", {"label": f"{prefix}-created"}, SESSION + find_calls(1) + READ + 1),
+    ]
+
+
+def typeahead_latency() -> bool:
+    """Time typeahead over a synthetic TYPEAHEAD_LABELS-key index; True if the slowest query's median is within budget"""
+    index, _ = build_index("budget", synthetic_keys(TYPEAHEAD_LABELS))
+    median = max(statistics.median(timings) for timings in typeahead_timings(index, "budget").values()) * 1000
+    over = median > TYPEAHEAD_BUDGET_MS
+    print(f"{f'typeahead over {TYPEAHEAD_LABELS} labels':40} {median:5.3f}ms {TYPEAHEAD_BUDGET_MS:5.3f}ms  {'FAIL' if over else 'ok'}")
+    return not over
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keys", type=int, default=50, help="AES keys to create for the listing checks")
+    parser.add_argument("--fake", action="store_true", help="Run against an in-memory token instead of PKCS11_LIB")
+    args = parser.parse_args()
+
+    username = os.environ.get("HSM_USERNAME", "budget" if args.fake else None)
+    password = os.environ.get("HSM_PASSWORD", "budget" if args.fake else None)
+    if not username or not password:
+        raise SystemExit("Set HSM_USERNAME and HSM_PASSWORD, or pass --fake")
+    if args.fake:
+        slot_scheduler.use_library(FakeToken(f"{username}:{password}"))
+
+    prefix = f"budget-{uuid.uuid4().hex[:8]}"
+    failed = False
+
+    with TestClient(api.app) as client:
+        login = client.post("/api/v1/auth/login", json={"username": username, "password": password})
+        if login.status_code != 200:
+            raise SystemExit(f"Login failed: {login.text}")
+
+        def call(method: str, path: str, body=None):
+            return client.request(method, f"/api/v1{path}", json=body)
+
+        try:
+            for i in range(args.keys):
+                call("POST", "/keys/create", {"label": f"{prefix}-{i}", "key_class": "SECRET_KEY", "key_type": "AES"})
+            call("POST", "/keys/create", {"label": f"{prefix}-rsa", "key_class": "PRIVATE_KEY", "key_type": "RSA", "sign": True})
+
+            listing = call("GET", "/keys").json()
+            keys = listing["keys"]
+            ec_keys = sum(1 for key in keys if key["key_type"] == "EC")
+            by_class = Counter(key["key_class"] for key in keys)
+
+            print(f"{'check':40} {'calls':>6} {'budget':>7}")
+            for name, method, path, body, budget, *status in checks(prefix, listing["sync_token"], len(keys), ec_keys, by_class):
+                response = call(method, path, body)
+                calls = int(response.headers.get("x-pkcs11-calls", "-1"))
+                unexpected = response.status_code != (status[0] if status else 200)
+                over = unexpected or not 0 <= calls <= budget
+                failed = failed or over
+                print(f"{name:40} {calls:6} {budget:7}  {'FAIL' if over else 'ok'}"
+                      + (f"  status {response.status_code}" if unexpected else "")
+                      + (f"  {response.headers.get('x-pkcs11-call-breakdown')}" if over else ""))
+        finally:
+            for label in [f"{prefix}-{i}" for i in range(args.keys)] + [f"{prefix}-rsa", f"{prefix}-rsa-public", f"{prefix}-created"]:
+                call("POST", "/keys/delete", {"label": label})
+
+    # Makes no PKCS#11 calls, so it is checked on latency instead
+    failed = not typeahead_latency() or failed
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""In-memory stand-in for a PKCS#11 library, for running the call budget checks without an HSM.
+
+Implements the part of the PyKCS11Lib and Session API the service uses, with the value types
+PyKCS11 returns (str labels, byte lists for binary attributes, identity-compared object handles).
+Objects only have the attributes of their class and key type: reading another one returns None,
+as PyKCS11 does after falling back to one read per attribute on CKR_ATTRIBUTE_TYPE_INVALID, and
+searching by one matches nothing. It does no cryptography: signatures, wrapped keys and random
+bytes are placeholders.
+"""
+import hashlib
+import itertools
+import os
+import threading
+import PyKCS11
+
+# Attributes each object class has, plus those of its key type
+COMMON_ATTRIBUTES = {PyKCS11.CKA_CLASS, PyKCS11.CKA_TOKEN, PyKCS11.CKA_PRIVATE, PyKCS11.CKA_LABEL,
+                     PyKCS11.CKA_MODIFIABLE, PyKCS11.CKA_DESTROYABLE}
+KEY_ATTRIBUTES = COMMON_ATTRIBUTES | {PyKCS11.CKA_KEY_TYPE, PyKCS11.CKA_ID, PyKCS11.CKA_LOCAL}
+CLASS_ATTRIBUTES = {
+    PyKCS11.CKO_SECRET_KEY: KEY_ATTRIBUTES | {
+        PyKCS11.CKA_SENSITIVE, PyKCS11.CKA_EXTRACTABLE, PyKCS11.CKA_ENCRYPT, PyKCS11.CKA_DECRYPT, PyKCS11.CKA_SIGN,
+        PyKCS11.CKA_VERIFY, PyKCS11.CKA_WRAP, PyKCS11.CKA_UNWRAP, PyKCS11.CKA_VALUE, PyKCS11.CKA_VALUE_LEN},
+    PyKCS11.CKO_PRIVATE_KEY: KEY_ATTRIBUTES | {
+        PyKCS11.CKA_SENSITIVE, PyKCS11.CKA_EXTRACTABLE, PyKCS11.CKA_DECRYPT, PyKCS11.CKA_SIGN, PyKCS11.CKA_UNWRAP},
+    PyKCS11.CKO_PUBLIC_KEY: KEY_ATTRIBUTES | {PyKCS11.CKA_ENCRYPT, PyKCS11.CKA_VERIFY, PyKCS11.CKA_WRAP},
+}
+KEY_TYPE_ATTRIBUTES = {
+    (PyKCS11.CKO_PRIVATE_KEY, PyKCS11.CKK_RSA): {PyKCS11.CKA_MODULUS, PyKCS11.CKA_PUBLIC_EXPONENT},
+    (PyKCS11.CKO_PUBLIC_KEY, PyKCS11.CKK_RSA): {PyKCS11.CKA_MODULUS, PyKCS11.CKA_MODULUS_BITS, PyKCS11.CKA_PUBLIC_EXPONENT},
+    (PyKCS11.CKO_PRIVATE_KEY, PyKCS11.CKK_EC): {PyKCS11.CKA_EC_PARAMS},
+    (PyKCS11.CKO_PUBLIC_KEY, PyKCS11.CKK_EC): {PyKCS11.CKA_EC_PARAMS, PyKCS11.CKA_EC_POINT},
+}
+
+# Attributes an object reports unless its template set them, where its class has them
+DEFAULTS = {
+    PyKCS11.CKA_TOKEN: True,
+    PyKCS11.CKA_PRIVATE: True,
+    PyKCS11.CKA_SENSITIVE: True,
+    PyKCS11.CKA_EXTRACTABLE: False,
+    PyKCS11.CKA_LOCAL: True,
+    PyKCS11.CKA_MODIFIABLE: True,
+    PyKCS11.CKA_DESTROYABLE: True,
+    PyKCS11.CKA_LABEL: "",
+    PyKCS11.CKA_ID: b"",
+}
+
+
+class FakeHandle:
+    """Object handle; like CK_OBJECT_HANDLE it compares by identity and exposes its number through value()"""
+
+    def __init__(self, number: int):
+        self._number = number
+
+    def value(self) -> int:
+        return self._number
+
+
+class FakeTokenInfo:
+    label = "fake-token"
+    ulMaxSessionCount = 1024
+    ulSessionCount = 0
+    ulTotalPublicMemory = 1 << 20
+    ulFreePublicMemory = 1 << 20
+    ulTotalPrivateMemory = 1 << 20
+    ulFreePrivateMemory = 1 << 20
+
+
+class FakeToken:
+    """One partition shared by all slots; objects keep their handle numbers across sessions like on CloudHSM"""
+
+    def __init__(self, pin: str, slots: int = 1):
+        self.pin = pin
+        self.slots = list(range(slots))
+        self.objects = {}  # handle number -> {attribute: value}
+        self.logins = {}   # slot -> logged in PIN
+        self._numbers = itertools.count(1)
+        self._lock = threading.Lock()
+
+    # PyKCS11Lib
+
+    def getSlotList(self, tokenPresent: bool = False) -> list:
+        return list(self.slots)
+
+    def getTokenInfo(self, slot: int) -> FakeTokenInfo:
+        return FakeTokenInfo()
+
+    def openSession(self, slot: int, flags: int = 0) -> "FakeSession":
+        if slot not in self.slots:
+            raise PyKCS11.PyKCS11Error(PyKCS11.CKR_SLOT_ID_INVALID)
+        return FakeSession(self, slot)
+
+    def create(self, template) -> FakeHandle:
+        attributes = dict(template)
+        valid = _valid_attributes(attributes)
+        if any(attribute not in valid for attribute in attributes):
+            raise PyKCS11.PyKCS11Error(PyKCS11.CKR_ATTRIBUTE_TYPE_INVALID)
+        attributes.update((attribute, value) for attribute, value in DEFAULTS.items()
+                          if attribute in valid and attribute not in attributes)
+        with self._lock:
+            number = next(self._numbers)
+            self.objects[number] = attributes
+        return FakeHandle(number)
+
+
+class FakeSession:
+    def __init__(self, token: FakeToken, slot: int):
+        self.token = token
+        self.slot = slot
+
+    def _attributes(self, handle) -> dict:
+        attributes = self.token.objects.get(handle.value())
+        if attributes is None:
+            raise PyKCS11.PyKCS11Error(PyKCS11.CKR_OBJECT_HANDLE_INVALID)
+        return attributes
+
+    def login(self, pin: str):
+        with self.token._lock:
+            if self.slot in self.token.logins:
+                raise PyKCS11.PyKCS11Error(PyKCS11.CKR_USER_ALREADY_LOGGED_IN)
+            if pin != self.token.pin:
+                raise PyKCS11.PyKCS11Error(PyKCS11.CKR_PIN_INCORRECT)
+            self.token.logins[self.slot] = pin
+
+    def logout(self):
+        with self.token._lock:
+            if self.token.logins.pop(self.slot, None) is None:
+                raise PyKCS11.PyKCS11Error(PyKCS11.CKR_USER_NOT_LOGGED_IN)
+
+    def closeSession(self):
+        pass
+
+    def findObjects(self, template=()) -> list:
+        wanted = [(attribute, _comparable(value)) for attribute, value in template]
+        return [
+            FakeHandle(number) for number, attributes in sorted(self.token.objects.items())
+            if all(attribute in attributes and _comparable(attributes[attribute]) == value for attribute, value in wanted)
+        ]
+
+    def getAttributeValue(self, handle, attributes: list, allAsBinary: bool = False) -> list:
+        values = self._attributes(handle)
+        valid = _valid_attributes(values)
+        return [_returned(attribute, values.get(attribute)) if attribute in valid else None for attribute in attributes]
+
+    def setAttributeValue(self, handle, template):
+        values = self._attributes(handle)
+        valid = _valid_attributes(values)
+        if any(attribute not in valid for attribute, _ in template):
+            raise PyKCS11.PyKCS11Error(PyKCS11.CKR_ATTRIBUTE_TYPE_INVALID)
+        values.update(template)
+
+    def destroyObject(self, handle):
+        self._attributes(handle)
+        self.token.objects.pop(handle.value(), None)
+
+    def createObject(self, template) -> FakeHandle:
+        return self.token.create(template)
+
+    def generateKey(self, template, mecha=None) -> FakeHandle:
+        return self.token.create(list(template) + [(PyKCS11.CKA_LOCAL, True)])
+
+    def generateKeyPair(self, public_template, private_template, mecha=None) -> tuple:
+        public = dict(public_template)
+        shared = []
+        if PyKCS11.CKA_MODULUS_BITS in public:
+            bits = public[PyKCS11.CKA_MODULUS_BITS]
+            # The private half has the modulus but, unlike the public one, no CKA_MODULUS_BITS
+            shared = [(PyKCS11.CKA_MODULUS, b"\xc1" + os.urandom(bits // 8 - 1)),
+                      (PyKCS11.CKA_PUBLIC_EXPONENT, bytes(public.get(PyKCS11.CKA_PUBLIC_EXPONENT, (1, 0, 1))))]
+        elif PyKCS11.CKA_EC_PARAMS in public:
+            shared = [(PyKCS11.CKA_EC_PARAMS, public[PyKCS11.CKA_EC_PARAMS])]
+            public_template = list(public_template) + [(PyKCS11.CKA_EC_POINT, b"\x04\x41\x04" + os.urandom(64))]
+        return (self.token.create(list(public_template) + shared + [(PyKCS11.CKA_PRIVATE, False)]),
+                self.token.create(list(private_template) + shared))
+
+    def sign(self, key, data, mecha=None) -> list:
+        self._attributes(key)
+        return list(hashlib.sha256(bytes(data)).digest() * 8)
+
+    def verify(self, key, data, signature, mecha=None) -> bool:
+        self._attributes(key)
+        return True
+
+    def wrapKey(self, wrapping_key, key, mecha=None) -> list:
+        self._attributes(wrapping_key)
+        return list(b"wrapped" + self._attributes(key).get(PyKCS11.CKA_LABEL, "").encode())
+
+    def unwrapKey(self, unwrapping_key, wrapped, template, mecha=None) -> FakeHandle:
+        self._attributes(unwrapping_key)
+        return self.token.create(template)
+
+    def generateRandom(self, size: int) -> list:
+        return list(os.urandom(size))
+
+
+def _valid_attributes(attributes: dict) -> set:
+    """Attributes an object of this class and key type has"""
+    key_class = attributes.get(PyKCS11.CKA_CLASS)
+    return (CLASS_ATTRIBUTES.get(key_class, COMMON_ATTRIBUTES)
+            | KEY_TYPE_ATTRIBUTES.get((key_class, attributes.get(PyKCS11.CKA_KEY_TYPE)), set()))
+
+
+def _comparable(value):
+    """Template values and stored values in one form: str labels and byte sequences as bytes"""
+    if isinstance(value, str):
+        return value.encode()
+    if isinstance(value, (bytes, bytearray, list, tuple)):
+        return bytes(value)
+    return value
+
+
+def _returned(attribute: int, value):
+    """Attribute value typed the way PyKCS11 returns it"""
+    if value is None:
+        return None
+    if attribute == PyKCS11.CKA_LABEL:
+        return value if isinstance(value, str) else bytes(value).decode("utf-8", errors="ignore")
+    if isinstance(value, (bytes, bytearray, list, tuple)):
+        return list(bytes(value))
+    return value
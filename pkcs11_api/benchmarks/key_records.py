@@ -0,0 +1,72 @@
+"""Compare memory per key and list-building time of KeyInfo models and compact key records.
+
+Runs in-process on synthetic attribute values shaped like getAttributeValue results, so no HSM
+is needed; PyKCS11 must still be importable:
+
+    python -m benchmarks.key_records --keys 100000
+"""
+import argparse
+import gc
+import os
+import time
+import tracemalloc
+import PyKCS11
+from app.services.cloudhsm_service import CloudHSMService
+from app.services.key_records import KeyRecord, key_infos
+
+KEY_SPECS = [
+    (PyKCS11.CKO_SECRET_KEY, PyKCS11.CKK_AES),
+    (PyKCS11.CKO_PRIVATE_KEY, PyKCS11.CKK_RSA),
+    (PyKCS11.CKO_PUBLIC_KEY, PyKCS11.CKK_RSA),
+]
+
+
+def attributes(count: int) -> list:
+    """CKA_CLASS, CKA_KEY_TYPE, CKA_LABEL and CKA_ID values as PyKCS11 returns them: labels as str, IDs as lists of ints"""
+    return [
+        [*KEY_SPECS[i % len(KEY_SPECS)], f"payments-service-key-{i:08d}", list(os.urandom(16))]
+        for i in range(count)
+    ]
+
+
+def measure(build, rows: list) -> tuple:
+    """(seconds to build, bytes retained per key, built list)"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    keys = build(rows)
+    elapsed = time.perf_counter() - started
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return elapsed, retained / len(rows), keys
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keys", type=int, default=100000, help="Synthetic keys to build")
+    args = parser.parse_args()
+
+    rows = attributes(args.keys)
+    service = CloudHSMService()
+
+    models_time, models_bytes, models = measure(lambda rows: [service._create_key_info(attrs) for attrs in rows], rows)
+    del models
+    records_time, records_bytes, records = measure(lambda rows: [KeyRecord.from_attributes(attrs) for attrs in rows], rows)
+
+    # What a listing pays on top: hex-encoding every ID (labels arrive decoded), then models at the response boundary
+    started = time.perf_counter()
+    for record in records:
+        record.label, record.key_id
+    decode_time = time.perf_counter() - started
+    started = time.perf_counter()
+    key_infos(records)
+    response_time = time.perf_counter() - started
+
+    print(f"{'representation':16} {'bytes/key':>10} {'build':>10}")
+    print(f"{'KeyInfo':16} {models_bytes:10.0f} {models_time * 1000:8.1f}ms")
+    print(f"{'KeyRecord':16} {records_bytes:10.0f} {records_time * 1000:8.1f}ms")
+    print(f"records: read labels/IDs {decode_time * 1000:.1f}ms, KeyInfo at the response {response_time * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
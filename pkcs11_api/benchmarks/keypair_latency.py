@@ -0,0 +1,88 @@
+"""Compare RSA and EC key pair generation and signing latency.
+
+Run from pkcs11_api/ against a configured HSM, simulator or SoftHSM (PKCS11_LIB), with the
+RSA key pool disabled so every RSA pair is really generated:
+
+    HSM_USERNAME=cu HSM_PASSWORD=... python -m benchmarks.keypair_latency --pairs 5 --signatures 200
+
+The benchmark pairs are deleted again at the end.
+"""
+import argparse
+import base64
+import hashlib
+import os
+import time
+import uuid
+from app.models.crypto_schemas import SignBatchRequest
+from app.models.key_schemas import CreateKeyRequest, DeleteKeyRequest
+from app.services.cloudhsm_service import CloudHSMService
+
+# (name, key type, key size or curve, signature algorithm)
+SPECS = [
+    ("RSA-2048", "RSA", 2048, "RSA_PKCS"),
+    ("RSA-3072", "RSA", 3072, "RSA_PKCS"),
+    ("RSA-4096", "RSA", 4096, "RSA_PKCS"),
+    ("EC P-256", "EC", "P-256", "ECDSA"),
+    ("EC P-384", "EC", "P-384", "ECDSA"),
+]
+
+
+def percentiles(samples: list) -> tuple:
+    samples = sorted(samples)
+    return samples[len(samples) // 2] * 1000, samples[int(len(samples) * 0.95)] * 1000
+
+
+def generate(username: str, password: str, key_type: str, size, labels: list) -> list:
+    latencies = []
+    for label in labels:
+        request = CreateKeyRequest(
+            label=label, key_class="PRIVATE_KEY", key_type=key_type, sign=True, verify=True,
+            **({"curve": size} if key_type == "EC" else {"key_size": size})
+        )
+        started = time.perf_counter()
+        response = CloudHSMService().create_key(username, password, request)
+        latencies.append(time.perf_counter() - started)
+        if not response.success:
+            raise SystemExit(f"Generating {label} failed: {response.message}")
+    return latencies
+
+
+def sign(username: str, password: str, label: str, algorithm: str, count: int) -> list:
+    latencies = []
+    for i in range(count):
+        digest = base64.b64encode(hashlib.sha256(str(i).encode()).digest()).decode()
+        started = time.perf_counter()
+        response = CloudHSMService().sign_digests(
+            username, password, SignBatchRequest(label=label, algorithm=algorithm, digests=[digest])
+        )
+        latencies.append(time.perf_counter() - started)
+        if response is None or response.failed:
+            raise SystemExit(f"Signing with {label} failed")
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pairs", type=int, default=5, help="Key pairs to generate per key type")
+    parser.add_argument("--signatures", type=int, default=200, help="Digests to sign one at a time per key type")
+    args = parser.parse_args()
+
+    username = os.environ["HSM_USERNAME"]
+    password = os.environ["HSM_PASSWORD"]
+    run = uuid.uuid4().hex[:8]
+
+    print(f"{'key':10} {'keygen p50':>11} {'keygen p95':>11} {'sign p50':>9} {'sign p95':>9}")
+    for name, key_type, size, algorithm in SPECS:
+        labels = [f"bench-{run}-{name.replace(' ', '-').lower()}-{i}" for i in range(args.pairs)]
+        try:
+            keygen_p50, keygen_p95 = percentiles(generate(username, password, key_type, size, labels))
+            sign_p50, sign_p95 = percentiles(sign(username, password, labels[0], algorithm, args.signatures))
+            print(f"{name:10} {keygen_p50:9.1f}ms {keygen_p95:9.1f}ms {sign_p50:7.1f}ms {sign_p95:7.1f}ms")
+        finally:
+            for label in labels:
+                for pair_label in (label, f"{label}-public"):
+                    CloudHSMService().delete_key(username, password, DeleteKeyRequest(label=pair_label))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Time typeahead and search queries against the in-memory label index over a large inventory.
+
+Runs in-process on synthetic keys, so no HSM is needed; exits non-zero when the median typeahead
+query takes longer than --budget-ms (the target is under a millisecond at 100k labels):
+
+    python -m benchmarks.label_index --labels 100000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from app.models.keys import KeyInfo
+from app.services.label_index import LabelIndex
+
+SERVICES = ["payments", "billing", "identity", "ledger", "reports", "search", "storage", "tokens"]
+ENVIRONMENTS = ["prod", "staging", "dev"]
+KEY_SPECS = [("SECRET_KEY", "AES"), ("PRIVATE_KEY", "RSA"), ("PUBLIC_KEY", "RSA"), ("PRIVATE_KEY", "EC")]
+
+# Short prefixes match most of the index, long ones a handful of keys, the last one nothing
+TYPEAHEAD_QUERIES = ["p", "PAY", "payments-", "payments-prod-", "payments-prod-0001", "ledger-dev-00042", "zzz"]
+SEARCHES = [
+    ("prefix", dict(prefix="billing-staging-01")),
+    ("prefix, limit 50", dict(prefix="identity-", limit=50)),
+    ("glob", dict(glob="tokens-prod-00*7")),
+    ("id prefix", dict(id_prefix="ab")),
+    ("contains, limit 50", dict(contains="-dev-0009", limit=50)),
+]
+
+
+def synthetic_keys(count: int) -> list:
+    """KeyInfo shaped like a partition's listing: <service>-<environment>-<serial> labels, random IDs"""
+    keys = []
+    for i in range(count):
+        key_class, key_type = KEY_SPECS[i % len(KEY_SPECS)]
+        label = f"{SERVICES[i % len(SERVICES)]}-{ENVIRONMENTS[i // len(SERVICES) % len(ENVIRONMENTS)]}-{i:06d}"
+        keys.append(KeyInfo(key_class=key_class, key_type=key_type, label=label, key_id=os.urandom(16).hex()))
+    return keys
+
+
+def build_index(username: str, keys: list) -> tuple:
+    """(index, seconds) for one enumeration fed through the inventory feed listener"""
+    index = LabelIndex()
+    started = time.perf_counter()
+    index.apply(username, keys, [])
+    return index, time.perf_counter() - started
+
+
+def time_queries(query, repeat: int) -> list:
+    """Seconds per call of query(), repeat times"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        query()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def percentile(timings: list, fraction: float) -> float:
+    ordered = sorted(timings)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def typeahead_timings(index: LabelIndex, username: str, repeat: int = 200) -> dict:
+    """Typeahead query -> per-call seconds, limit 10 as the dashboard asks for"""
+    return {q: time_queries(lambda: index.typeahead(username, q, 10), repeat) for q in TYPEAHEAD_QUERIES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--labels", type=int, default=100000, help="Synthetic keys in the index")
+    parser.add_argument("--repeat", type=int, default=200, help="Runs of each query")
+    parser.add_argument("--budget-ms", type=float, default=1.0, help="Allowed median typeahead latency")
+    args = parser.parse_args()
+
+    username = "bench"
+    index, build_time = build_index(username, synthetic_keys(args.labels))
+    print(f"built index of {args.labels} labels in {build_time * 1000:.0f}ms")
+
+    failed = False
+    print(f"{'query':32} {'median':>9} {'p99':>9}")
+    for q, timings in typeahead_timings(index, username, args.repeat).items():
+        median = statistics.median(timings) * 1000
+        p99 = percentile(timings, 0.99) * 1000
+        over = median > args.budget_ms
+        failed = failed or over
+        print(f"{'typeahead ' + repr(q):32} {median:7.3f}ms {p99:7.3f}ms{'  FAIL' if over else ''}")
+
+    # Search has no latency target; listed to show what the prefix narrowing buys
+    for name, filters in SEARCHES:
+        timings = time_queries(lambda: index.search(username, **filters), max(args.repeat // 10, 1))
+        print(f"{'search ' + name:32} {statistics.median(timings) * 1000:7.3f}ms {percentile(timings, 0.99) * 1000:7.3f}ms")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Compare random byte throughput from the buffered pool with one C_GenerateRandom per request.
+
+Run from pkcs11_api/ against a configured HSM:
+
+    HSM_USERNAME=cu HSM_PASSWORD=... python -m benchmarks.random_bytes --length 32 --count 5000
+"""
+import argparse
+import os
+import time
+from app.services.cloudhsm_service import CloudHSMService
+from app.services.random_pool import random_pool
+
+
+def direct(username: str, password: str, length: int, count: int) -> float:
+    started = time.perf_counter()
+    for _ in range(count):
+        CloudHSMService().generate_random(username, password, length)
+    return count / (time.perf_counter() - started)
+
+
+def pooled(username: str, password: str, length: int, count: int) -> float:
+    started = time.perf_counter()
+    for _ in range(count):
+        # Same fallback as GET /crypto/random when the pool runs dry
+        if random_pool.take(username, password, length) is None:
+            CloudHSMService().generate_random(username, password, length)
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--length", type=int, default=32, help="Bytes per request")
+    parser.add_argument("--count", type=int, default=5000, help="Requests per mode")
+    args = parser.parse_args()
+
+    username = os.environ["HSM_USERNAME"]
+    password = os.environ["HSM_PASSWORD"]
+
+    print(f"direct: {direct(username, password, args.length, args.count):10.0f} requests/s")
+
+    random_pool.start()
+    try:
+        # Let the refill thread fill the buffer once before timing
+        random_pool.take(username, password, random_pool.capacity + 1)
+        while random_pool.stats()["level"] < random_pool.capacity and not random_pool.stats()["last_error"]:
+            time.sleep(0.05)
+        print(f"pooled: {pooled(username, password, args.length, args.count):10.0f} requests/s")
+    finally:
+        random_pool.stop()
+
+    stats = random_pool.stats()
+    print(f"pool hit rate {stats['hit_rate']:.3f}, {stats['refills']} refills, "
+          f"refill p50 {stats['refill_p50_ms']:.1f}ms p95 {stats['refill_p95_ms']:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
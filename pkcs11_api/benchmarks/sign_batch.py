@@ -0,0 +1,60 @@
+"""Compare batch signing throughput with one signing call per digest.
+
+Run from pkcs11_api/ against a configured HSM:
+
+    HSM_USERNAME=cu HSM_PASSWORD=... python -m benchmarks.sign_batch --label signing-key --count 2000
+"""
+import argparse
+import base64
+import hashlib
+import os
+import time
+from app.models.crypto_schemas import SignBatchRequest
+from app.services.cloudhsm_service import CloudHSMService
+
+
+def digests(count: int) -> list:
+    return [base64.b64encode(hashlib.sha256(str(i).encode()).digest()).decode() for i in range(count)]
+
+
+def one_at_a_time(username: str, password: str, label: str, items: list) -> float:
+    started = time.perf_counter()
+    for digest in items:
+        CloudHSMService().sign_digests(username, password, SignBatchRequest(label=label, digests=[digest]))
+    return len(items) / (time.perf_counter() - started)
+
+
+def batched(username: str, password: str, label: str, items: list, batch_size: int) -> float:
+    started = time.perf_counter()
+    for offset in range(0, len(items), batch_size):
+        response = CloudHSMService().sign_digests(
+            username, password, SignBatchRequest(label=label, digests=items[offset:offset + batch_size])
+        )
+        if response is None:
+            raise SystemExit(f"Signing key '{label}' not found")
+        if response.failed:
+            print(f"  {response.failed} signatures failed in batch at {offset}")
+    return len(items) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--label", required=True, help="Label of an RSA private key with CKA_SIGN")
+    parser.add_argument("--count", type=int, default=1000, help="Digests to sign per run")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Digests per batch request")
+    parser.add_argument("--single-count", type=int, default=200, help="Digests to sign one at a time")
+    args = parser.parse_args()
+
+    username = os.environ["HSM_USERNAME"]
+    password = os.environ["HSM_PASSWORD"]
+
+    single_rate = one_at_a_time(username, password, args.label, digests(args.single_count))
+    print(f"one at a time: {single_rate:8.1f} signatures/s ({args.single_count} digests)")
+
+    batch_rate = batched(username, password, args.label, digests(args.count), args.batch_size)
+    print(f"batched:       {batch_rate:8.1f} signatures/s ({args.count} digests, batches of {args.batch_size})")
+    print(f"speedup:       {batch_rate / single_rate:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Measure streaming AES-CBC-PAD throughput and peak RSS at several payload sizes.
+
+Payloads are generated chunk by chunk and the output is discarded, so the RSS
+growth reflects what the cipher stream itself keeps in memory. Run from
+pkcs11_api/ against a configured HSM:
+
+    HSM_USERNAME=cu HSM_PASSWORD=... python -m benchmarks.stream_cipher --label data-key --sizes 16,128,512
+"""
+import argparse
+import os
+import resource
+import time
+from app.services.cloudhsm_service import CloudHSMService
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(username: str, password: str, label: str, size: int, chunk_size: int) -> float:
+    cipher = CloudHSMService().open_cipher(username, password, label, os.urandom(16))
+    if cipher is None:
+        raise SystemExit(f"Encryption key '{label}' not found")
+
+    chunk = os.urandom(chunk_size)
+    started = time.perf_counter()
+    try:
+        remaining = size
+        while remaining > 0:
+            cipher.update(chunk[:remaining])
+            remaining -= chunk_size
+        cipher.final()
+    finally:
+        cipher.close()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--label", required=True, help="Label of an AES key with CKA_ENCRYPT")
+    parser.add_argument("--sizes", default="16,128,512", help="Payload sizes in MiB, smallest first")
+    parser.add_argument("--chunk-size", type=int, default=1024 * 1024, help="Bytes per update call")
+    args = parser.parse_args()
+
+    username = os.environ["HSM_USERNAME"]
+    password = os.environ["HSM_PASSWORD"]
+    baseline = peak_rss_mb()
+
+    for size_mb in sorted(int(size) for size in args.sizes.split(",")):
+        elapsed = run(username, password, args.label, size_mb * 1024 * 1024, args.chunk_size)
+        print(f"{size_mb:6d} MiB: {size_mb / elapsed:8.1f} MiB/s, peak RSS +{peak_rss_mb() - baseline:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Compare startup time and first key listing latency with and without the persisted inventory snapshot.
+
+Each run starts the API in a fresh process against the configured HSM, simulator or SoftHSM
+(PKCS11_LIB) and the local database, once with the snapshot table emptied and once with the
+snapshot the previous process left behind:
+
+    HSM_USERNAME=cu HSM_PASSWORD=... python -m benchmarks.warm_restart --runs 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+def child():
+    """Start the app, log in and time the first GET /keys; prints one JSON line"""
+    started = time.perf_counter()
+    from fastapi.testclient import TestClient
+    import main as api
+
+    with TestClient(api.app) as client:
+        startup = time.perf_counter() - started
+        login = client.post("/api/v1/auth/login", json={"username": os.environ["HSM_USERNAME"], "password": os.environ["HSM_PASSWORD"]})
+        if login.status_code != 200:
+            raise SystemExit(f"Login failed: {login.text}")
+
+        requested = time.perf_counter()
+        response = client.get("/api/v1/keys")
+        first_query = time.perf_counter() - requested
+        if response.status_code != 200:
+            raise SystemExit(f"Listing keys failed: {response.text}")
+
+        print(json.dumps({"startup": startup, "first_query": first_query, "keys": response.json()["count"]}))
+
+
+def run(clear: bool) -> dict:
+    if clear:
+        from app.models.database import InventoryRecord, SessionLocal, create_tables
+
+        create_tables()
+        db = SessionLocal()
+        try:
+            db.query(InventoryRecord).delete()
+            db.commit()
+        finally:
+            db.close()
+    output = subprocess.run([sys.executable, "-m", "benchmarks.warm_restart", "--child"],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="Cold and warm starts to time each")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    print(f"{'start':6} {'keys':>6} {'startup':>9} {'first GET /keys':>16}")
+    for _ in range(args.runs):
+        # The cold start leaves a fresh snapshot behind for the warm one
+        for name, clear in (("cold", True), ("warm", False)):
+            result = run(clear)
+            print(f"{name:6} {result['keys']:6} {result['startup'] * 1000:7.1f}ms {result['first_query'] * 1000:14.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,17 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from app.routers import auth, keys, hsm_config
+from fastapi.responses import FileResponse, JSONResponse
+from app.routers import auth, keys, hsm_config, crypto, audit
 from app.models.database import create_tables
+from app.services.audit_log import audit_log
+from app.services.circuit_breaker import circuit_breaker
+from app.services.errors import HSMUnavailableError
+from app.services.inventory_feed import inventory_feed
+from app.services.inventory_snapshot import inventory_snapshot
+from app.services.key_pool_service import key_pool
+from app.services.random_pool import random_pool
+from app.utils.call_headers import PKCS11CallHeadersMiddleware
 import os
 
 # Create database tables on startup
@@ -18,11 +26,16 @@ app = FastAPI(
     
 )
 
+# Report PKCS#11 calls per request, for the call budget checks in benchmarks/call_budget.py
+if os.getenv("PKCS11_CALL_HEADERS", "false").lower() == "true":
+    app.add_middleware(PKCS11CallHeadersMiddleware)
 
 # Include routers
 app.include_router(auth.router, prefix="/api/v1")
 app.include_router(keys.router, prefix="/api/v1")
 app.include_router(hsm_config.router, prefix="/api/v1")
+app.include_router(crypto.router, prefix="/api/v1")
+app.include_router(audit.router, prefix="/api/v1")
 
 # Mount static files for React frontend
 if os.path.exists("../build"):
@@ -40,7 +53,34 @@ if os.path.exists("../build"):
         # For API routes, let FastAPI's 404 handler take over
         raise HTTPException(status_code=404, detail="Not found")
 
+@app.exception_handler(HSMUnavailableError)
+async def hsm_unavailable_handler(request: Request, exc: HSMUnavailableError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
+@app.on_event("startup")
+async def start_background_workers():
+    audit_log.start()
+    # Before the feed starts, so its first pass revalidates the restored inventory
+    inventory_snapshot.load()
+    inventory_snapshot.start()
+    circuit_breaker.start()
+    key_pool.start()
+    random_pool.start()
+    inventory_feed.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    inventory_feed.stop()
+    inventory_snapshot.stop()
+    random_pool.stop()
+    key_pool.stop()
+    circuit_breaker.stop()
+    # Last, so events from the workers above are flushed too
+    audit_log.stop()
 
 @app.get("/health")
 async def health_check():
@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from 'react';
 import { Navigate } from 'react-router-dom';
-import { Spinner, Box } from '@cloudscape-design/components';
+import { Spinner, Box, Alert } from '@cloudscape-design/components';
 import { checkHSMHealth } from '../services/hsmService';
 
 const HSMGuard = ({ children }) => {
@@ -23,6 +23,23 @@ const HSMGuard = ({ children }) => {
     checkHSM();
   }, []);
 
+  // While the circuit breaker is open, keep polling until the HSM recovers
+  useEffect(() => {
+    if (!hsmStatus?.degraded) {
+      return undefined;
+    }
+
+    const interval = setInterval(async () => {
+      try {
+        setHsmStatus(await checkHSMHealth());
+      } catch (error) {
+        console.error('Failed to check HSM status:', error);
+      }
+    }, 10000);
+
+    return () => clearInterval(interval);
+  }, [hsmStatus?.degraded]);
+
   if (loading) {
     return (
       <Box textAlign="center" padding="xxl">
@@ -34,6 +51,18 @@ const HSMGuard = ({ children }) => {
     );
   }
 
+  // If the HSM is configured but unreachable, show the degraded state instead of redirecting
+  if (hsmStatus?.configured && hsmStatus?.degraded) {
+    return (
+      <Box padding="xxl">
+        <Alert type="warning" header="HSM temporarily unreachable">
+          Requests to the HSM are failing fast after repeated connection errors.
+          This page will recover automatically once the HSM health check succeeds.
+        </Alert>
+      </Box>
+    );
+  }
+
   // If HSM is not configured, redirect to config page
   if (!hsmStatus?.configured || !hsmStatus?.connected) {
     return <Navigate to="/hsm-config" replace />;
@@ -43,10 +43,19 @@ const CreateKeyModal = ({ visible, onDismiss }) => {
 
   const keyTypeOptions = [
     { label: 'AES', value: 'AES' },
-    { label: 'RSA', value: 'RSA' }
+    { label: 'RSA', value: 'RSA' },
+    { label: 'EC', value: 'EC' }
+  ];
+
+  const curveOptions = [
+    { label: 'P-256', value: 'P-256' },
+    { label: 'P-384', value: 'P-384' },
+    { label: 'P-521', value: 'P-521' },
+    { label: 'secp256k1', value: 'secp256k1' }
   ];
 
   const isAES = formData.key_type === 'AES';
+  const isEC = formData.key_type === 'EC';
 
   return (
     <Modal
@@ -103,17 +112,27 @@ const CreateKeyModal = ({ visible, onDismiss }) => {
             />
           </FormField>
 
-          <FormField 
-            label="Key Size" 
-            constraintText={isAES ? "Required for AES keys (bytes)" : "Optional for RSA keys (bits)"}
-          >
-            <Input
-              value={formData.key_size?.toString() || ''}
-              onChange={({ detail }) => setFormData({ ...formData, key_size: parseInt(detail.value) || null })}
-              placeholder={isAES ? "32 (256-bit)" : "2048"}
-              type="number"
-            />
-          </FormField>
+          {isEC ? (
+            <FormField label="Curve">
+              <Select
+                selectedOption={{ label: formData.curve || 'P-256', value: formData.curve || 'P-256' }}
+                onChange={({ detail }) => setFormData({ ...formData, curve: detail.selectedOption.value })}
+                options={curveOptions}
+              />
+            </FormField>
+          ) : (
+            <FormField 
+              label="Key Size" 
+              constraintText={isAES ? "Required for AES keys (bytes)" : "Optional for RSA keys (bits)"}
+            >
+              <Input
+                value={formData.key_size?.toString() || ''}
+                onChange={({ detail }) => setFormData({ ...formData, key_size: parseInt(detail.value) || null })}
+                placeholder={isAES ? "32 (256-bit)" : "2048"}
+                type="number"
+              />
+            </FormField>
+          )}
         </SpaceBetween>
       </form>
     </Modal>
@@ -37,7 +37,7 @@ const KeyDetailCard = ({ keyDetail, loading }) => {
           </div>
           <div>
             <Box variant="awsui-key-label">Type</Box>
-            <div>{keyDetail.key_type}</div>
+            <div>{keyDetail.key_type}{keyDetail.curve ? ` (${keyDetail.curve})` : ''}</div>
           </div>
           <div>
             <Box variant="awsui-key-label">Key ID</Box>
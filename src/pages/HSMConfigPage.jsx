@@ -62,7 +62,7 @@ const HSMConfigPage = () => {
         setAlert({ type: 'error', content: result.message });
       }
     } catch (error) {
-      setAlert({ type: 'error', content: 'Failed to configure HSM' });
+      setAlert({ type: 'error', content: error.message });
     } finally {
       setLoading(false);
     }
@@ -76,7 +76,7 @@ const HSMConfigPage = () => {
         </Header>
         
         <Box>
-          <p>Configure your CloudHSM connection by providing the HSM IP address and customer CA certificate.</p>
+          <p>Configure your CloudHSM connection by providing the HSM IP addresses and customer CA certificate.</p>
         </Box>
 
         {alert && (
@@ -109,13 +109,13 @@ const HSMConfigPage = () => {
         >
           <SpaceBetween direction="vertical" size="l">
             <FormField
-              label="HSM IP Address"
-              description="Enter the IP address of your CloudHSM cluster"
+              label="HSM IP Addresses"
+              description="Enter the IP address of each HSM in your CloudHSM cluster, separated by commas"
             >
               <Input
                 value={ipAddress}
                 onChange={({ detail }) => setIpAddress(detail.value)}
-                placeholder="10.0.0.100"
+                placeholder="10.0.0.100, 10.0.1.100"
                 disabled={loading}
               />
             </FormField>
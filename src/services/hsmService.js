@@ -19,7 +19,8 @@ export const configureHSM = async (ipAddress, certificateFile) => {
   });
 
   if (!response.ok) {
-    throw new Error('Failed to configure HSM');
+    const error = await response.json().catch(() => ({}));
+    throw new Error(error.detail || 'Failed to configure HSM');
   }
   
   return response.json();